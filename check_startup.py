@@ -0,0 +1,77 @@
+"""Fail when menu or provider startup gets slower than its budget.
+
+Imports each module in a fresh interpreter with ``-X importtime`` and checks
+the cumulative import time and that no heavy dependency is loaded before a
+backend actually needs it. Run it with ``python check_startup.py``.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Module, directory it is imported from, budget in milliseconds
+TARGETS = [
+    ("main", ROOT, 30),
+    ("odido", os.path.join(ROOT, "nl_NL"), 60),
+]
+
+# Dependencies that must only be imported once a backend uses them
+HEAVY_MODULES = ["selenium", "requests", "urllib3", "webdriver_manager"]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(module, path):
+    """Return the cumulative import time in microseconds and the set of imported modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=path, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    cumulative = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name.split(".")[0])
+        if name == module and len(match.group(3)) == 1:
+            cumulative = int(match.group(2))
+    return cumulative, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check startup import time against a budget")
+    parser.add_argument("--runs", type=int, default=5, help="Take the fastest of this many runs")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, e.g. on slow CI")
+    args = parser.parse_args()
+
+    failed = False
+    for module, path, budget in TARGETS:
+        timings = []
+        for _ in range(args.runs):
+            cumulative, imported = measure(module, path)
+            timings.append(cumulative)
+        best = min(timings) / 1000
+        limit = budget * args.scale
+        heavy = sorted(name for name in HEAVY_MODULES if name in imported)
+
+        status = "OK"
+        if best > limit:
+            status = "OVER BUDGET"
+            failed = True
+        if heavy:
+            status = f"IMPORTS {', '.join(heavy)}"
+            failed = True
+        print(f"{module:<8} {best:7.1f} ms  (budget {limit:.0f} ms)  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
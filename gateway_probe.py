@@ -0,0 +1,183 @@
+"""Find the modem on the network and work out which provider script handles it.
+
+All candidate addresses (the default gateway plus the usual home router
+addresses) are fetched at the same time with plain asyncio streams, and the
+login page is matched against the fingerprints each provider registers. A
+match is cached by gateway address and MAC, so the next start can skip the
+probe entirely as long as the same device answers on the same address.
+"""
+import asyncio
+import re
+import ssl
+import time
+from urllib.parse import urlsplit
+
+import netinfo
+from settings_store import state_path, read_json, write_json
+
+PROBE_CACHE_FILE = state_path("gateways.json")
+
+COMMON_GATEWAYS = ["192.168.1.1", "192.168.0.1", "192.168.2.254", "192.168.178.1", "10.0.0.1", "10.0.0.138"]
+
+PROBE_TIMEOUT = 2.0
+MAX_BODY = 256 * 1024
+
+
+async def _read_until_eof(reader):
+    chunks = []
+    size = 0
+    while size < MAX_BODY:
+        chunk = await reader.read(MAX_BODY - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+
+async def _fetch(url, timeout):
+    """GET a URL and return (status, headers, body) with at most MAX_BODY bytes read."""
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    context = None
+    if secure:
+        # Modems use self-signed certificates
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    port = parts.port or (443 if secure else 80)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=context), timeout
+    )
+    try:
+        request = (f"GET {parts.path or '/'} HTTP/1.0\r\nHost: {parts.netloc}\r\n"
+                   "User-Agent: ISPF\r\nConnection: close\r\n\r\n")
+        writer.write(request.encode())
+        await writer.drain()
+        raw = await asyncio.wait_for(_read_until_eof(reader), timeout)
+    finally:
+        writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1]) if len(lines[0].split()) > 1 else 0
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    return status, headers, body.decode("utf-8", "replace")
+
+
+async def _fetch_login_page(address, timeout):
+    """Fetch the login page of an address, following one redirect (usually to https)."""
+    url = f"http://{address}/login"
+    status, headers, body = await _fetch(url, timeout)
+    if 300 <= status < 400 and headers.get("location"):
+        location = headers["location"]
+        if location.startswith("/"):
+            location = f"http://{address}{location}"
+        status, headers, body = await _fetch(location, timeout)
+    return headers, body
+
+
+def match_fingerprint(headers, body, providers):
+    """Return (provider, model) for the first provider whose fingerprints all match."""
+    text = "\n".join(f"{key}: {value}" for key, value in headers.items()) + "\n" + body
+    for provider in providers:
+        fingerprint = provider.get("fingerprint", {})
+        patterns = fingerprint.get("patterns", [])
+        if patterns and all(re.search(pattern, text, re.IGNORECASE | re.DOTALL) for pattern in patterns):
+            model = None
+            if fingerprint.get("model"):
+                match = re.search(fingerprint["model"], text, re.IGNORECASE | re.DOTALL)
+                model = match.group(1).strip() if match else None
+            return provider, model
+    return None, None
+
+
+async def _probe_address(address, providers, timeout):
+    try:
+        headers, body = await _fetch_login_page(address, timeout)
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        return None
+    provider, model = match_fingerprint(headers, body, providers)
+    if provider is None:
+        return None
+    return {"address": address, "provider": provider["name"], "model": model}
+
+
+async def _probe_first(addresses, providers, timeout):
+    """Probe all addresses at once; return the match of the earliest candidate.
+
+    A match is returned as soon as every candidate before it has answered, so
+    a modem on the default gateway ends the probe at once. The probes still
+    running are cancelled.
+    """
+    tasks = [asyncio.ensure_future(_probe_address(address, providers, timeout)) for address in addresses]
+    try:
+        pending = set(tasks)
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if not task.done():
+                    break
+                if task.result():
+                    return task.result()
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def candidate_addresses():
+    """The default gateway first, then the common router addresses."""
+    addresses = []
+    for address in [netinfo.get_default_gateway()] + COMMON_GATEWAYS:
+        if address and address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def _read_cache():
+    return read_json(PROBE_CACHE_FILE, {})
+
+
+def _write_cache(cache):
+    write_json(PROBE_CACHE_FILE, cache)
+
+
+def _cache_key(address):
+    # Without a MAC we cannot tell a swapped modem apart, so nothing is cached
+    mac = netinfo.get_mac_address(address)
+    return f"{address}|{mac}" if mac else None
+
+
+def cached_detection(address):
+    """Return the cached detection for the device currently answering on ``address``."""
+    key = _cache_key(address)
+    return _read_cache().get(key) if key else None
+
+
+def detect_gateway(providers, addresses=None, timeout=PROBE_TIMEOUT, use_cache=True):
+    """Return the detection ({address, provider, model}) for the first supported modem, or None.
+
+    ``providers`` is a list of provider entries with a ``fingerprint`` of
+    regular expressions to match against the login page.
+    """
+    addresses = addresses or candidate_addresses()
+    if use_cache:
+        for address in addresses:
+            detection = cached_detection(address)
+            if detection:
+                return detection
+
+    # Prefers the earliest candidate, i.e. the default gateway
+    detection = asyncio.run(_probe_first(addresses, providers, timeout))
+    if detection is None:
+        return None
+    key = _cache_key(detection["address"])
+    if key:
+        cache = _read_cache()
+        cache[key] = {**detection, "seen": time.time()}
+        _write_cache(cache)
+    return detection
@@ -1,28 +1,115 @@
 import os
+import sys
 import subprocess
-import json
+import importlib.util
+from render import render_gradient, clear_screen, terminal_width
+from settings_store import load_settings, save_settings, SettingsError
 
-SETTINGS_FILE = "settings.json"
+# Provider modules that have already been imported, keyed by script path
+loaded_providers = {}
 
-def run_provider_script(provider_script):
+PROVIDERS = {
+    "Netherlands": {
+        "1": [("Odido", "Tele2")],
+    },
+    "Another Country": {
+        "1": ["test"]
+    }
+}
+
+BASE_PATHS = {
+    "Netherlands": "nl_NL",
+    "Another Country": "AnotherCountry"
+}
+
+def run_provider_script(provider_script, gateway=None):
+    """Run a provider in a separate Python process."""
     try:
-        result = subprocess.run(["python", provider_script], shell=True)
+        arguments = ["--gateway", gateway] if gateway else []
+        result = subprocess.run([sys.executable, provider_script] + arguments)
         if result.returncode != 0:
             print(f"Error: Script {provider_script} exited with code {result.returncode}")
     except Exception as e:
         print(f"Failed to run script {provider_script}: {e}")
 
-def interpolate_color(start_color, end_color, factor):
-    """Interpolate between two colors with a factor."""
-    start_rgb = [int(start_color[i:i+2], 16) for i in (1, 3, 5)]
-    end_rgb = [int(end_color[i:i+2], 16) for i in (1, 3, 5)]
-    interpolated_rgb = [
-        int(start_rgb[i] + (end_rgb[i] - start_rgb[i]) * factor) for i in range(3)
-    ]
-    return f"\033[38;2;{interpolated_rgb[0]};{interpolated_rgb[1]};{interpolated_rgb[2]}m"
+def load_provider(provider_script):
+    """Import a provider module on first use and return its PROVIDER entry, if any."""
+    if provider_script not in loaded_providers:
+        provider_dir = os.path.dirname(os.path.abspath(provider_script))
+        # Providers import their helper modules from their own directory
+        if provider_dir not in sys.path:
+            sys.path.insert(0, provider_dir)
+        module_name = os.path.splitext(os.path.basename(provider_script))[0]
+        spec = importlib.util.spec_from_file_location(module_name, provider_script)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        loaded_providers[provider_script] = module
+    return getattr(loaded_providers[provider_script], "PROVIDER", None)
 
-def print_ascii_art_with_gradient():
-    ascii_art = rf"""
+def run_provider(provider_script, settings, gateway=None):
+    """Run a provider in-process, or in a subprocess when isolation is enabled."""
+    if settings.get('isolate_providers'):
+        run_provider_script(provider_script, gateway)
+        return
+    
+    try:
+        provider = load_provider(provider_script)
+    except Exception as e:
+        print(f"Failed to load provider {provider_script}: {e}")
+        return
+    
+    if provider is None:
+        # Providers without an entry object can only run as a script
+        run_provider_script(provider_script, gateway)
+        return
+    
+    try:
+        if gateway:
+            provider["run"](settings, gateway=gateway)
+        else:
+            provider["run"](settings)
+    except KeyboardInterrupt:
+        print("\nProvider interrupted.")
+    except Exception as e:
+        print(f"Provider {provider['name']} failed: {e}")
+
+def provider_scripts():
+    """Yield the script path of every provider in the menus that exists on disk."""
+    for country, country_providers in PROVIDERS.items():
+        for names in country_providers.values():
+            for name in names:
+                primary_name = name[0] if isinstance(name, tuple) else name
+                script_path = os.path.join(BASE_PATHS.get(country, ""), f"{primary_name.lower()}.py")
+                if os.path.isfile(script_path):
+                    yield script_path
+
+def detect_and_run_provider(settings):
+    """Probe the network for a supported modem and run its provider directly."""
+    from gateway_probe import detect_gateway
+    
+    fingerprinted = {}
+    for script_path in provider_scripts():
+        try:
+            provider = load_provider(script_path)
+        except Exception as e:
+            print(f"Failed to load provider {script_path}: {e}")
+            continue
+        if provider and provider.get("fingerprint"):
+            fingerprinted[provider["name"]] = (provider, script_path)
+    
+    print("Looking for a supported modem...")
+    detection = detect_gateway([provider for provider, _ in fingerprinted.values()])
+    if detection is None or detection["provider"] not in fingerprinted:
+        print("No supported modem found. Select your provider from the menu instead.")
+        return False
+    
+    model = f" ({detection['model']})" if detection.get("model") else ""
+    print(f"Found {detection['provider']}{model} at {detection['address']}\n")
+    run_provider(fingerprinted[detection["provider"]][1], settings, detection["address"])
+    return True
+
+ASCII_ART = rf"""
 $$$$$$$\                       $$\     $$$$$$$\  $$\ $$\            $$\     
 $$  __$$\                      $$ |    $$  __$$\ \__|$$ |           $$ |    
 $$ |  $$ | $$$$$$\   $$$$$$\ $$$$$$\   $$ |  $$ |$$\ $$ | $$$$$$\ $$$$$$\   
@@ -36,29 +123,11 @@ $$ |      \$$$$$$  |$$ |       \$$$$  |$$ |      $$ |$$ |\$$$$$$  | \$$$$  |
                              © ISPP 2024 - kanus                                                 
                                         
     """
-    # Gradient colors
-    start_color = "#0000FF"  # Blue
-    end_color = "#800080"    # Purple
-    
-    # Split ASCII art into lines
-    lines = ascii_art.strip().split("\n")
-    max_length = max(len(line) for line in lines)
-
-    for i, line in enumerate(lines):
-        for j in range(len(line)):
-            factor = j / max_length
-            color = interpolate_color(start_color, end_color, factor)
-            print(color + line[j], end='')
-        print("\033[0m")  # Reset color to default
 
-def colorize_text(text, start_color, end_color):
-    """Colorize text with a gradient from start_color to end_color."""
-    colored_text = ''
-    for i, char in enumerate(text):
-        factor = i / (len(text) - 1)
-        color = interpolate_color(start_color, end_color, factor)
-        colored_text += color + char
-    return colored_text + "\033[0m"  # Reset color to default
+def print_ascii_art_with_gradient():
+    """Print the banner with a blue to purple gradient in a single write."""
+    sys.stdout.write(render_gradient(ASCII_ART, "#0000FF", "#800080", terminal_width()))
+    sys.stdout.flush()
 
 def display_country_menu(default_country=None):
     """Display the country selection menu with numeric options only."""
@@ -80,16 +149,7 @@ def display_country_menu(default_country=None):
 
 def display_provider_menu(country, default_provider=None):
     """Display the provider selection menu based on the selected country."""
-    providers = {
-        "Netherlands": {
-            "1": [("Odido", "Tele2")],
-        },
-        "Another Country": {
-            "1": ["test"]
-        }
-    }
-
-    country_providers = providers.get(country, {})
+    country_providers = PROVIDERS.get(country, {})
     print("\nSelect your provider by number or name:\n")
 
     # Generate a unique number for each provider
@@ -113,27 +173,18 @@ def display_provider_menu(country, default_provider=None):
 
 def clear_console():
     """Clear the console screen."""
-    os.system("cls" if os.name == "nt" else "clear")
+    clear_screen()
 
 def normalize_input(user_input):
     """Normalize user input for case-insensitive matching."""
     return user_input.strip().lower()
 
-def load_settings():
-    """Load settings from the settings file."""
-    if os.path.isfile(SETTINGS_FILE):
-        with open(SETTINGS_FILE, "r") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                print("Error loading settings. Using defaults.")
-                return {}
-    return {}
-
-def save_settings(settings):
-    """Save settings to the settings file."""
-    with open(SETTINGS_FILE, "w") as file:
-        json.dump(settings, file, indent=4)
+def store_settings(settings):
+    """Save the settings, reporting a rejected value instead of crashing the menu."""
+    try:
+        save_settings(settings)
+    except SettingsError as e:
+        print(f"Settings were not saved: {e}")
 
 def settings_menu():
     """Display and manage settings."""
@@ -146,6 +197,9 @@ def settings_menu():
         print("1. Change Country Settings")
         print("2. Change Provider Settings")
         print("3. Toggle Discord Webhook")
+        print("4. Toggle Provider Isolation")
+        print("5. Toggle Modem Detection on Startup")
+        print("6. Toggle Device List Screenshot")
         print("[0] - Back to Main Menu\n")
         
         choice = normalize_input(input("Enter your choice: "))
@@ -166,7 +220,7 @@ def settings_menu():
                     country_name, _ = countries[country_choice]
                     settings['default_country'] = country_name
                     print(f"Default country set to: {country_name}")
-                    save_settings(settings)
+                    store_settings(settings)
                     input("Press Enter to continue...")
                     break
                 elif country_choice == "0":
@@ -203,10 +257,14 @@ def settings_menu():
                     if selected_provider:
                         break
                 
+                if isinstance(selected_provider, tuple):
+                    # (name, former name); the setting holds the current name
+                    selected_provider = selected_provider[0]
+                
                 if selected_provider:
                     settings['default_provider'] = selected_provider
                     print(f"Default provider set to: {selected_provider}")
-                    save_settings(settings)
+                    store_settings(settings)
                     input("Press Enter to continue...")
                     break
                 elif choice == "0":
@@ -242,27 +300,50 @@ def settings_menu():
                 else:
                     print("Invalid choice. Please enter 'yes' or 'no'.")
                 
-                save_settings(settings)
+                store_settings(settings)
                 input("Press Enter to continue...")
                 break
 
+        elif choice == "4":
+            # Run providers in their own process instead of in-process
+            settings['isolate_providers'] = not settings.get('isolate_providers', False)
+            state = "enabled" if settings['isolate_providers'] else "disabled"
+            print(f"Provider isolation has been {state}.")
+            store_settings(settings)
+            input("Press Enter to continue...")
+
+        elif choice == "5":
+            # Probe for a supported modem before showing the main menu
+            settings['auto_detect'] = not settings.get('auto_detect', False)
+            state = "enabled" if settings['auto_detect'] else "disabled"
+            print(f"Modem detection on startup has been {state}.")
+            store_settings(settings)
+            input("Press Enter to continue...")
+
+        elif choice == "6":
+            # The webhook always lists the devices as text; the image is an extra
+            settings['device_list_screenshot'] = not settings.get('device_list_screenshot', False)
+            state = "enabled" if settings['device_list_screenshot'] else "disabled"
+            print(f"Device list screenshot has been {state}.")
+            store_settings(settings)
+            input("Press Enter to continue...")
+
         else:
             print("Invalid choice. Please try again.")
-        
-        save_settings(settings)
 
 def main():
     # Load settings at startup
     settings = load_settings()
     
-    base_paths = {
-        "Netherlands": "nl_NL",
-        "Another Country": "AnotherCountry"
-    }
-    
     default_country = settings.get('default_country')
     default_provider = settings.get('default_provider')
 
+    if settings.get('auto_detect'):
+        clear_console()
+        print_ascii_art_with_gradient()
+        if detect_and_run_provider(settings):
+            input("Press Enter to go to the main menu...")
+
     while True:
         clear_console()
         print_ascii_art_with_gradient()
@@ -270,6 +351,7 @@ def main():
         print("Main Menu\n")
         print("1. Select Country and Provider")
         print("2. Settings")
+        print("3. Detect Modem Automatically")
         print("[0] - Exit\n")
         
         choice = normalize_input(input("Enter your choice: "))
@@ -314,7 +396,7 @@ def main():
                     continue
 
                 country_name, _ = country
-                provider_base_path = base_paths.get(country_name)
+                provider_base_path = BASE_PATHS.get(country_name)
 
                 while True:
                     clear_console()
@@ -352,11 +434,17 @@ def main():
                     if selected_script:
                         clear_console()
                         print_ascii_art_with_gradient()
-                        run_provider_script(selected_script)
+                        run_provider(selected_script, settings)
                         input("Press Enter to return to the provider menu...")
                     else:
                         print("Invalid choice or script not found. Please try again.")
         
+        elif choice == "3":
+            clear_console()
+            print_ascii_art_with_gradient()
+            detect_and_run_provider(settings)
+            input("Press Enter to return to the main menu...")
+        
         elif choice == "2":
             settings_menu()
             # Reload settings after changes
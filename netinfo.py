@@ -0,0 +1,204 @@
+"""Default gateway and LAN address discovery without spawning processes.
+
+On Linux the default route is read from /proc/net/route. The local address
+is found by connecting a UDP socket towards the gateway, which makes the
+kernel pick the outgoing interface without sending a packet. Only platforms
+without /proc fall back to parsing ipconfig or netstat. Results are cached
+for a short time so repeated lookups in one run are free.
+"""
+import ipaddress
+import os
+import platform
+import re
+import socket
+import struct
+import subprocess
+import time
+
+CACHE_TTL = 60
+
+RTF_GATEWAY = 0x2
+
+_cache = {}
+
+
+def _cached(key, ttl, lookup):
+    entry = _cache.get(key)
+    now = time.monotonic()
+    if entry and entry[0] > now:
+        return entry[1]
+    value = lookup()
+    if value is not None:
+        _cache[key] = (now + ttl, value)
+    return value
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _proc_default_gateway(path="/proc/net/route"):
+    """Return the gateway of the default route with the lowest metric, or None."""
+    try:
+        with open(path, "r") as file:
+            lines = file.readlines()[1:]
+    except OSError:
+        return None
+    routes = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 8 or fields[1] != "00000000":
+            continue
+        if not int(fields[3], 16) & RTF_GATEWAY:
+            continue
+        gateway = socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+        routes.append((int(fields[6]), gateway))
+    return min(routes)[1] if routes else None
+
+
+def _command_default_gateway():
+    """Parse the default gateway from ipconfig or netstat on platforms without /proc."""
+    if platform.system().lower() == "windows":
+        command, pattern = ["ipconfig"], r"Default Gateway[.\s]*:\s*(\d+\.\d+\.\d+\.\d+)"
+    else:
+        command, pattern = ["netstat", "-rn"], r"(?:default|0\.0\.0\.0)\s+(\d+\.\d+\.\d+\.\d+)"
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(pattern, output)
+    return match.group(1) if match else None
+
+
+def get_default_gateway(ttl=CACHE_TTL):
+    """Return the IPv4 address of the default gateway, or None."""
+    if os.path.exists("/proc/net/route"):
+        return _cached("gateway", ttl, _proc_default_gateway)
+    return _cached("gateway", ttl, _command_default_gateway)
+
+
+def _proc_lan_network(gateway, path="/proc/net/route"):
+    """Return the most specific on-link route that contains ``gateway``, or None."""
+    try:
+        with open(path, "r") as file:
+            lines = file.readlines()[1:]
+    except OSError:
+        return None
+    address = ipaddress.IPv4Address(gateway)
+    networks = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 8 or int(fields[3], 16) & RTF_GATEWAY or fields[7] == "00000000":
+            continue
+        destination = socket.inet_ntoa(struct.pack("<L", int(fields[1], 16)))
+        mask = socket.inet_ntoa(struct.pack("<L", int(fields[7], 16)))
+        network = ipaddress.IPv4Network(f"{destination}/{mask}", strict=False)
+        if address in network:
+            networks.append(network)
+    return max(networks, key=lambda network: network.prefixlen) if networks else None
+
+
+def get_lan_network(gateway, ttl=CACHE_TTL):
+    """Return the IPv4 network of the LAN that ``gateway`` serves.
+
+    Without a route that says otherwise this is the gateway's /24, the LAN
+    size the modems ship with.
+    """
+    def lookup():
+        network = _proc_lan_network(gateway) if os.path.exists("/proc/net/route") else None
+        return network or ipaddress.IPv4Network(f"{gateway}/24", strict=False)
+    return _cached(("network", gateway), ttl, lookup)
+
+
+def _route_source_address(target):
+    # connect() on a UDP socket only selects a route, nothing is sent
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((target, 9))
+            return sock.getsockname()[0]
+        except OSError:
+            return None
+
+
+def get_local_ip(target=None, ttl=CACHE_TTL):
+    """Return this machine's LAN address on the interface that reaches ``target``.
+
+    ``target`` defaults to the default gateway, so the address is the one the
+    modem sees, not a loopback alias such as 127.0.1.1.
+    """
+    target = target or get_default_gateway(ttl)
+    if not target:
+        return None
+    return _cached(("local_ip", target), ttl, lambda: _route_source_address(target))
+
+
+def _proc_mac_address(ip, path="/proc/net/arp"):
+    try:
+        with open(path, "r") as file:
+            lines = file.readlines()[1:]
+    except OSError:
+        return None
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 4 and fields[0] == ip and fields[3] != "00:00:00:00:00:00":
+            return fields[3].lower()
+    return None
+
+
+def _command_mac_address(ip):
+    try:
+        output = subprocess.run(["arp", "-a", ip], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}", output)
+    if not match:
+        return None
+    # Normalize Windows' aa-bb-.. and macOS' unpadded a:b:.. forms
+    return ":".join(part.zfill(2) for part in re.split(r"[:-]", match.group(0))).lower()
+
+
+ATF_COMPLETE = 0x2
+
+
+def _proc_neighbors(path="/proc/net/arp"):
+    try:
+        with open(path, "r") as file:
+            lines = file.readlines()[1:]
+    except OSError:
+        return None
+    neighbors = {}
+    for line in lines:
+        fields = line.split()
+        # Incomplete entries are hosts that did not answer, not current addresses
+        if len(fields) >= 4 and int(fields[2], 16) & ATF_COMPLETE and fields[3] != "00:00:00:00:00:00":
+            neighbors.setdefault(fields[3].lower(), []).append(fields[0])
+    return neighbors
+
+
+def _command_neighbors():
+    try:
+        output = subprocess.run(["arp", "-a"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    neighbors = {}
+    for line in output.splitlines():
+        ip = re.search(r"\d+\.\d+\.\d+\.\d+", line)
+        mac = re.search(r"([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}", line)
+        if ip and mac:
+            mac = ":".join(part.zfill(2) for part in re.split(r"[:-]", mac.group(0))).lower()
+            neighbors.setdefault(mac, []).append(ip.group(0))
+    return neighbors
+
+
+def get_neighbors():
+    """Return the neighbour table as {mac: [ip, ...]}, read fresh on every call."""
+    if os.path.exists("/proc/net/arp"):
+        return _proc_neighbors() or {}
+    return _command_neighbors() or {}
+
+
+def get_mac_address(ip, ttl=CACHE_TTL):
+    """Return the MAC address of a host on the LAN from the neighbour table, or None."""
+    if os.path.exists("/proc/net/arp"):
+        return _cached(("mac", ip), ttl, lambda: _proc_mac_address(ip))
+    return _cached(("mac", ip), ttl, lambda: _command_mac_address(ip))
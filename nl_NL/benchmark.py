@@ -0,0 +1,194 @@
+"""End-to-end benchmark of the Odido flow against the mock modem.
+
+Every run logs in without a cached session, reads the system information,
+adds one port forward and closes the backend, the same steps as an
+interactive run. Each backend runs in its own process so its peak RSS (and
+that of Chrome and chromedriver for the browser backend) can be reported::
+
+    python nl_NL/benchmark.py --runs 20
+    python nl_NL/benchmark.py --backends http --delay 0.02 --failure-rate 0.05 --seed 1 --json bench.json
+
+The mock's delay, failure injection and seed are passed through, so the same
+command gives comparable numbers before and after a change.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from zyxel_mock import MockModem, start_mock_server
+
+STEPS = ("login", "system information", "add rule", "close")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``, or None when there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * fraction))
+    return ordered[rank - 1]
+
+
+def peak_rss():
+    """Peak resident set size in MB of this process and of its finished children."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def run_once(odido, backend_name, gateway, index, fast):
+    """Run login, system information, add rule and close once; return (step timings, error)."""
+    timings = {}
+    started = time.perf_counter()
+    backend = odido.open_backend(gateway, "admin", "admin", backend_name, "http",
+                                 use_session_cache=False, fast=fast)
+    timings["login"] = time.perf_counter() - started
+    if backend is None:
+        return timings, "login failed"
+    try:
+        started = time.perf_counter()
+        if not backend.get_system_information():
+            return timings, "no system information"
+        timings["system information"] = time.perf_counter() - started
+
+        rule = {"name": f"bench-{index}", "start_port": 20000 + index, "end_port": 20000 + index,
+                "ip": "192.168.1.10", "protocol": "TCP", "enabled": True}
+        started = time.perf_counter()
+        if not backend.add_port_forward(rule):
+            return timings, "rule not applied"
+        timings["add rule"] = time.perf_counter() - started
+    finally:
+        started = time.perf_counter()
+        backend.close()
+        timings["close"] = time.perf_counter() - started
+    return timings, None
+
+
+def run_worker(args):
+    """Benchmark one backend in this process and write the results to ``args.result``."""
+    import odido
+
+    runs = []
+    for index in range(args.runs):
+        started = time.perf_counter()
+        try:
+            timings, error = run_once(odido, args.worker, args.gateway, index, args.fast)
+        except Exception as e:
+            timings, error = {}, f"{type(e).__name__}: {e}"
+        runs.append({"total": time.perf_counter() - started, "steps": timings, "error": error})
+        if error and index == 0 and not timings.get("login"):
+            # The backend cannot start at all (e.g. no Chrome), more runs would only repeat that
+            break
+
+    own, children = peak_rss()
+    with open(args.result, "w") as file:
+        json.dump({"backend": args.worker, "runs": runs, "rss_mb": own, "children_rss_mb": children}, file)
+
+
+def summarize(result):
+    """Reduce a worker result to counts, latency percentiles in ms and per-step medians."""
+    completed = [run for run in result["runs"] if not run["error"]]
+    totals = [run["total"] * 1000 for run in completed]
+    errors = sorted({run["error"] for run in result["runs"] if run["error"]})
+    return {
+        "backend": result["backend"],
+        "runs": len(result["runs"]),
+        "ok": len(completed),
+        "p50_ms": percentile(totals, 0.50),
+        "p95_ms": percentile(totals, 0.95),
+        "max_ms": max(totals) if totals else None,
+        "steps_p50_ms": {step: percentile([run["steps"][step] * 1000 for run in completed], 0.50)
+                         for step in STEPS},
+        "rss_mb": result["rss_mb"],
+        "children_rss_mb": result["children_rss_mb"],
+        "errors": errors,
+    }
+
+
+def print_summary(summaries):
+    def number(value, digits=0):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    print()
+    print(f"{'Backend':<9} {'Runs':>5} {'OK':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+          f"{'RSS MB':>7} {'Child MB':>8}")
+    for summary in summaries:
+        print(f"{summary['backend']:<9} {summary['runs']:>5} {summary['ok']:>5} "
+              f"{number(summary['p50_ms']):>8} {number(summary['p95_ms']):>8} {number(summary['max_ms']):>8} "
+              f"{number(summary['rss_mb'], 1):>7} {number(summary['children_rss_mb'], 1):>8}")
+    for summary in summaries:
+        steps = ", ".join(f"{step} {number(value)} ms" for step, value in summary["steps_p50_ms"].items())
+        print(f"  {summary['backend']} median per step: {steps}")
+        for error in summary["errors"]:
+            print(f"  {summary['backend']} error: {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Odido backends against the mock modem")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per backend")
+    parser.add_argument("--backends", nargs="+", choices=["http", "selenium"], default=["http", "selenium"])
+    parser.add_argument("--fast", action="store_true", help="Use the fast browser profile")
+    parser.add_argument("--delay", type=float, default=0.0, help="Mock delay per response, in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of mock requests that fail")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of mock requests dropped")
+    parser.add_argument("--spinner-delay", type=float, default=0.5, help="Dashboard loading time, in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the injected failures")
+    parser.add_argument("--json", metavar="FILE", help="Also write the summaries to a JSON file")
+    # Internal: run one backend in a child process
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--gateway", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    # A fresh mock per backend, so rule tables and injected failures start out the same
+    summaries = []
+    for backend in args.backends:
+        modem = MockModem(delay=args.delay, failure_rate=args.failure_rate, drop_rate=args.drop_rate,
+                          spinner_delay=args.spinner_delay, seed=args.seed)
+        server = start_mock_server(modem=modem)
+        fd, result_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            print(f"Running {args.runs} runs against the mock with the {backend} backend...")
+            command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+                       "--gateway", f"127.0.0.1:{server.server_port}", "--runs", str(args.runs),
+                       "--result", result_path]
+            if args.fast:
+                command.append("--fast")
+            # Runs in a throwaway directory so credentials and settings files are not touched
+            with tempfile.TemporaryDirectory() as workdir:
+                subprocess.run(command, cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+            with open(result_path, "r") as file:
+                summaries.append(summarize(json.load(file)))
+        finally:
+            server.shutdown()
+            os.remove(result_path)
+
+    print_summary(summaries)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summaries, file, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""Long-lived daemon that keeps Chrome sessions warm for provider runs.
+
+Start it once with ``python nl_NL/browser_daemon.py`` and run odido.py with
+``--browser-daemon``. Each run leases a session over a local socket for the
+duration of its job instead of starting ChromeDriver and Chrome itself. The
+lease is held as long as the socket stays open, so a crashed job gives its
+session back automatically.
+"""
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+
+DEFAULT_ADDRESS = ("127.0.0.1", 47711)
+
+
+class BrowserSession:
+    """One Chrome instance owned by the daemon."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.jobs = 0
+        self.key = None
+        self.leased = False
+        self.last_used = time.time()
+
+    def healthy(self):
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """Hand out warm browser sessions and recycle them when they age out."""
+
+    def __init__(self, driver_factory, size=1, idle_timeout=600, max_jobs=25):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_jobs = max_jobs
+        self.sessions = []
+        self.condition = threading.Condition()
+
+    def lease(self, key, timeout=60):
+        """Return a free session, preferring one that was last used for ``key``.
+
+        The session is reserved under the lock; the health check and a Chrome
+        cold start run outside it, so other leases and releases never wait
+        on them.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self.condition:
+                while True:
+                    free = [session for session in self.sessions if not session.leased]
+                    free.sort(key=lambda session: session.key != key)
+                    if free:
+                        session = free[0]
+                    elif len(self.sessions) < self.size:
+                        # Holds the slot while its browser starts
+                        session = BrowserSession(None)
+                        self.sessions.append(session)
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise TimeoutError("No browser session became available")
+                        self.condition.wait(remaining)
+                        continue
+                    session.leased = True
+                    session.key = key
+                    break
+            if session.driver is None:
+                try:
+                    session.driver = self.driver_factory()
+                except BaseException:
+                    self._discard(session)
+                    raise
+                return session
+            if session.healthy():
+                return session
+            self._discard(session)
+
+    def _discard(self, session):
+        with self.condition:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            self.condition.notify()
+        session.quit()
+
+    def release(self, session, healthy=True):
+        with self.condition:
+            session.jobs += 1
+            session.leased = False
+            session.last_used = time.time()
+            # Bound memory growth by starting over with a fresh browser
+            retired = not healthy or session.jobs >= self.max_jobs
+            if retired:
+                self.sessions.remove(session)
+            self.condition.notify()
+        # Quitting Chrome can take seconds, nobody else waits for it
+        if retired:
+            session.quit()
+
+    def reap_idle(self):
+        with self.condition:
+            now = time.time()
+            idle = [session for session in self.sessions
+                    if not session.leased and now - session.last_used > self.idle_timeout]
+            for session in idle:
+                self.sessions.remove(session)
+        for session in idle:
+            session.quit()
+
+    def status(self):
+        with self.condition:
+            return [
+                {"key": session.key, "leased": session.leased, "jobs": session.jobs,
+                 "idle": round(time.time() - session.last_used, 1)}
+                for session in self.sessions
+            ]
+
+    def close(self):
+        with self.condition:
+            for session in self.sessions:
+                session.quit()
+            self.sessions = []
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Serve JSON line commands: lease, release, status and shutdown."""
+
+    def _reply(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+
+    def handle(self):
+        pool = self.server.pool
+        session = None
+        try:
+            for line in self.rfile:
+                request = json.loads(line)
+                command = request.get("cmd")
+                if command == "lease" and session is None:
+                    try:
+                        session = pool.lease(request.get("key"))
+                    except Exception as e:
+                        self._reply({"ok": False, "error": str(e)})
+                        continue
+                    self._reply({
+                        "ok": True,
+                        "executor": session.driver.command_executor._url,
+                        "session_id": session.driver.session_id,
+                        "jobs": session.jobs,
+                    })
+                elif command == "release" and session is not None:
+                    pool.release(session, request.get("healthy", True))
+                    session = None
+                    self._reply({"ok": True})
+                elif command == "status":
+                    self._reply({"ok": True, "sessions": pool.status()})
+                elif command == "shutdown":
+                    self._reply({"ok": True})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    break
+                else:
+                    self._reply({"ok": False, "error": f"Unexpected command {command!r}"})
+        finally:
+            # A client that went away without releasing gives its session back
+            if session is not None:
+                pool.release(session, healthy=session.healthy())
+
+
+class BrowserDaemon(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, pool):
+        super().__init__(address, DaemonHandler)
+        self.pool = pool
+
+
+class BrowserLease:
+    """Client side of a lease; ``driver`` controls the daemon's Chrome session."""
+
+    def __init__(self, key, address=DEFAULT_ADDRESS, timeout=60):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.file = self.sock.makefile("rw")
+        reply = self._call({"cmd": "lease", "key": key})
+        if not reply.get("ok"):
+            self.file.close()
+            self.sock.close()
+            raise RuntimeError(reply.get("error", "lease refused"))
+        self.driver = attach_driver(reply["executor"], reply["session_id"])
+        self.reused = reply["jobs"] > 0
+
+    def _call(self, message):
+        self.file.write(json.dumps(message) + "\n")
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def release(self, healthy=True):
+        if self.sock is None:
+            return
+        try:
+            self._call({"cmd": "release", "healthy": healthy})
+        finally:
+            self.file.close()
+            self.sock.close()
+            self.sock = None
+
+
+def attach_driver(executor_url, session_id):
+    """Create a WebDriver that drives an existing session instead of starting one."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    class AttachedDriver(webdriver.Remote):
+        def start_session(self, capabilities, browser_profile=None):
+            self.session_id = session_id
+            self.caps = capabilities
+
+        def quit(self):
+            # The session belongs to the daemon, leave it running
+            pass
+
+    return AttachedDriver(command_executor=executor_url, options=Options())
+
+
+def daemon_available(address=DEFAULT_ADDRESS):
+    try:
+        with socket.create_connection(address, timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def send_command(command, address=DEFAULT_ADDRESS):
+    with socket.create_connection(address, timeout=5) as sock, sock.makefile("rw") as file:
+        file.write(json.dumps({"cmd": command}) + "\n")
+        file.flush()
+        return json.loads(file.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep Chrome sessions warm for provider runs")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--sessions", type=int, default=1, help="Maximum number of browsers")
+    parser.add_argument("--idle-timeout", type=int, default=600,
+                        help="Seconds before an unused browser is closed")
+    parser.add_argument("--max-jobs", type=int, default=25,
+                        help="Restart a browser after this many jobs")
+    parser.add_argument("--fast", action="store_true",
+                        help="Run Chrome headless and skip images, fonts and analytics")
+    parser.add_argument("command", nargs="?", choices=["status", "shutdown"],
+                        help="Send a command to a running daemon instead of starting one")
+    args = parser.parse_args()
+    address = (args.host, args.port)
+
+    if args.command:
+        print(json.dumps(send_command(args.command, address), indent=4))
+        return
+
+    from odido import setup_webdriver, log
+
+    pool = BrowserPool(lambda: setup_webdriver(args.fast), args.sessions, args.idle_timeout, args.max_jobs)
+    server = BrowserDaemon(address, pool)
+
+    def reaper():
+        while True:
+            time.sleep(min(30, args.idle_timeout))
+            pool.reap_idle()
+
+    threading.Thread(target=reaper, daemon=True).start()
+    log(f"Browser daemon listening on {args.host}:{args.port}", "+")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        log("Browser daemon stopped", "+")
+
+
+if __name__ == "__main__":
+    main()
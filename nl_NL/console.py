@@ -0,0 +1,21 @@
+"""Coloured status lines shared by odido.py and its helper modules.
+
+Helpers import ``log`` from here rather than from odido, so they do not
+pull in the provider module or depend on it being imported first.
+"""
+import threading
+
+STATUS_SYMBOLS = {
+    "!": "\033[93m[!]\033[0m",  # Yellow
+    "+": "\033[92m[+]\033[0m",  # Green
+    "-": "\033[91m[-]\033[0m",  # Red
+    "✓": "\033[92m[✓]\033[0m"  # Green checkmark
+}
+
+# Per-thread log prefix, set to the device name while a fleet job runs
+log_context = threading.local()
+
+
+def log(message, status="!"):
+    prefix = getattr(log_context, "prefix", "")
+    print(f"{STATUS_SYMBOLS.get(status, '[!]')} {prefix}{message}")
@@ -0,0 +1,106 @@
+"""Connected devices as records, for the webhook and for diffing between runs.
+
+Both backends return devices as dicts with ``name``, ``ip``, ``mac``,
+``interface`` and ``status``. The last list seen per gateway is kept in
+``~/.ispf/devices.json`` so the next run can report who joined and who left.
+"""
+import time
+
+from settings_store import state_path, read_json, write_json
+
+DEVICE_HISTORY_FILE = state_path("devices.json")
+
+DEVICE_FIELDS = ("name", "ip", "mac", "interface", "status")
+
+# What the backends and the Dutch web UI report, mapped to "active" or "inactive"
+STATUS_NAMES = {
+    "active": "active", "actief": "active", "online": "active", "connected": "active",
+    "verbonden": "active", "1": "active", "true": "active",
+    "inactive": "inactive", "inactief": "inactive", "offline": "inactive", "disconnected": "inactive",
+    "niet verbonden": "inactive", "0": "inactive", "false": "inactive",
+}
+
+# Discord embed limits
+MAX_DESCRIPTION = 4096
+MAX_FIELD_VALUE = 1024
+
+
+def normalize_status(status):
+    """Return "active" or "inactive" for a known status, else the status as it was given."""
+    status = str(status if status is not None else "").strip()
+    return STATUS_NAMES.get(status.lower(), status)
+
+
+def normalize_device(device):
+    """Return a device record with every field present as a trimmed string."""
+    record = {field: str(device.get(field) or "").strip() for field in DEVICE_FIELDS}
+    record["mac"] = record["mac"].lower()
+    record["status"] = normalize_status(device.get("status"))
+    return record
+
+
+def device_key(device):
+    # The MAC survives DHCP changes, the IP is the fallback for rows without one
+    return device["mac"] or device["ip"]
+
+
+def load_previous_devices(gateway):
+    """Return the devices stored for a gateway by the previous run, or None."""
+    entry = read_json(DEVICE_HISTORY_FILE, {}).get(gateway)
+    # Lists saved by older runs may still hold the status as the web UI showed it
+    return [normalize_device(device) for device in entry["devices"]] if entry else None
+
+
+def save_devices(gateway, devices):
+    """Store the device list of a gateway for the next run."""
+    history = read_json(DEVICE_HISTORY_FILE, {})
+    history[gateway] = {"saved_at": time.time(), "devices": devices}
+    write_json(DEVICE_HISTORY_FILE, history)
+
+
+def diff_devices(previous, current):
+    """Return ``{"joined": [...], "left": [...], "changed": [...]}`` between two device lists."""
+    before = {device_key(device): device for device in previous or []}
+    after = {device_key(device): device for device in current}
+    return {
+        "joined": [device for key, device in after.items() if key not in before],
+        "left": [device for key, device in before.items() if key not in after],
+        "changed": [device for key, device in after.items()
+                    if key in before and (device["ip"], device["status"]) != (before[key]["ip"], before[key]["status"])],
+    }
+
+
+def describe_device(device):
+    name = device["name"] or "(unknown)"
+    details = ", ".join(value for value in (device["interface"], device["mac"]) if value)
+    return f"`{device['ip'] or '-'}` {name}" + (f" ({details})" if details else "")
+
+
+def _truncate(lines, limit):
+    text = ""
+    for position, line in enumerate(lines):
+        if len(text) + len(line) + 1 > limit - 20:
+            return text + f"... and {len(lines) - position} more"
+        text += line + "\n"
+    return text.rstrip("\n")
+
+
+def build_device_embed(devices, changes=None):
+    """Build a Discord embed listing the devices, with the changes since the last run as fields."""
+    active = [device for device in devices if device["status"] != "inactive"]
+    embed = {
+        "title": f"Connected Devices ({len(active)}/{len(devices)} active)",
+        "description": _truncate([describe_device(device) for device in active], MAX_DESCRIPTION) or "No devices",
+        "color": 0xe83e8c,
+    }
+    fields = []
+    for label, key in (("Joined", "joined"), ("Left", "left"), ("Changed", "changed")):
+        if changes and changes[key]:
+            fields.append({
+                "name": f"{label} ({len(changes[key])})",
+                "value": _truncate([describe_device(device) for device in changes[key]], MAX_FIELD_VALUE),
+                "inline": False,
+            })
+    if fields:
+        embed["fields"] = fields
+    return embed
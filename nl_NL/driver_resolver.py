@@ -0,0 +1,113 @@
+"""Find a ChromeDriver that matches the installed Chrome without going online.
+
+The resolved driver path is cached together with a fingerprint of the Chrome
+binary (path, size and modification time). As long as Chrome is not updated
+the cached path is returned straight away. Only when no matching driver can
+be found locally is webdriver_manager asked to download one.
+"""
+import glob
+import os
+import platform
+import re
+import shutil
+import subprocess
+
+from settings_store import state_path, read_json, write_json
+
+DRIVER_CACHE_FILE = state_path("chromedriver.json")
+WDM_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".wdm", "drivers", "chromedriver")
+
+CHROME_CANDIDATES = {
+    "windows": [
+        os.path.join(os.environ.get("PROGRAMFILES", r"C:\Program Files"), r"Google\Chrome\Application\chrome.exe"),
+        os.path.join(os.environ.get("PROGRAMFILES(X86)", r"C:\Program Files (x86)"), r"Google\Chrome\Application\chrome.exe"),
+        os.path.join(os.environ.get("LOCALAPPDATA", ""), r"Google\Chrome\Application\chrome.exe"),
+    ],
+    "darwin": [
+        "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+        "/Applications/Chromium.app/Contents/MacOS/Chromium",
+    ],
+    "linux": ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"],
+}
+
+
+def find_chrome_binary():
+    """Return the path of the installed Chrome, or None."""
+    for candidate in CHROME_CANDIDATES.get(platform.system().lower(), []):
+        path = candidate if os.path.isabs(candidate) else shutil.which(candidate)
+        if path and os.path.isfile(path):
+            return os.path.realpath(path)
+    return None
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def chrome_version(path):
+    """Return the full version of the Chrome binary, e.g. '126.0.6478.126'."""
+    if platform.system().lower() == "windows":
+        # chrome.exe --version does not print anything on Windows, the version
+        # is the name of the directory next to the executable
+        for entry in os.listdir(os.path.dirname(path)):
+            if re.fullmatch(r"\d+\.\d+\.\d+\.\d+", entry):
+                return entry
+        return None
+    try:
+        output = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"(\d+\.\d+\.\d+\.\d+)", output)
+    return match.group(1) if match else None
+
+
+def find_local_driver(version):
+    """Look for a driver with the same major version in webdriver_manager's cache."""
+    if not version:
+        return None
+    name = "chromedriver.exe" if platform.system().lower() == "windows" else "chromedriver"
+    major = version.split(".")[0]
+    for path in sorted(glob.glob(os.path.join(WDM_CACHE_DIR, "*", f"{major}.*", "**", name), recursive=True),
+                       reverse=True):
+        if os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _read_cache():
+    return read_json(DRIVER_CACHE_FILE, {})
+
+
+def _write_cache(cache):
+    write_json(DRIVER_CACHE_FILE, cache)
+
+
+def resolve_chromedriver(pinned_path=None):
+    """Return the path of a ChromeDriver to use.
+
+    A pinned path always wins, so air-gapped machines never touch the
+    network. Otherwise the cached path is reused while the Chrome binary is
+    unchanged, and a new one is looked up locally before downloading.
+    """
+    if pinned_path:
+        if not os.path.isfile(pinned_path):
+            raise FileNotFoundError(f"Pinned ChromeDriver not found: {pinned_path}")
+        return pinned_path
+
+    chrome = find_chrome_binary()
+    chrome_fingerprint = fingerprint(chrome) if chrome else None
+    cache = _read_cache()
+    if (chrome_fingerprint and cache.get("fingerprint") == chrome_fingerprint
+            and os.path.isfile(cache.get("driver_path", ""))):
+        return cache["driver_path"]
+
+    version = chrome_version(chrome) if chrome else None
+    driver_path = find_local_driver(version)
+    if driver_path is None:
+        from webdriver_manager.chrome import ChromeDriverManager
+        driver_path = ChromeDriverManager().install()
+
+    if chrome_fingerprint:
+        _write_cache({"fingerprint": chrome_fingerprint, "chrome_version": version, "driver_path": driver_path})
+    return driver_path
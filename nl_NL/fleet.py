@@ -0,0 +1,179 @@
+"""Apply port forward rules to many Odido modems at once.
+
+The inventory is a JSON or YAML file::
+
+    defaults:
+      username: admin
+      password: secret
+      backend: auto
+      timeout: 120
+    devices:
+      - name: site-a
+        gateway: 10.1.0.1
+        rules: rules-site-a.yaml
+      - name: site-b
+        gateway: 10.2.0.1
+        password: other
+        rules:
+          - {name: web, start_port: 80, ip: 10.2.0.10, protocol: TCP}
+
+``rules`` is either a list of rules or the path of a rules file, relative to
+the inventory. Devices run on a bounded thread pool; the HTTP backend needs
+nothing else, browser fallbacks share a smaller pool of Chrome slots.
+
+A device's ``timeout`` bounds the wait for a Chrome slot and every browser
+wait, and rules still pending when it passes are skipped. A single HTTP
+request or page load in flight can still run for its own timeout.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from port_rules import RuleError, check_rules, load_rules, normalize_rule, read_data_file
+import odido
+from odido import log
+from tracing import span
+
+DEVICE_DEFAULTS = {"backend": "auto", "scheme": "https", "timeout": 120}
+
+
+def load_inventory(path):
+    """Load the devices from an inventory file, with defaults and rules resolved."""
+    data = read_data_file(path)
+    if not isinstance(data, dict) or not isinstance(data.get("devices"), list):
+        raise RuleError(f"{path} does not contain a list of devices")
+
+    defaults = {**DEVICE_DEFAULTS, **data.get("defaults", {})}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    devices = []
+    for entry in data["devices"]:
+        device = {**defaults, **entry}
+        if "gateway" not in device:
+            raise RuleError(f"Device {device.get('name', '?')!r} is missing 'gateway'")
+        device.setdefault("name", device["gateway"])
+
+        rules = device.get("rules", [])
+        if isinstance(rules, str):
+            rules = load_rules(os.path.join(base_dir, rules))
+        else:
+            rules = [normalize_rule(rule) for rule in rules]
+        # The LAN of a remote modem is not known here, so only the batch itself is checked
+        problems = check_rules(rules)
+        if problems:
+            raise RuleError(f"Device {device['name']!r}: {'; '.join(problems)}")
+        device["rules"] = rules
+        devices.append(device)
+    return devices
+
+
+def run_device(device, browser_slots, use_session_cache=True):
+    """Log in to one modem, apply its rules and return a result row."""
+    with span(f"device {device['name']}", gateway=device["gateway"]) as current:
+        result = run_device_job(device, browser_slots, use_session_cache)
+        current.set(outcome=result["status"])
+        return result
+
+
+def run_device_job(device, browser_slots, use_session_cache):
+    odido.log_context.prefix = f"[{device['name']}] "
+    started = time.monotonic()
+    deadline = started + device["timeout"]
+    result = {
+        "name": device["name"],
+        "gateway": device["gateway"],
+        "backend": "-",
+        "applied": 0,
+        "total": len(device["rules"]),
+        "status": "failed",
+        "error": "",
+    }
+
+    backend = None
+    try:
+        if not device.get("username") or not device.get("password"):
+            result["error"] = "no credentials in inventory"
+            return result
+
+        with span("open backend"):
+            backend = odido.open_backend(
+                device["gateway"], device["username"], device["password"], device["backend"],
+                device["scheme"], use_session_cache, browser_slots=browser_slots,
+                timeout=min(10, device["timeout"]), deadline=deadline
+            )
+        if backend is None:
+            if time.monotonic() > deadline:
+                result["status"] = "timeout"
+                result["error"] = "login did not finish before the deadline"
+            else:
+                result["error"] = "login failed"
+            return result
+        result["backend"] = backend.name
+
+        # Running the same inventory twice must not add every rule a second time
+        conflicts = odido.find_conflicts_on_modem(backend, device["rules"])
+        if conflicts:
+            for conflict in conflicts:
+                log(conflict, "-")
+            result["error"] = f"{len(conflicts)} conflict{'s' if len(conflicts) != 1 else ''} with the modem's rules"
+            return result
+
+        with span("apply rules", rules=len(device["rules"])):
+            outcomes = odido.apply_rules(backend, device["rules"], deadline)
+        result["applied"] = sum(1 for _, ok, _ in outcomes if ok)
+        errors = [error for _, ok, error in outcomes if not ok]
+        if any(error == "timed out" for error in errors):
+            result["status"] = "timeout"
+        elif not errors:
+            result["status"] = "ok"
+        result["error"] = "; ".join(sorted(set(errors)))
+    except TimeoutError as e:
+        result["status"] = "timeout"
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if backend is not None:
+            backend.close()
+        result["seconds"] = time.monotonic() - started
+        odido.log_context.prefix = ""
+    return result
+
+
+def run_fleet(devices, workers=8, browser_sessions=2, use_session_cache=True):
+    """Run every device on a bounded pool and return the results in inventory order."""
+    browser_slots = threading.Semaphore(browser_sessions)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(run_device, device, browser_slots, use_session_cache) for device in devices]
+        return [future.result() for future in futures]
+
+
+def print_fleet_report(results):
+    """Print one row per device and a total line."""
+    print()
+    print(f"    {'Device':<20} {'Gateway':<16} {'Backend':<9} {'Rules':<7} {'Time':>7}  Status")
+    for result in results:
+        rules = f"{result['applied']}/{result['total']}"
+        line = (f"{result['name']:<20} {result['gateway']:<16} {result['backend']:<9} {rules:<7} "
+                f"{result['seconds']:6.1f}s  {result['status']}")
+        if result["error"]:
+            line += f" ({result['error']})"
+        log(line, "✓" if result["status"] == "ok" else "-")
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    log(f"{succeeded}/{len(results)} devices completed", "+" if succeeded == len(results) else "-")
+
+
+def run_fleet_from_args(args):
+    """Entry point for ``odido.py --fleet``."""
+    try:
+        devices = load_inventory(args.fleet)
+    except (OSError, ValueError) as e:
+        log(f"Could not load inventory {args.fleet}: {e}", "-")
+        return None
+    log(f"Loaded {len(devices)} devices from {args.fleet}", "+")
+
+    started = time.monotonic()
+    results = run_fleet(devices, args.workers, args.browser_sessions, args.session_cache)
+    print_fleet_report(results)
+    log(f"Fleet run took {time.monotonic() - started:.1f}s", "+")
+    return results
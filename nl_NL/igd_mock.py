@@ -0,0 +1,276 @@
+"""Local stand-in for the modem's UPnP IGD and PCP/NAT-PMP services.
+
+Run it with ``python nl_NL/igd_mock.py`` and point odido.py at 127.0.0.1
+(``--gateway 127.0.0.1:8080 --backend portmap`` together with zyxel_mock.py).
+SSDP answers on UDP 1900, PCP/NAT-PMP on UDP 5351 and the IGD description
+and control URL on an HTTP port of its own. ``--no-upnp``, ``--no-pcp`` and
+``--no-natpmp`` switch services off to exercise the fallbacks.
+"""
+import argparse
+import socket
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+SERVICE_TYPE = "urn:schemas-upnp-org:service:WANIPConnection:1"
+
+DESCRIPTION = """<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0">
+  <device>
+    <deviceType>urn:schemas-upnp-org:device:InternetGatewayDevice:1</deviceType>
+    <friendlyName>EX5601-T0 (mock)</friendlyName>
+    <deviceList><device>
+      <deviceType>urn:schemas-upnp-org:device:WANDevice:1</deviceType>
+      <deviceList><device>
+        <deviceType>urn:schemas-upnp-org:device:WANConnectionDevice:1</deviceType>
+        <serviceList><service>
+          <serviceType>{service_type}</serviceType>
+          <serviceId>urn:upnp-org:serviceId:WANIPConn1</serviceId>
+          <controlURL>/ctl/IPConn</controlURL>
+        </service></serviceList>
+      </device></deviceList>
+    </device></deviceList>
+  </device>
+</root>
+"""
+
+
+class MockGateway:
+    """Mapping table shared by the IGD, PCP and NAT-PMP responders."""
+
+    def __init__(self, upnp=True, pcp=True, natpmp=True):
+        self.upnp = upnp
+        self.pcp = pcp
+        self.natpmp = natpmp
+        # (protocol, external port) -> mapping dict
+        self.mappings = {}
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.servers = []
+        self.threads = []
+        self.stopped = threading.Event()
+
+    def receive(self, sock, size):
+        """Wait for the next datagram; None once the gateway is stopped."""
+        while not self.stopped.is_set():
+            try:
+                return sock.recvfrom(size)
+            except socket.timeout:
+                continue
+            except OSError:
+                return None
+        return None
+
+
+class IgdHandler(BaseHTTPRequestHandler):
+    server_version = "IGD-Mock"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/xml"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/rootDesc.xml":
+            return self._send(200, DESCRIPTION.format(service_type=SERVICE_TYPE))
+        self._send(404, "")
+
+    def _fault(self, code, description):
+        self._send(500, '<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+                        '<s:Body><s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring>'
+                        '<detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0">'
+                        f'<errorCode>{code}</errorCode><errorDescription>{description}</errorDescription>'
+                        '</UPnPError></detail></s:Fault></s:Body></s:Envelope>')
+
+    def _respond(self, action, **values):
+        body = "".join(f"<{key}>{escape(str(value))}</{key}>" for key, value in values.items())
+        self._send(200, '<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+                        f'<s:Body><u:{action}Response xmlns:u="{SERVICE_TYPE}">{body}</u:{action}Response>'
+                        '</s:Body></s:Envelope>')
+
+    def do_POST(self):
+        if self.path != "/ctl/IPConn":
+            return self._send(404, "")
+        action = self.headers.get("SOAPAction", "").strip('"').rsplit("#", 1)[-1]
+        body = ElementTree.fromstring(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        arguments = {}
+        for element in body.iter():
+            if element.tag.rsplit("}", 1)[-1] == action:
+                arguments = {child.tag: (child.text or "") for child in element}
+        gateway = self.server.gateway
+
+        with gateway.lock:
+            if action == "AddPortMapping":
+                key = (arguments["NewProtocol"], int(arguments["NewExternalPort"]))
+                existing = gateway.mappings.get(key)
+                if existing and existing["client"] != arguments["NewInternalClient"]:
+                    return self._fault(718, "ConflictInMappingEntry")
+                gateway.mappings[key] = {
+                    "client": arguments["NewInternalClient"], "internal_port": int(arguments["NewInternalPort"]),
+                    "description": arguments.get("NewPortMappingDescription", ""),
+                    "lease": int(arguments.get("NewLeaseDuration") or 0), "via": "upnp",
+                }
+                return self._respond(action)
+            if action == "DeletePortMapping":
+                key = (arguments["NewProtocol"], int(arguments["NewExternalPort"]))
+                if gateway.mappings.pop(key, None) is None:
+                    return self._fault(714, "NoSuchEntryInArray")
+                return self._respond(action)
+            if action == "GetGenericPortMappingEntry":
+                entries = sorted(gateway.mappings.items())
+                index = int(arguments["NewPortMappingIndex"])
+                if index >= len(entries):
+                    return self._fault(713, "SpecifiedArrayIndexInvalid")
+                (protocol, port), mapping = entries[index]
+                return self._respond(action, NewRemoteHost="", NewExternalPort=port, NewProtocol=protocol,
+                                     NewInternalPort=mapping["internal_port"], NewInternalClient=mapping["client"],
+                                     NewEnabled=1, NewPortMappingDescription=mapping["description"],
+                                     NewLeaseDuration=mapping["lease"])
+        self._fault(401, "Invalid Action")
+
+
+def serve_ssdp(gateway, sock, location):
+    while True:
+        received = gateway.receive(sock, 4096)
+        if received is None:
+            return
+        data, address = received
+        if data.startswith(b"M-SEARCH") and b"InternetGatewayDevice" in data:
+            sock.sendto(("HTTP/1.1 200 OK\r\nCACHE-CONTROL: max-age=120\r\n"
+                         "ST: urn:schemas-upnp-org:device:InternetGatewayDevice:1\r\n"
+                         f"LOCATION: {location}\r\nSERVER: Mock UPnP/1.1\r\n\r\n").encode(), address)
+
+
+def handle_pcp(gateway, data, address):
+    """Answer a PCP MAP request, or None when the request is not one."""
+    if len(data) < 60 or data[1] != 1:
+        return None
+    lifetime = struct.unpack("!I", data[4:8])[0]
+    client = socket.inet_ntoa(data[20:24])
+    nonce, protocol_number, internal_port, external_port = struct.unpack("!12sB3xHH", data[24:44])
+    protocol = {6: "TCP", 17: "UDP"}[protocol_number]
+    with gateway.lock:
+        if lifetime == 0:
+            gateway.mappings.pop((protocol, external_port or internal_port), None)
+        else:
+            gateway.mappings[(protocol, external_port)] = {
+                "client": client, "internal_port": internal_port, "description": "pcp",
+                "lease": lifetime, "via": "pcp", "nonce": nonce,
+            }
+    header = struct.pack("!BBBBII12x", 2, 0x80 | 1, 0, 0, lifetime, gateway.epoch)
+    return header + data[24:60]
+
+
+def handle_natpmp(gateway, data, address):
+    """Answer a NAT-PMP request."""
+    opcode = data[1]
+    if opcode == 0:
+        return struct.pack("!BBHI4s", 0, 128, 0, gateway.epoch, socket.inet_aton("203.0.113.1"))
+    _, _, _, internal_port, external_port, lifetime = struct.unpack("!BBHHHI", data[:12])
+    protocol = {1: "UDP", 2: "TCP"}[opcode]
+    with gateway.lock:
+        if lifetime == 0:
+            for key in [key for key, mapping in gateway.mappings.items()
+                        if key[0] == protocol and mapping["internal_port"] == internal_port]:
+                del gateway.mappings[key]
+        else:
+            external_port = external_port or internal_port
+            gateway.mappings[(protocol, external_port)] = {
+                "client": address[0], "internal_port": internal_port, "description": "natpmp",
+                "lease": lifetime, "via": "natpmp",
+            }
+    return struct.pack("!BBHIHHI", 0, 128 + opcode, 0, gateway.epoch, internal_port, external_port, lifetime)
+
+
+def serve_pcp(gateway, sock):
+    while True:
+        received = gateway.receive(sock, 1100)
+        if received is None:
+            return
+        data, address = received
+        if not data:
+            continue
+        if data[0] == 2 and gateway.pcp:
+            reply = handle_pcp(gateway, data, address)
+        elif data[0] == 0 and gateway.natpmp:
+            reply = handle_natpmp(gateway, data, address)
+        elif gateway.natpmp:
+            # NAT-PMP servers answer unknown versions with "unsupported version"
+            reply = struct.pack("!BBHI", 0, 128 + (data[1] & 0x7f), 1, gateway.epoch)
+        else:
+            reply = None
+        if reply:
+            sock.sendto(reply, address)
+
+
+def start_igd_mock(host="127.0.0.1", ssdp_port=1900, natpmp_port=5351, http_port=0, gateway=None):
+    """Start the responders in background threads and return the MockGateway."""
+    gateway = gateway or MockGateway()
+    def start(target, *args):
+        thread = threading.Thread(target=target, args=(gateway,) + args, daemon=True)
+        thread.start()
+        gateway.threads.append(thread)
+
+    def udp_socket(port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        # Lets the serving threads notice stop_igd_mock
+        sock.settimeout(0.2)
+        gateway.servers.append(sock)
+        return sock
+
+    if gateway.upnp:
+        server = ThreadingHTTPServer((host, http_port), IgdHandler)
+        server.gateway = gateway
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        gateway.servers.append(server)
+        start(serve_ssdp, udp_socket(ssdp_port), f"http://{host}:{server.server_port}/rootDesc.xml")
+    if gateway.pcp or gateway.natpmp:
+        start(serve_pcp, udp_socket(natpmp_port))
+    return gateway
+
+
+def stop_igd_mock(gateway):
+    gateway.stopped.set()
+    for thread in gateway.threads:
+        thread.join()
+    for server in gateway.servers:
+        if isinstance(server, socket.socket):
+            server.close()
+        else:
+            server.shutdown()
+            server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock UPnP IGD and PCP/NAT-PMP gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ssdp-port", type=int, default=1900)
+    parser.add_argument("--natpmp-port", type=int, default=5351)
+    parser.add_argument("--no-upnp", dest="upnp", action="store_false")
+    parser.add_argument("--no-pcp", dest="pcp", action="store_false")
+    parser.add_argument("--no-natpmp", dest="natpmp", action="store_false")
+    args = parser.parse_args()
+
+    gateway = start_igd_mock(args.host, args.ssdp_port, args.natpmp_port,
+                             gateway=MockGateway(args.upnp, args.pcp, args.natpmp))
+    services = [name for name, enabled in (("UPnP IGD", args.upnp), ("PCP", args.pcp), ("NAT-PMP", args.natpmp))
+                if enabled]
+    print(f"Mock gateway on {args.host} answering {', '.join(services)}; Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stop_igd_mock(gateway)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Versioned snapshots of the modem's port forward table.
+
+A snapshot file holds the history of one modem's table. The first snapshot
+lists every rule; each later one only records the rules removed and added
+since the one before it, so exporting a table of 50 rules every night costs
+a few bytes per actual change. Every FULL_EVERY snapshots a full copy is
+written again, which bounds how many deltas a restore has to replay. Rules
+are stored as rows ``[name, start_port, end_port, ip, protocol, enabled]``
+and files ending in ``.gz`` are gzip-compressed.
+
+    python nl_NL/odido.py --export nat.json.gz
+    python nl_NL/odido.py --restore nat.json.gz --snapshot 3
+    python nl_NL/nat_snapshot.py nat.json.gz
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone
+
+from port_rules import RuleError, normalize_rule
+
+FORMAT_VERSION = 1
+FIELDS = ("name", "start_port", "end_port", "ip", "protocol", "enabled")
+FULL_EVERY = 50
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is malformed or has no such snapshot."""
+
+
+def rule_row(rule):
+    row = [rule[field] for field in FIELDS]
+    row[1], row[2], row[5] = int(row[1]), int(row[2]), bool(row[5])
+    return tuple(row)
+
+
+def row_rule(row):
+    if not isinstance(row, list) or len(row) != len(FIELDS):
+        raise SnapshotError(f"Malformed rule row {row!r}")
+    try:
+        return normalize_rule(dict(zip(FIELDS, row)))
+    except RuleError as e:
+        raise SnapshotError(str(e)) from None
+
+
+def _open(path, mode, compressed=None):
+    if path.endswith(".gz") if compressed is None else compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_snapshot_file(path):
+    """Return the parsed file, or an empty history when it does not exist yet."""
+    if not os.path.exists(path):
+        return {"format": FORMAT_VERSION, "snapshots": []}
+    try:
+        with _open(path, "r") as file:
+            data = json.load(file)
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"Cannot read {path}: {e}") from None
+    if not isinstance(data, dict) or not isinstance(data.get("snapshots"), list):
+        raise SnapshotError(f"{path} is not a snapshot file")
+    if data.get("format") != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has snapshot format {data.get('format')!r}, expected {FORMAT_VERSION}")
+    return data
+
+
+def write_snapshot_file(path, data):
+    """Write the file through a temporary file, so an interrupted export never corrupts the history."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=".tmp")
+    os.close(fd)
+    try:
+        with _open(temporary_path, "w", compressed=path.endswith(".gz")) as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def snapshot_number(data, number=None):
+    """Resolve a 1-based snapshot number (negative counts from the end, None is the latest) to an index."""
+    count = len(data["snapshots"])
+    if count == 0:
+        raise SnapshotError("The file holds no snapshots")
+    if number is None:
+        return count - 1
+    index = number - 1 if number > 0 else count + number
+    if not 0 <= index < count:
+        raise SnapshotError(f"There is no snapshot {number}, the file holds {count}")
+    return index
+
+
+def replay(data, index):
+    """Return the rule rows of the snapshot at ``index``, applying the deltas since the last full one."""
+    snapshots = data["snapshots"]
+    start = index
+    while "rules" not in snapshots[start]:
+        if start == 0:
+            raise SnapshotError("The first snapshot is not a full one")
+        start -= 1
+    rows = [tuple(row) for row in snapshots[start]["rules"]]
+    for position in range(start + 1, index + 1):
+        snapshot = snapshots[position]
+        removed = Counter(tuple(row) for row in snapshot.get("removed", []))
+        kept = []
+        for row in rows:
+            if removed[row]:
+                removed[row] -= 1
+            else:
+                kept.append(row)
+        if +removed:
+            raise SnapshotError(f"Snapshot {position + 1} removes rules that are not there")
+        rows = kept + [tuple(row) for row in snapshot.get("added", [])]
+    return sorted(rows, key=lambda row: (row[1], row[2], row[4], row[0], row[3]))
+
+
+def add_snapshot(data, rules, gateway=None, taken=None):
+    """Append a snapshot of ``rules`` to ``data``; returns it, or None when nothing changed."""
+    rows = sorted((rule_row(rule) for rule in rules), key=lambda row: (row[1], row[2], row[4], row[0], row[3]))
+    snapshot = {"taken": taken or datetime.now(timezone.utc).isoformat(timespec="seconds"), "gateway": gateway}
+    snapshots = data["snapshots"]
+    if snapshots:
+        previous = Counter(replay(data, len(snapshots) - 1))
+        current = Counter(rows)
+        removed, added = previous - current, current - previous
+        if not removed and not added:
+            return None
+        since_full = next(distance for distance, entry in enumerate(reversed(snapshots)) if "rules" in entry)
+        if since_full + 1 < FULL_EVERY:
+            snapshot["removed"] = [list(row) for row in removed.elements()]
+            snapshot["added"] = [list(row) for row in added.elements()]
+    if "removed" not in snapshot:
+        snapshot["rules"] = [list(row) for row in rows]
+    snapshots.append(snapshot)
+    return snapshot
+
+
+def export_snapshot(path, rules, gateway=None):
+    """Record the table in the snapshot file; returns (snapshot number, snapshot or None when unchanged)."""
+    data = read_snapshot_file(path)
+    snapshot = add_snapshot(data, rules, gateway)
+    if snapshot is not None:
+        write_snapshot_file(path, data)
+    return len(data["snapshots"]), snapshot
+
+
+def load_snapshot(path, number=None):
+    """Return the rules of one snapshot (the latest by default) as normalized rules.
+
+    Identical copies of a rule, left on the modem by earlier runs, are returned once.
+    """
+    data = read_snapshot_file(path)
+    rows = replay(data, snapshot_number(data, number))
+    return [row_rule(list(row)) for row in dict.fromkeys(rows)]
+
+
+def describe_snapshots(data):
+    """One line per snapshot: number, time, rule count and what changed."""
+    lines = []
+    for index, snapshot in enumerate(data["snapshots"]):
+        count = len(replay(data, index))
+        if "rules" in snapshot:
+            change = "full"
+        else:
+            change = f"+{len(snapshot.get('added', []))} -{len(snapshot.get('removed', []))}"
+        lines.append(f"{index + 1:>4}  {snapshot.get('taken', '?'):<25} {count:>4} rules  {change:<10} "
+                     f"{snapshot.get('gateway') or ''}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the snapshots in a NAT snapshot file")
+    parser.add_argument("file")
+    parser.add_argument("--show", type=int, metavar="N", help="Print the rules of snapshot N (-1 is the latest)")
+    args = parser.parse_args(argv)
+    try:
+        data = read_snapshot_file(args.file)
+        if args.show is not None:
+            for row in replay(data, snapshot_number(data, args.show)):
+                rule = dict(zip(FIELDS, row))
+                ports = f"{rule['start_port']}-{rule['end_port']}"
+                print(f"{rule['name']:<24} {ports:<12} {rule['protocol']:<5} {rule['ip']:<16} "
+                      f"{'on' if rule['enabled'] else 'off'}")
+        else:
+            for line in describe_snapshots(data):
+                print(line)
+    except SnapshotError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
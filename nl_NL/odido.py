@@ -1,65 +1,65 @@
+import argparse
 import sys
 import time
-import platform
-import subprocess
-import re
 import os
-import json
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import Select
 import ipaddress
+from urllib.parse import urljoin, urlsplit
+
+# Shared modules (network discovery, rendering) live in the repository root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import netinfo
+from console import log, log_context
+from settings_store import load_settings
+import tracing
+from tracing import span, traced, trace_driver
+from port_rules import RuleError, load_rules, normalize_rule, check_rules, find_conflicts, name_key, port_key
+from device_list import normalize_device, diff_devices, load_previous_devices, save_devices, build_device_embed
+from session_cache import load_session, save_session, forget_session
+from driver_resolver import resolve_chromedriver
+from browser_daemon import BrowserLease, DEFAULT_ADDRESS as BROWSER_DAEMON_ADDRESS
+from wait_policy import wait_policy, StepStalled
 
 CREDENTIALS_FILE = "credentials.txt"
-SETTINGS_FILE = "settings.json"
-
-def log(message, status="!"):
-    status_symbols = {
-        "!": "\033[93m[!]\033[0m",  # Yellow
-        "+": "\033[92m[+]\033[0m",  # Green
-        "-": "\033[91m[-]\033[0m",  # Red
-        "✓": "\033[92m[✓]\033[0m"  # Green checkmark
-    }
-    print(f"{status_symbols.get(status, '[!]')} {message}")
+
+# When run as a script this module is __main__; register it under its own
+# name too so helper modules that import odido share its state
+sys.modules.setdefault("odido", sys.modules[__name__])
+
+def import_selenium():
+    """Import Selenium on first use.
+    
+    Importing it costs more than the rest of the tool together, and runs
+    that only use the HTTP backend never need it. The names are bound as
+    module globals so the browser functions below can use them directly.
+    """
+    global webdriver, Service, Options, By, EC, Keys
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.keys import Keys
 
 def get_default_gateway():
-    os_name = platform.system().lower()
     log("Retrieving IP settings", "!")
+    gateway = netinfo.get_default_gateway()
+    if gateway is None:
+        log("Error: Default gateway not found", "-")
+    return gateway
 
-    if 'windows' in os_name:
-        command = "ipconfig"
-    elif 'linux' in os_name or 'darwin' in os_name:  # darwin is macOS
-        command = "netstat -r"
-    else:
-        raise NotImplementedError("Unsupported operating system")
+# Resources the modem UI does not need to render the login, dashboard and NAT pages
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+]
 
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        output = result.stdout
-        
-        if 'windows' in os_name:
-            log("Command output received", "+")
-            match = re.search(r"Default Gateway[.\s]*:\s*([\d.]+)", output)
-        else:
-            log("Command output received", "+")
-            match = re.search(r"default\s*([\d.]+)", output)
-        
-        if match:
-            return match.group(1)
-        else:
-            raise ValueError("Default gateway not found in command output")
-    except Exception as e:
-        log(f"Error: {e}", "-")
-        return None
-
-def setup_webdriver():
+def setup_webdriver(fast=False):
+    """Start Chrome; the fast profile runs headless and skips non-essential resources."""
+    import_selenium()
     chrome_options = Options()
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--ignore-certificate-errors")
@@ -68,44 +68,89 @@ def setup_webdriver():
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--log-level=1")
     
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    if fast:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+        # Return from driver.get once the DOM is ready, the waits check for the elements we need
+        chrome_options.page_load_strategy = "eager"
+    
+    # Pin "chromedriver_path" in settings.json on machines without internet access
+    with span("resolve chromedriver"):
+        service = Service(resolve_chromedriver(load_settings().get("chromedriver_path")))
+    with span("start chrome"):
+        driver = trace_driver(webdriver.Chrome(service=service, options=chrome_options))
+    
+    if fast:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
     return driver
 
+def report_page_load(driver, label):
+    """Log how long the current page took to load and how much it transferred."""
+    try:
+        timing = driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0];
+            const resources = performance.getEntriesByType('resource');
+            if (!nav) return null;
+            return {
+                dom_ready: nav.domContentLoadedEventEnd,
+                load: nav.loadEventEnd,
+                resources: resources.length,
+                bytes: resources.reduce((sum, r) => sum + (r.transferSize || 0), nav.transferSize || 0)
+            };
+        """)
+    except Exception:
+        return None
+    if timing:
+        load = f"{timing['load']:.0f} ms" if timing['load'] else "not finished"
+        log(f"Page load {label}: DOM ready {timing['dom_ready']:.0f} ms, load {load}, "
+            f"{timing['resources']} resources, {timing['bytes'] / 1024:.0f} KB", "!")
+    return timing
+
+# Error shown by the login form when the credentials are rejected
+LOGIN_ERROR_SCRIPT = """
+const error = document.querySelector('#loginError');
+return error && error.offsetParent !== null ? error.innerText.trim() : null;
+"""
+
+def login_error(driver):
+    """Return the login form's error message if it is showing, else None."""
+    message = driver.execute_script(LOGIN_ERROR_SCRIPT)
+    return f"was rejected: {message}" if message else None
+
+@traced("login page")
 def wait_for_login_page(driver, url):
     log(f"Attempting to navigate to {url}", "!")
+    wait_policy.set_host(urlsplit(url).hostname)
     try:
         driver.get(url)
         
         # Wait for the specific div that indicates the modem info
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "cardpage"))
-        )
+        wait_policy.wait(driver, "login page", EC.presence_of_element_located((By.ID, "cardpage")))
         
-        # Extract and log the modem info
+        # Extract and log the modem info; later waits use the timings learned for this model
         modem_info = driver.find_element(By.CSS_SELECTOR, "#cardpage h3").text
         log(f"Modem Info: {modem_info}", "+")
+        wait_policy.set_model(modem_info)
         
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "username"))
-        )
+        wait_policy.wait(driver, "login form", EC.presence_of_element_located((By.ID, "username")))
         
         log("Login form detected", "+")
+        report_page_load(driver, "login")
         return True
     except Exception as e:
         log(f"Error navigating to the login page: {e}", "-")
         driver.save_screenshot("login_page_error.png")
         return False
 
+@traced("submit login")
 def perform_login(driver, username, password):
     try:
         log("Attempting to locate username and password fields", "!")
-        username_field = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "username"))
-        )
-        password_field = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "userpassword"))
-        )
+        username_field = wait_policy.wait(driver, "login form", EC.presence_of_element_located((By.ID, "username")))
+        password_field = wait_policy.wait(driver, "login form", EC.presence_of_element_located((By.ID, "userpassword")))
         
         log("Filling in credentials", "!")
         username_field.clear()
@@ -113,19 +158,19 @@ def perform_login(driver, username, password):
         
         password_field.clear()
         password_field.send_keys(password)
+        login_url = driver.current_url
         password_field.send_keys(Keys.RETURN)
         
         log("Login attempt submitted", "+")
         
-        WebDriverWait(driver, 30).until(
-            EC.url_changes("https://192.168.1.1/login")
-        )
+        # A rejected login leaves the URL alone, so stop as soon as the error shows
+        wait_policy.wait(driver, "login redirect", EC.url_changes(login_url), fail_when=login_error)
         
         current_url = driver.current_url
-        if current_url == "https://192.168.1.1/":
+        main_page = urljoin(current_url, "/")
+        if current_url == main_page:
             log(f"Login successful, redirected to {current_url}", "+")
             log("Successfully logged in\n", "+")
-            save_credentials(username, password)
             return True
         else:
             log(f"Login failed or redirection issue. Current URL: {current_url}", "-")
@@ -143,7 +188,7 @@ def perform_login(driver, username, password):
                 log(f"Error checking login response: {e}", "-")
             
             if not current_url.endswith("/"):
-                driver.get("https://192.168.1.1/")
+                driver.get(main_page)
                 log("Manually redirected to the main page", "+")
                 
             return False
@@ -168,189 +213,187 @@ def load_credentials():
                 return lines[0].strip(), lines[1].strip()
     return None, None
 
-def load_settings():
-    """Load settings from the settings file."""
-    if os.path.isfile(SETTINGS_FILE):
-        with open(SETTINGS_FILE, "r") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                print("Error loading settings. Using defaults.")
-                return {}
-    return {}
+def build_webhook_payload(data, devices=None, changes=None):
+    """Build the Discord embeds for the system information and, if given, the connected devices."""
+    payload = {
+        "username": f"Zyxel - ({data['model_name']})",
+        # "content": "Here is the system information and device list.",
+        "avatar_url": "https://i0.wp.com/www.appletips.nl/wp-content/uploads/2023/09/odido.png?fit=468%2C468&ssl=1",
+        "embeds": [
+            {
+                "title": "System Information",
+                "description": (
+                    f"**Model Name**: {data['model_name']}\n"
+                    f"**Firmware Version**: {data['firmware_version']}\n"
+                    f"**Uptime**: {data['uptime']}\n"
+                    f"**MAC Address**: {data['mac_address']}\n"
+                    f"**Ethernet WAN**: {data['ethernet_wan']}"
+                ),
+                "color": 0xe83e8c  # Hex color #e83e8c
+            }
+        ]
+    }
+    if devices is not None:
+        payload["embeds"].append(build_device_embed(devices, changes))
+    return payload
 
-def wait_for_system_information(driver):
-    """Wait for the system information to be fully loaded."""
-    log("Waiting for system information to load...", "!")
-    
-    # Define a timeout for waiting
-    timeout = 60
-    
+def post_webhook(webhook_url, payload, screenshot_path=None):
+    """Queue the payload for the webhook, with the screenshot attached if given.
+
+    Delivery happens on a background worker (see webhook_queue.py), so a slow
+    or rate-limited webhook does not hold up the NAT work.
+    """
+    from webhook_queue import get_queue
     try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.ID, "card_sys"))
-        )
-        log("System information loaded", "+")
+        get_queue().enqueue(webhook_url, payload, screenshot_path, "device_list.png")
+        log("Webhook queued for delivery", "+")
     except Exception as e:
-        log(f"Error while waiting for system information: {e}", "-")
-        driver.save_screenshot("system_information_error.png")
-        return False
-    return True
+        log(f"Error queueing webhook data: {e}", "-")
 
-def send_webhook_data(driver):
-    """Extract information from the div and send it via webhook."""
-    settings = load_settings()
+def flush_webhooks():
+    """Wait, up to a deadline, for the webhooks queued in this run to go out."""
+    from webhook_queue import flush
+    flush()
 
-    if not settings.get('discord_webhook'):
-        log("No webhook URL set in settings. Skipping webhook send.", "-")
-        return
+# Reads the device table into records; columns are found by their header so
+# the Dutch and English UI both work
+DEVICE_LIST_SCRIPT = """
+const table = document.querySelector(arguments[0] + ' table');
+if (!table) return [];
+const columns = {name: /naam|name|host/i, ip: /^ip|ip.?adres|ip address/i, mac: /mac/i,
+                 interface: /interface|verbinding|connection|type/i, status: /status|actief|active/i};
+const headers = Array.from(table.querySelectorAll('thead th')).map(cell => cell.innerText.trim());
+const positions = {};
+Object.entries(columns).forEach(([key, pattern], fallback) => {
+    const position = headers.findIndex(header => pattern.test(header));
+    positions[key] = position >= 0 ? position : (headers.length ? -1 : fallback);
+});
+return Array.from(table.querySelectorAll('tbody tr')).map(row => {
+    const cells = Array.from(row.querySelectorAll('td')).map(cell => cell.innerText.trim());
+    const device = {};
+    for (const [key, position] of Object.entries(positions)) {
+        device[key] = position >= 0 ? (cells[position] || '') : '';
+    }
+    return device;
+}).filter(device => device.ip || device.mac);
+"""
 
-    try:
-        system_info_div = driver.find_element(By.ID, "card_sys")
-        
-        data = {
-            'model_name': system_info_div.find_element(By.ID, "card_sysinfo_modelname").text,
-            'firmware_version': system_info_div.find_element(By.ID, "card_sysinfo_fwversion").text,
-            'uptime': system_info_div.find_element(By.ID, "card_sysinfo_systime").text,
-            'mac_address': system_info_div.find_element(By.ID, "card_sysinfo_macaddr").text,
-            'ethernet_wan': system_info_div.find_element(By.ID, "card_sysinfo_wan").text
-        }
-
-        # Wait and print with rotating icon until all required information is retrieved
-        while data['uptime'] == '0 dagen 0 uur 0 minuten 0 seconden' or not data['firmware_version'] or not data['mac_address']:
-            for icon in "\\|/-":
-                sys.stdout.write(f"\r\033[90m[\033[93m\033[5m{icon}\033[25m\033[90m] Awaiting complete information...\033[0m")
-                sys.stdout.flush()
-                time.sleep(0.1)
-
-                # Re-fetch the data to check if it's updated
-                system_info_div = driver.find_element(By.ID, "card_sys")
-                data = {
-                    'model_name': system_info_div.find_element(By.ID, "card_sysinfo_modelname").text,
-                    'firmware_version': system_info_div.find_element(By.ID, "card_sysinfo_fwversion").text,
-                    'uptime': system_info_div.find_element(By.ID, "card_sysinfo_systime").text,
-                    'mac_address': system_info_div.find_element(By.ID, "card_sysinfo_macaddr").text,
-                    'ethernet_wan': system_info_div.find_element(By.ID, "card_sysinfo_wan").text
-                }
-                
-                if not (data['uptime'] == '0 dagen 0 uur 0 minuten 0 seconden' or not data['firmware_version'] or not data['mac_address']):
-                    break
-        
-        # Clear the line after the information is complete
-        sys.stdout.write("\r\033[0m\033[K")  # \033[K clears the line from the cursor to the end
+@traced("device list")
+def open_device_list(driver):
+    """Open the list view of the connected devices card on the dashboard."""
+    log("Retrieving list of connected devices...", "!")
+    
+    # Wait for any potential loading overlay to disappear
+    wait_policy.wait(driver, "loading overlay", EC.invisibility_of_element((By.ID, "LoadingBox")))
+    
+    # Click on the specific div inside the parent
+    driver.find_element(By.CSS_SELECTOR, "div#card_cnt").click()
+    
+    # Wait for the loading to disappear
+    wait_policy.wait(driver, "loading overlay", EC.invisibility_of_element((By.ID, "LoadingBox")))
+    
+    # Click on the 'Lijst' tab
+    wait_policy.wait(driver, "device list", EC.element_to_be_clickable(
+        (By.CSS_SELECTOR, "li.nav-item a#tab_List_Tab"))).click()
+    
+    # Wait until the 'Lijst' tab content is present
+    wait_policy.wait(driver, "device list", EC.presence_of_element_located((By.ID, "tab_List")))
 
-        # Log final information
-        log("System information retrieved. Waiting before proceeding to device list.", "✓")
-        time.sleep(2)  # Wait before proceeding
+def list_connected_devices(driver):
+    """Read the device table of the open list view in a single script call."""
+    return driver.execute_script(DEVICE_LIST_SCRIPT, "#tab_List")
 
-        log("Retrieving list of connected devices...", "!")
-        
-        # Wait for any potential loading overlay to disappear
-        WebDriverWait(driver, 30).until(
-            EC.invisibility_of_element((By.ID, "LoadingBox"))
-        )
-        
-        # Click on the specific div inside the parent
-        div_to_click = driver.find_element(By.CSS_SELECTOR, "div#card_cnt")
-        div_to_click.click()
-        
-        # Wait for the loading to disappear
-        WebDriverWait(driver, 30).until(
-            EC.invisibility_of_element((By.ID, "LoadingBox"))
-        )
-        
-        # Click on the 'Lijst' tab
-        WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "li.nav-item a#tab_List_Tab"))
-        ).click()
-        
-        # Wait until the 'Lijst' tab content is present
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "tab_List"))
-        )
-        
-        # Take a screenshot of the list of devices
-        device_list_div = driver.find_element(By.ID, "tab_List")
-        screenshot_path = "device_list.png"
-        device_list_div.screenshot(screenshot_path)
-        
+def take_device_list_screenshot(driver, screenshot_path="device_list.png"):
+    """Save a screenshot of the open device list and return its path, or None."""
+    try:
+        driver.find_element(By.ID, "tab_List").screenshot(screenshot_path)
         log("Device list screenshot taken and saved.", "+")
+        return screenshot_path
+    except Exception as e:
+        log(f"Could not take device list screenshot: {e}", "-")
+        return None
 
-        # Prepare the payload
-        payload = {
-            "username": f"Zyxel - ({data['model_name']})",
-            # "content": "Here is the system information and device list.",
-            "avatar_url": "https://i0.wp.com/www.appletips.nl/wp-content/uploads/2023/09/odido.png?fit=468%2C468&ssl=1",
-            "embeds": [
-                {
-                    "title": "System Information",
-                    "description": (
-                        f"**Model Name**: {data['model_name']}\n"
-                        f"**Firmware Version**: {data['firmware_version']}\n"
-                        f"**Uptime**: {data['uptime']}\n"
-                        f"**MAC Address**: {data['mac_address']}\n"
-                        f"**Ethernet WAN**: {data['ethernet_wan']}"
-                    ),
-                    "color": 0xe83e8c  # Hex color #e83e8c
-                }
-            ]
-        }
-
-        # Send the request with the file attachment and embed
-        with open(screenshot_path, "rb") as file:
-            files = {
-                "file": ("device_list.png", file, "image/png")
-            }
-            data = {
-                "payload_json": json.dumps(payload)
-            }
-            response = requests.post(settings.get('discord_webhook'), data=data, files=files)
-        
-        if 200 <= response.status_code < 300:
-            log(f"Webhook sent successfully. Status code: {response.status_code}", "+")
-        else:
-            log(f"Failed to send webhook. Status code: {response.status_code}, response:\n{response.text}", "-")
-    
+def send_webhook_data(backend, gateway, system_data, settings):
+    """Send the system information and connected devices to the webhook.
+
+    The devices are compared with the list stored by the previous run for
+    this gateway. A screenshot of the device list is only attached when the
+    ``device_list_screenshot`` setting is on and the browser backend is used.
+    """
+    devices = changes = None
+    try:
+        devices = [normalize_device(device) for device in backend.get_connected_devices()]
+        log(f"Found {len(devices)} connected devices", "+")
+        previous = load_previous_devices(gateway)
+        if previous is not None:
+            changes = diff_devices(previous, devices)
+        save_devices(gateway, devices)
     except Exception as e:
-        log(f"Error sending webhook data: {e}", "-")
+        log(f"Error retrieving connected devices: {e}", "-")
+    
+    screenshot_path = None
+    if settings.get('device_list_screenshot') and isinstance(backend, SeleniumBackend):
+        screenshot_path = take_device_list_screenshot(backend.driver)
+    
+    post_webhook(settings.get('discord_webhook'), build_webhook_payload(system_data, devices, changes), screenshot_path)
+
+# Element IDs of the fields in the dashboard's system information card
+SYSTEM_INFO_FIELDS = {
+    'model_name': "card_sysinfo_modelname",
+    'firmware_version': "card_sysinfo_fwversion",
+    'uptime': "card_sysinfo_systime",
+    'mac_address': "card_sysinfo_macaddr",
+    'ethernet_wan': "card_sysinfo_wan"
+}
+
+# Uptime shown by the dashboard before the modem has filled in the card
+EMPTY_UPTIME = '0 dagen 0 uur 0 minuten 0 seconden'
 
+# Resolves as soon as uptime, firmware and MAC are filled in, either right
+# away or from a MutationObserver on the card, so no polling is needed
+SYSTEM_INFO_SCRIPT = """
+const [fields, emptyUptime, done] = arguments;
+const read = () => {
+    const data = {};
+    for (const [key, id] of Object.entries(fields)) {
+        const element = document.getElementById(id);
+        data[key] = element ? element.innerText.trim() : '';
+    }
+    return data;
+};
+const complete = data => data.uptime && data.uptime !== emptyUptime && data.firmware_version && data.mac_address;
+const data = read();
+if (complete(data)) {
+    done(data);
+    return;
+}
+const observer = new MutationObserver(() => {
+    const data = read();
+    if (complete(data)) {
+        observer.disconnect();
+        done(data);
+    }
+});
+observer.observe(document.getElementById('card_sys') || document.body,
+                 {childList: true, subtree: true, characterData: true});
+"""
+
+def wait_for_complete_system_information(driver):
+    """Wait until the dashboard has filled in uptime, firmware and MAC, and return all fields."""
+    log("Awaiting complete system information...", "!")
+    return wait_policy.run_async_script(driver, "system information", SYSTEM_INFO_SCRIPT,
+                                        SYSTEM_INFO_FIELDS, EMPTY_UPTIME)
+
+@traced("system information page")
 def wait_for_system_information(driver):
-    """Wait for the system information to load and print progress."""
+    """Wait for the system information to load and return it."""
     log("Waiting for system information to load...", "!")
     try:
-        system_info_div = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "card_sys"))
-        )
-        
-        data = {
-            'model_name': system_info_div.find_element(By.ID, "card_sysinfo_modelname").text,
-            'firmware_version': system_info_div.find_element(By.ID, "card_sysinfo_fwversion").text,
-            'uptime': system_info_div.find_element(By.ID, "card_sysinfo_systime").text,
-            'mac_address': system_info_div.find_element(By.ID, "card_sysinfo_macaddr").text,
-            'ethernet_wan': system_info_div.find_element(By.ID, "card_sysinfo_wan").text
-        }
-
-        while data['uptime'] == '0 dagen 0 uur 0 minuten 0 seconden' or not data['firmware_version'] or not data['mac_address']:
-            for icon in "\\|/-":
-                sys.stdout.write(f"\r\033[90m[\033[93m\033[5m{icon}\033[25m\033[90m] Awaiting complete system information...\033[0m")
-                sys.stdout.flush()
-                time.sleep(0.1)
-
-                # Re-fetch the data to check if it's updated
-                system_info_div = driver.find_element(By.ID, "card_sys")
-                data = {
-                    'model_name': system_info_div.find_element(By.ID, "card_sysinfo_modelname").text,
-                    'firmware_version': system_info_div.find_element(By.ID, "card_sysinfo_fwversion").text,
-                    'uptime': system_info_div.find_element(By.ID, "card_sysinfo_systime").text,
-                    'mac_address': system_info_div.find_element(By.ID, "card_sysinfo_macaddr").text,
-                    'ethernet_wan': system_info_div.find_element(By.ID, "card_sysinfo_wan").text
-                }
-                
-                if not (data['uptime'] == '0 dagen 0 uur 0 minuten 0 seconden' or not data['firmware_version'] or not data['mac_address']):
-                    break
+        wait_policy.wait(driver, "dashboard", EC.presence_of_element_located((By.ID, "card_sys")))
         
-        sys.stdout.write("\r\033[0m\033[K")  # \033[K clears the line from the cursor to the end
+        data = wait_for_complete_system_information(driver)
         log("System information loaded", "+")
+        report_page_load(driver, "dashboard")
         
         return data
     
@@ -359,15 +402,12 @@ def wait_for_system_information(driver):
         driver.save_screenshot("system_info_error.png")
         return None
 
-def wait_for_element_to_be_clickable(driver, by, value, timeout=30):
+def wait_for_element_to_be_clickable(driver, by, value, step="element"):
     """Wait for an element to be clickable."""
     try:
-        element = WebDriverWait(driver, timeout).until(
-            EC.element_to_be_clickable((by, value))
-        )
-        return element
-    except TimeoutException:
-        log(f"Element not clickable after {timeout} seconds: {value}", "-")
+        return wait_policy.wait(driver, step, EC.element_to_be_clickable((by, value)))
+    except StepStalled as e:
+        log(f"Element not clickable: {value} ({e})", "-")
         return None
 
 def click_element(driver, by, value):
@@ -386,71 +426,29 @@ def click_element(driver, by, value):
         log(f"Element not found or not clickable: {value}", "-")
 
 
-def get_ipv4_address():
-    """Retrieve the local machine's IPv4 address."""
-    import socket
-    try:
-        hostname = socket.gethostname()
-        ipv4_address = socket.gethostbyname(hostname)
-        return ipv4_address
-    except Exception as e:
-        log(f"Error retrieving IPv4 address: {e}", "-")
-        return None
+def get_ipv4_address(gateway=None):
+    """Retrieve the local machine's IPv4 address on the network of the gateway."""
+    # The gateway may carry a port, e.g. when pointed at the mock modem
+    target = gateway.rsplit(":", 1)[0] if gateway else None
+    ipv4_address = netinfo.get_local_ip(target)
+    if ipv4_address is None:
+        log("Error retrieving IPv4 address", "-")
+    return ipv4_address
 
-def fill_text_input(driver, by, value, text):
-    """Fill text input fields."""
-    element = wait_for_element_to_be_clickable(driver, by, value)
-    if element:
-        element.clear()
-        element.send_keys(text)
-        log(f"Filled in text field '{value}' with '{text}'", "+")
-
-def fill_ip_fields(driver, ip):
-    """Fill in IPv4 address fields."""
-    ip_parts = ip.split('.')
-    for i, part in enumerate(ip_parts):
-        if i < 4:
-            field = driver.find_element(By.ID, f"a_srvAddr_{i+1}")
-            field.clear()
-            field.send_keys(part)
-    log(f"Filled in IP address fields with '{ip}'", "+")
-
-def select_protocol(driver):
-    """Select the protocol (TCP, UDP, or BOTH) from the dropdown menu."""
-    log("Selecting the protocol", "!")
-    protocol = input("Enter protocol (TCP/UDP/BOTH): ").strip().upper()
-    
-    if protocol not in ["TCP", "UDP", "BOTH"]:
-        log("Invalid protocol selected (Not in list)", "-")
-        return False
-    
+def get_lan_network(gateway):
+    """The LAN behind the modem, or None for a modem on loopback (the mock), which takes any address."""
+    host = gateway.rsplit(":", 1)[0]
     try:
-        # Find the select element by its ID
-        select_element = Select(driver.find_element(By.ID, "port_fwd_protocol"))
-        
-        # Select the protocol based on the user's input
-        if protocol == "TCP":
-            select_element.select_by_value("TCP")
-        elif protocol == "UDP":
-            select_element.select_by_value("UDP")
-        elif protocol == "BOTH":
-            select_element.select_by_value("ALL")
-
-        
-        log(f"Selected protocol: {protocol}", "+")
-        
-        # Click the OK button to confirm
-        ok_button = driver.find_element(By.CSS_SELECTOR, "button#ok")
-        ok_button.click()
-        log("Clicked OK button", "+")
-        return True
-    except Exception as e:
-        log(f"Error selecting protocol: {e}", "-")
-        driver.save_screenshot("protocol_selection_error.png")
-        return False
+        if ipaddress.ip_address(host).is_loopback:
+            return None
+    except ValueError:
+        # A host name instead of an address
+        return None
+    return netinfo.get_lan_network(host)
 
-def navigate_to_nat_settings(driver):
-    """Navigate to the NAT settings page and perform actions."""
+@traced("nat page")
+def open_nat_settings(driver):
+    """Navigate to the NAT settings page."""
     try:
         # Click the menu button
         click_element(driver, By.CSS_SELECTOR, "div#h_menu_list")
@@ -459,133 +457,787 @@ def navigate_to_nat_settings(driver):
         click_element(driver, By.CSS_SELECTOR, "li a[href='#network']")
         
         # Wait for the menu to be updated and ensure NAT link is clickable
-        WebDriverWait(driver, 10).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, "ul#network"))
-        )
+        wait_policy.wait(driver, "nat menu", EC.visibility_of_element_located((By.CSS_SELECTOR, "ul#network")))
         nat_item = wait_for_element_to_be_clickable(driver, By.CSS_SELECTOR, "li a[href='/NAT']")
         
         if nat_item:
             nat_item.click()
             log("Navigated to NAT settings", "+")
-            
-            # Click the 'Add Rule' button
-            add_rule_button = wait_for_element_to_be_clickable(driver, By.CSS_SELECTOR, "div#portFwdAdd")
-            if add_rule_button:
-                add_rule_button.click()
-                log("Clicked on 'Add Rule' button", "+")
-                
-                # Ask if user wants to enable the port forward now
-                enable_now = input("Do you want to enable the port forward now? (yes/no): ").strip().lower()
-                if enable_now == 'yes':
-                    enable_switch = wait_for_element_to_be_clickable(driver, By.CSS_SELECTOR, "label#port_fwd_active")
-                    if enable_switch:
-                        enable_switch.click()
-                        log("Enabled the port forward", "+")
-                else:
-                    log("Skipped enabling the port forward", "-")
-                
-                # Ask user for the rule name
-                rule_name = input("Enter the name for the port forward rule: ").strip()
-                fill_text_input(driver, By.ID, "srvName", rule_name)
-                
-                # Ask user for the start port
-                start_port = input("Enter the start port: ").strip()
-                fill_text_input(driver, By.ID, "eStart", start_port)
-                
-                # Ask user for the end port
-                end_port = input("Enter the end port: ").strip()
-                fill_text_input(driver, By.ID, "eEnd", end_port)
-                
-                # Ask if user wants to use the current PC's IP address
-                use_current_ip = input("Do you want to use the current PC's IP address? (yes/no): ").strip().lower()
-                if use_current_ip == 'yes':
-                    ip_address = get_ipv4_address()
-                    if ip_address:
-                        fill_ip_fields(driver, ip_address)
-                    else:
-                        log("Failed to retrieve the current PC's IP address", "-")
-                else:
-                    # Ask user for IP address
-                    manual_ip = input("Enter the IP address manually (format: xxx.xxx.xxx.xxx): ").strip()
-                    fill_ip_fields(driver, manual_ip)
-                
-                select_protocol(driver)
-                    # log("Invalid protocol selected. Skipping protocol selection.", "-")
-                
-                # Click the OK button
-                ok_button = wait_for_element_to_be_clickable(driver, By.ID, "Network_NAT_PortForward_ApplyBtn")
-                if ok_button:
-                    ok_button.click()
-                    log("Clicked on 'OK' button to apply the port forward", "+")
-                
-            else:
-                log("Add Rule button not found or not clickable", "-")
-        else:
-            log("NAT settings link not found or not clickable", "-")
-    
+            return True
+        log("NAT settings link not found or not clickable", "-")
     except Exception as e:
         log(f"Error navigating to NAT settings: {e}", "-")
         driver.save_screenshot("nat_settings_error.png")
+    return False
+
+def prompt_port_forward_rule(gateway=None):
+    """Ask the user for the fields of a single port forward rule."""
+    # Ask if user wants to enable the port forward now
+    enable_now = input("Do you want to enable the port forward now? (yes/no): ").strip().lower()
+    
+    # Ask user for the rule name and port range
+    rule_name = input("Enter the name for the port forward rule: ").strip()
+    start_port = input("Enter the start port: ").strip()
+    end_port = input("Enter the end port: ").strip()
+    
+    # Ask if user wants to use the current PC's IP address
+    use_current_ip = input("Do you want to use the current PC's IP address? (yes/no): ").strip().lower()
+    if use_current_ip == 'yes':
+        ip_address = get_ipv4_address(gateway)
+        if not ip_address:
+            log("Failed to retrieve the current PC's IP address", "-")
+    else:
+        ip_address = input("Enter the IP address manually (format: xxx.xxx.xxx.xxx): ").strip()
+    
+    protocol = input("Enter protocol (TCP/UDP/BOTH): ").strip().upper()
+    
+    return {
+        "name": rule_name,
+        "start_port": start_port,
+        "end_port": end_port,
+        "ip": ip_address,
+        "protocol": protocol,
+        "enabled": enable_now == 'yes'
+    }
+
+def prompt_valid_rule(gateway=None, network=None):
+    """Prompt for a rule until it passes the local checks, so a typo never reaches the modem."""
+    while True:
+        try:
+            rule = normalize_rule(prompt_port_forward_rule(gateway))
+        except RuleError as e:
+            log(f"{e}, please try again", "-")
+            continue
+        problems = check_rules([rule], network)
+        if not problems:
+            return rule
+        for problem in problems:
+            log(f"{problem}, please try again", "-")
+
+# Values of the rule form's select for each protocol
+PROTOCOL_OPTIONS = {"TCP": "TCP", "UDP": "UDP", "BOTH": "ALL"}
+
+# Fills the whole rule form in one call. Values go through the native setter
+# and every field gets the input, change and blur events the UI's validators
+# listen for, as typing would. Returns what the fields hold afterwards, so the
+# caller can see whether a validator rejected or rewrote anything.
+FILL_FORM_SCRIPT = """
+const [fields, enabled] = arguments;
+const result = {values: {}, missing: [], invalid: []};
+const toggle = document.querySelector('#port_fwd_active input, input#port_fwd_active');
+if (toggle && toggle.checked !== enabled) {
+    (document.querySelector('label#port_fwd_active') || toggle).click();
+}
+result.enabled = toggle ? toggle.checked : null;
+for (const [id, value] of Object.entries(fields)) {
+    const element = document.getElementById(id);
+    if (!element) {
+        result.missing.push(id);
+        continue;
+    }
+    const prototype = element instanceof HTMLSelectElement ? HTMLSelectElement.prototype : HTMLInputElement.prototype;
+    Object.getOwnPropertyDescriptor(prototype, 'value').set.call(element, value);
+    for (const type of ['input', 'change', 'blur']) {
+        element.dispatchEvent(new Event(type, {bubbles: true}));
+    }
+    result.values[id] = element.value;
+    if ((element.validity && !element.validity.valid) || element.getAttribute('aria-invalid') === 'true') {
+        result.invalid.push(id);
+    }
+}
+// Some firmware shows an OK button that confirms the protocol choice
+const ok = document.querySelector('button#ok');
+if (ok) ok.click();
+return result;
+"""
+
+def rule_form_fields(rule):
+    """Map a rule to the ids of the form fields and the values they should hold."""
+    protocol = rule["protocol"].upper()
+    if protocol not in PROTOCOL_OPTIONS:
+        raise ValueError(f"Invalid protocol {rule['protocol']!r}, expected TCP, UDP or BOTH")
+    fields = {
+        "srvName": rule["name"],
+        "eStart": str(rule["start_port"]),
+        "eEnd": str(rule["end_port"]),
+    }
+    if rule.get("ip"):
+        for i, part in enumerate(rule["ip"].split(".")[:4]):
+            fields[f"a_srvAddr_{i + 1}"] = part
+    fields["port_fwd_protocol"] = PROTOCOL_OPTIONS[protocol]
+    return fields
+
+def fill_port_forward_form(driver, rule):
+    """Fill in the open rule form with a single script call, check the values took and apply it."""
+    try:
+        fields = rule_form_fields(rule)
+    except ValueError as e:
+        log(str(e), "-")
+        return False
+    
+    # The form is rendered when the add/edit button is clicked; wait for its last field
+    wait_policy.wait(driver, "rule form", EC.presence_of_element_located((By.ID, "port_fwd_protocol")))
+    result = driver.execute_script(FILL_FORM_SCRIPT, fields, bool(rule.get("enabled")))
+    
+    rejected = [id for id, value in fields.items() if result["values"].get(id) != value]
+    problems = result["missing"] + result["invalid"] + [id for id in rejected if id not in result["invalid"]]
+    if result["enabled"] is not None and result["enabled"] != bool(rule.get("enabled")):
+        problems.append("port_fwd_active")
+    if problems:
+        log(f"The rule form did not accept: {', '.join(problems)}", "-")
+        driver.save_screenshot("rule_form_error.png")
+        return False
+    log(f"Filled in the rule form for '{rule['name']}'", "+")
+    
+    # Click the OK button
+    ok_button = wait_for_element_to_be_clickable(driver, By.ID, "Network_NAT_PortForward_ApplyBtn")
+    if ok_button:
+        ok_button.click()
+        log("Clicked on 'OK' button to apply the port forward", "+")
+        return True
+    return False
+
+@traced("add rule form")
+def add_port_forward_rule(driver, rule):
+    """Add a port forward rule through the form on the NAT settings page."""
+    try:
+        # Click the 'Add Rule' button
+        add_rule_button = wait_for_element_to_be_clickable(driver, By.CSS_SELECTOR, "div#portFwdAdd")
+        if not add_rule_button:
+            log("Add Rule button not found or not clickable", "-")
+            return False
+        add_rule_button.click()
+        log("Clicked on 'Add Rule' button", "+")
+        
+        return fill_port_forward_form(driver, rule)
+    except Exception as e:
+        log(f"Error adding port forward rule: {e}", "-")
+        driver.save_screenshot("nat_settings_error.png")
+        return False
+
+# Rows of the port forward table on the NAT page, one per rule
+NAT_TABLE_ROWS = "#portFwdTable tbody tr"
+
+# Columns: status, name, WAN interface, start port, end port, server IP, protocol, actions
+NAT_TABLE_SCRIPT = """
+return Array.from(document.querySelectorAll(arguments[0])).map((row, position) => {
+    const cells = Array.from(row.querySelectorAll('td')).map(cell => cell.innerText.trim());
+    const toggle = row.querySelector('input[type=checkbox]');
+    return {
+        index: Number(row.dataset.index || position + 1),
+        enabled: toggle ? toggle.checked : /^(aan|on|enabled?)$/i.test(cells[0]),
+        name: cells[1],
+        start_port: Number(cells[3]),
+        end_port: Number(cells[4]),
+        ip: cells[5],
+        protocol: cells[6]
+    };
+});
+"""
+
+def list_port_forward_rules(driver):
+    """Read the port forward table on the NAT page in a single script call."""
+    rules = driver.execute_script(NAT_TABLE_SCRIPT, NAT_TABLE_ROWS)
+    for rule in rules:
+        protocol = rule["protocol"].upper()
+        rule["protocol"] = "BOTH" if protocol in ("ALL", "TCP/UDP", "BOTH") else protocol
+    return rules
+
+def click_rule_action(driver, rule, action):
+    """Click the edit or delete button in the table row of a rule."""
+    row = driver.find_element(By.CSS_SELECTOR, f"{NAT_TABLE_ROWS}[data-index='{rule['index']}']")
+    row.find_element(By.CSS_SELECTOR, f"[id^='portFwd{action}']").click()
+
+@traced("edit rule form")
+def edit_port_forward_rule(driver, rule):
+    """Open the form of an existing rule and overwrite its fields."""
+    try:
+        click_rule_action(driver, rule, "Edit")
+        return fill_port_forward_form(driver, rule)
+    except Exception as e:
+        log(f"Error editing port forward rule: {e}", "-")
+        driver.save_screenshot("nat_settings_error.png")
+        return False
 
-def main():
+@traced("delete rule")
+def delete_port_forward_rule(driver, rule):
+    """Delete a rule from the table and confirm the dialog."""
     try:
-        default_gateway = get_default_gateway()
+        click_rule_action(driver, rule, "Delete")
+        confirm = wait_for_element_to_be_clickable(driver, By.CSS_SELECTOR, "button#ok")
+        if confirm:
+            confirm.click()
+            log(f"Deleted port forward '{rule['name']}'", "+")
+            return True
+        return False
+    except Exception as e:
+        log(f"Error deleting port forward rule: {e}", "-")
+        driver.save_screenshot("nat_settings_error.png")
+        return False
+
+def navigate_to_nat_settings(driver):
+    """Navigate to the NAT settings page and add a rule entered by the user."""
+    if open_nat_settings(driver):
+        add_port_forward_rule(driver, prompt_port_forward_rule())
+
+class SeleniumBackend:
+    """Drive the modem web UI through Chrome, used when the HTTP backend is unavailable."""
+    
+    name = "selenium"
+    
+    def __init__(self, gateway, daemon_address=None, fast=False, browser_slots=None, deadline=None):
+        import_selenium()
+        self.gateway = gateway
+        self.daemon_address = daemon_address
+        self.fast = fast
+        # Semaphore bounding how many browsers run at once, shared by fleet jobs
+        self.browser_slots = browser_slots
+        # time.monotonic() value after which waiting for a slot is given up
+        self.deadline = deadline
+        self.holds_slot = False
+        self.driver = None
+        self.lease = None
+        self.on_nat_page = False
+        self.on_device_list = False
+    
+    def start_driver(self):
+        """Lease a warm browser from the daemon if one is configured, else start Chrome."""
+        if self.browser_slots is not None:
+            timeout = None if self.deadline is None else max(0, self.deadline - time.monotonic())
+            if not self.browser_slots.acquire(timeout=timeout):
+                raise TimeoutError("no browser slot became free before the deadline")
+            self.holds_slot = True
+        # The browser waits of this job end at its deadline, not only the wait for a slot
+        wait_policy.set_deadline(self.deadline)
+        try:
+            if self.daemon_address:
+                try:
+                    with span("lease browser"):
+                        self.lease = BrowserLease(self.gateway, self.daemon_address)
+                    self.driver = trace_driver(self.lease.driver)
+                    log("Leased a warm browser from the daemon", "+")
+                    return
+                except (OSError, RuntimeError) as e:
+                    log(f"Browser daemon unavailable ({e}), starting Chrome", "!")
+            self.driver = setup_webdriver(self.fast)
+        except BaseException:
+            # A browser that never started must not keep the other fleet jobs waiting
+            self.release_slot()
+            raise
+    
+    def release_slot(self):
+        if self.holds_slot:
+            self.browser_slots.release()
+            self.holds_slot = False
+    
+    def login(self, username, password):
+        if self.driver is None:
+            self.start_driver()
+        if self.lease and self.lease.reused and self.is_logged_in():
+            log("Leased browser is still logged in", "+")
+            return True
+        if not wait_for_login_page(self.driver, f"http://{self.gateway}/login"):
+            log("Failed to access the login page", "-")
+            return False
+        return perform_login(self.driver, username, password)
+    
+    def restore_session(self, state):
+        """Load saved cookies into the browser."""
+        if self.driver is None:
+            self.start_driver()
+        # Cookies can only be set once the browser is on the modem's domain
+        self.driver.get(f"http://{self.gateway}/login")
+        for cookie in state.get("cookies", []):
+            self.driver.add_cookie(cookie)
+    
+    def is_logged_in(self):
+        """Open the dashboard and check that the modem did not send us back to the login page."""
+        try:
+            self.driver.get(f"http://{self.gateway}/")
+            self.on_nat_page = self.on_device_list = False
+            wait_policy.wait(self.driver, "session check", EC.presence_of_element_located((By.ID, "card_sys")))
+            return not self.driver.current_url.endswith("/login")
+        except Exception:
+            return False
+    
+    def export_session(self):
+        return {"cookies": self.driver.get_cookies()}
+    
+    def get_system_information(self):
+        return wait_for_system_information(self.driver)
+    
+    def get_connected_devices(self):
+        if self.on_nat_page or self.on_device_list:
+            # The devices card is only on the dashboard, and reloading it gives a fresh list
+            self.driver.get(f"http://{self.gateway}/")
+            self.on_nat_page = False
+            wait_policy.wait(self.driver, "dashboard", EC.presence_of_element_located((By.ID, "card_cnt")))
+        open_device_list(self.driver)
+        self.on_device_list = True
+        return list_connected_devices(self.driver)
+    
+    def ensure_nat_page(self):
+        if not self.on_nat_page:
+            self.on_nat_page = open_nat_settings(self.driver)
+            self.on_device_list = False
+        return self.on_nat_page
+    
+    def list_port_forwards(self):
+        if not self.ensure_nat_page():
+            raise RuntimeError("NAT settings page could not be opened")
+        return list_port_forward_rules(self.driver)
+    
+    def add_port_forward(self, rule):
+        return self.ensure_nat_page() and add_port_forward_rule(self.driver, rule)
+    
+    def update_port_forward(self, rule):
+        return self.ensure_nat_page() and edit_port_forward_rule(self.driver, rule)
+    
+    def delete_port_forward(self, rule):
+        return self.ensure_nat_page() and delete_port_forward_rule(self.driver, rule)
+    
+    def close(self):
+        wait_policy.save()
+        wait_policy.set_deadline(None)
+        if self.lease:
+            self.lease.release()
+            self.lease = None
+        elif self.driver:
+            self.driver.quit()
+        self.driver = None
+        self.release_slot()
+
+def wait_for_inspection(driver, headless=False, timeout=60):
+    """Keep the browser open until the user closes its window, for at most ``timeout`` seconds."""
+    if headless:
+        # There is no window to look at
+        return
+    log(f"Browser will remain open for inspection, close the window to continue (max {timeout}s)")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if not driver.window_handles:
+                break
+        except Exception:
+            # The window was closed and took the session with it
+            break
+        time.sleep(0.5)
+
+def resume_session(backend, gateway):
+    """Reuse a cached session for the gateway if the modem still accepts it."""
+    state = load_session(gateway, backend.name)
+    if state is None:
+        return False
+    backend.restore_session(state)
+    if backend.is_logged_in():
+        log("Reusing cached modem session", "+")
+        save_session(gateway, backend.name, backend.export_session())
+        return True
+    forget_session(gateway, backend.name)
+    return False
+
+def open_backend(gateway, username, password, backend="auto", scheme="https", use_session_cache=True,
+                 daemon_address=None, fast=False, browser_slots=None, timeout=10, deadline=None):
+    """Log in through the requested backend.
+    
+    With backend "auto" the HTTP backend is tried first and Selenium is used
+    as a fallback when the modem's endpoints cannot be reached or reject the
+    login; None is only returned when the browser login fails too. A cached
+    session is reused when the modem still accepts it. ``deadline`` (a
+    time.monotonic() value) bounds the wait for one of ``browser_slots`` and
+    every browser wait after it.
+    """
+    if backend in ("auto", "http"):
+        from zyxel_http import ZyxelHttpClient, ZyxelError
+        
+        client = ZyxelHttpClient(gateway, scheme=scheme, timeout=timeout)
+        # Logging out on close would invalidate the cached session
+        client.keep_session = use_session_cache
+        try:
+            if use_session_cache and resume_session(client, gateway):
+                return client
+            if client.login(username, password):
+                log("Logged in over HTTP", "+")
+                if use_session_cache:
+                    save_session(gateway, client.name, client.export_session())
+                return client
+            log("Login failed: the modem rejected the credentials", "-")
+            client.close()
+            if backend == "http":
+                return None
+            # Some firmware only accepts the web UI's own login flow
+            log("Trying the browser instead", "!")
+        except ZyxelError as e:
+            log(f"HTTP backend unavailable: {e}", "-")
+            client.close()
+            if backend == "http":
+                return None
+            log("Falling back to the browser", "!")
+    
+    selenium_backend = SeleniumBackend(gateway, daemon_address, fast, browser_slots, deadline)
+    if use_session_cache and resume_session(selenium_backend, gateway):
+        return selenium_backend
+    if selenium_backend.login(username, password):
+        if use_session_cache:
+            save_session(gateway, selenium_backend.name, selenium_backend.export_session())
+        return selenium_backend
+    selenium_backend.close()
+    return None
+
+def apply_rules(backend, rules, deadline=None):
+    """Apply every rule through an already logged in backend and collect the results.
+    
+    Rules still pending when the deadline (a time.monotonic() value) passes are
+    reported as timed out instead of being applied.
+    """
+    results = []
+    for rule in rules:
+        if deadline is not None and time.monotonic() > deadline:
+            results.append((rule, False, "timed out"))
+            continue
+        try:
+            ok = backend.add_port_forward(rule)
+            error = None if ok else "not applied"
+        except Exception as e:
+            ok, error = False, str(e)
+        log(f"Port forward '{rule['name']}' {'applied' if ok else 'failed'}", "+" if ok else "-")
+        results.append((rule, ok, error))
+    return results
+
+def add_rule_via_port_mapping(gateway, rule):
+    """Try to add a rule for this machine through the modem's UPnP IGD; return whether it worked.
+    
+    Only enabled rules that point at this machine qualify, so the mapping is
+    the same as the one the web UI would make. PCP/NAT-PMP are not used here
+    because their leases would expire once this process exits.
+    """
+    from portmap import PortMapError, discover_port_mapper
+    
+    if not rule.get("enabled") or rule["ip"] != get_ipv4_address(gateway):
+        return False
+    mapper = discover_port_mapper(gateway, rule["ip"], timeout=0.5, allow_natpmp=False)
+    if mapper is None:
+        return False
+    try:
+        mapper.add_port_forward(rule)
+    except (PortMapError, ValueError) as e:
+        log(f"UPnP mapping failed ({e}), using the web UI instead", "!")
+        return False
+    log(f"Port forward '{rule['name']}' mapped through UPnP IGD", "+")
+    return True
+
+def find_conflicts_on_modem(backend, rules, replaced=(), key=name_key):
+    """Check rules against the modem's current table; return the conflicts found."""
+    with span("check conflicts", rules=len(rules)):
+        try:
+            existing = backend.list_port_forwards()
+        except Exception as e:
+            log(f"Could not read the modem's rules to check for conflicts: {e}", "!")
+            return []
+        return find_conflicts(rules, existing, replaced, key)
+
+def report_problems(problems, what):
+    for problem in problems:
+        log(problem, "-")
+    log(f"{len(problems)} problem{'s' if len(problems) != 1 else ''} in {what}, nothing was changed", "-")
+
+def run_portmap_session(args, gateway, rules):
+    """Add port forwards through UPnP IGD or PCP/NAT-PMP, without credentials or a browser."""
+    from portmap import discover_port_mapper
+    
+    if args.reconcile or args.export or args.restore or args.watch:
+        log("The NAT page is only reachable through the web UI, use --backend http or selenium", "-")
+        return
+    local_ip = get_ipv4_address(gateway)
+    with span("open backend") as current:
+        backend = discover_port_mapper(gateway, local_ip)
+        current.set(backend=backend.client.name if backend else None)
+    if backend is None:
+        log("The modem answers neither UPnP IGD nor PCP/NAT-PMP", "-")
+        return
+    log(f"Using {backend.client.name} on {gateway}", "+")
+    
+    conflicts = find_conflicts_on_modem(backend, rules)
+    if conflicts:
+        report_problems(conflicts, "the rules")
+        backend.close()
+        return
+    with span("apply rules", rules=len(rules)):
+        results = apply_rules(backend, rules)
+    print_rule_report(results)
+    
+    if any(granted for _, granted, _ in backend.leases.values()):
+        # PCP/NAT-PMP mappings expire unless renewed; keep them alive until interrupted
+        backend.start_renewal()
+        log("The mappings are leased, keep this running to renew them (Ctrl+C to stop)", "!")
+        try:
+            backend.stopping.wait()
+        except KeyboardInterrupt:
+            pass
+    backend.close()
+
+def print_rule_report(results):
+    """Print a per-rule summary of a batch run."""
+    print()
+    for rule, ok, error in results:
+        ports = f"{rule['start_port']}-{rule['end_port']}"
+        line = f"{rule['name']:<24} {ports:<12} {rule['protocol']:<5} {rule['ip']:<16}"
+        log(f"{line} {'OK' if ok else error}", "✓" if ok else "-")
+    applied = sum(1 for _, ok, _ in results if ok)
+    log(f"{applied}/{len(results)} rules applied", "+" if applied == len(results) else "-")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Manage port forwards on an Odido (Zyxel) modem")
+    parser.add_argument("--backend", choices=["auto", "http", "selenium", "portmap"], default="auto",
+                        help="How to talk to the modem (default: HTTP with browser fallback; "
+                             "portmap uses UPnP IGD or PCP/NAT-PMP and needs no login)")
+    parser.add_argument("--gateway", help="Modem address, defaults to the default gateway")
+    parser.add_argument("--scheme", choices=["http", "https"], default="https",
+                        help="Scheme used by the HTTP backend")
+    jobs = parser.add_mutually_exclusive_group()
+    jobs.add_argument("--rules", metavar="FILE",
+                      help="Apply all rules from a JSON or YAML file without prompting")
+    jobs.add_argument("--reconcile", metavar="FILE",
+                      help="Make the modem's rules match a JSON or YAML file, changing only what differs")
+    jobs.add_argument("--export", metavar="FILE",
+                      help="Add a snapshot of the modem's port forward table to a snapshot file")
+    jobs.add_argument("--restore", metavar="FILE",
+                      help="Make the modem's rules match a snapshot from a snapshot file")
+    jobs.add_argument("--watch", action="store_true",
+                      help="Keep running and re-point port forwards when their host gets a new IP address")
+    parser.add_argument("--snapshot", type=int, metavar="N",
+                        help="With --restore, the snapshot to restore (default: the latest, -2 the one before)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --reconcile or --restore, print the plan without changing anything")
+    parser.add_argument("--prune", action="store_true",
+                        help="With --reconcile or --restore, also delete rules that are not in the file")
+    parser.add_argument("--upnp", action="store_true",
+                        help="Try the modem's UPnP IGD before logging in when adding a rule for this PC")
+    parser.add_argument("--no-session-cache", dest="session_cache", action="store_false",
+                        help="Always log in instead of reusing a cached modem session")
+    parser.add_argument("--browser-daemon", metavar="HOST:PORT", nargs="?",
+                        const=f"{BROWSER_DAEMON_ADDRESS[0]}:{BROWSER_DAEMON_ADDRESS[1]}",
+                        help="Lease a warm browser from browser_daemon.py instead of starting Chrome")
+    parser.add_argument("--fast", action="store_true",
+                        help="Run Chrome headless and skip images, fonts and analytics")
+    parser.add_argument("--fleet", metavar="INVENTORY",
+                        help="Apply rules to every modem in a JSON or YAML inventory concurrently")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Number of modems handled at once in fleet mode")
+    parser.add_argument("--browser-sessions", type=int, default=2,
+                        help="Number of browsers allowed at once in fleet mode")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Time every step and browser/HTTP call and write a Chrome trace JSON file")
+    return parser.parse_args(argv)
+
+def write_trace_report(path):
+    """Export the recorded spans as Chrome trace JSON and print the summary table."""
+    count = tracing.export_chrome_trace(path)
+    print()
+    for line in tracing.summary_lines():
+        log(line, "!")
+    log(f"Wrote {count} spans to {path} (open it in chrome://tracing or ui.perfetto.dev)", "+")
+
+def export_nat_snapshot(backend, path, gateway):
+    """Record the modem's port forward table in a snapshot file."""
+    from nat_snapshot import SnapshotError, export_snapshot
+    
+    with span("export snapshot"):
+        rules = backend.list_port_forwards()
+        try:
+            number, snapshot = export_snapshot(path, rules, gateway)
+        except SnapshotError as e:
+            log(f"Could not save the snapshot: {e}", "-")
+            return
+    if snapshot is None:
+        log(f"The {len(rules)} rules are unchanged since snapshot {number} in {path}", "+")
+    elif "rules" in snapshot:
+        log(f"Saved snapshot {number} with all {len(rules)} rules to {path}", "+")
+    else:
+        log(f"Saved snapshot {number} to {path}: {len(snapshot['added'])} added, "
+            f"{len(snapshot['removed'])} removed", "+")
+
+def run_session(args, settings=None):
+    """Log in to one modem and run the job selected on the command line."""
+    rules = None
+    rules_file = args.rules or args.reconcile or args.restore
+    # Restoring a snapshot is reconciling against the rules in it
+    reconciling = bool(args.reconcile or args.restore)
+    if rules_file:
+        try:
+            with span("load rules"):
+                if args.restore:
+                    from nat_snapshot import load_snapshot
+                    rules = load_snapshot(args.restore, args.snapshot)
+                else:
+                    rules = load_rules(rules_file)
+        except (OSError, ValueError) as e:
+            log(f"Could not load rules from {rules_file}: {e}", "-")
+            return
+        log(f"Loaded {len(rules)} rules from {rules_file}", "+")
+    
+    try:
+        with span("find gateway"):
+            default_gateway = args.gateway or get_default_gateway()
         if default_gateway:
             log(f"Default Gateway: {default_gateway}", "+")
-            url = f"http://{default_gateway}/login"
             
-            driver = setup_webdriver()
+            # Bad input fails here, in milliseconds, instead of after a login
+            network = get_lan_network(default_gateway)
+            if rules is not None:
+                # A snapshot may hold several rules with one name, restore tells them apart by port
+                problems = check_rules(rules, network, unique_names=not args.restore)
+                if problems:
+                    report_problems(problems, rules_file)
+                    return
+                job_rules = rules
+            elif args.export or args.watch:
+                job_rules = []
+            else:
+                with span("prompt rule"):
+                    rule = prompt_valid_rule(default_gateway, network)
+                job_rules = [rule]
+            
+            if args.backend == "portmap":
+                run_portmap_session(args, default_gateway, job_rules)
+                return
+            
+            if args.upnp and args.backend == "auto" and rules is None and not (args.export or args.watch):
+                # A UPnP mapping needs no credentials; the web UI is only used when it fails
+                with span("add rule via upnp"):
+                    if add_rule_via_port_mapping(default_gateway, rule):
+                        log(f"Port forward '{rule['name']}' applied", "✓")
+                        return
+            
+            # Load saved credentials if available
+            saved_username, saved_password = load_credentials()
+            
+            if saved_username and saved_password:
+                log("Using saved credentials", "+")
+                username = saved_username
+                password = saved_password
+            else:
+                log("No saved credentials found. Please enter your credentials.", "!")
+                username = input("Enter your username: ").strip()
+                password = input_password()
+            
+            daemon_address = None
+            if args.browser_daemon:
+                host, _, port = args.browser_daemon.rpartition(":")
+                daemon_address = (host, int(port))
             
-            if wait_for_login_page(driver, url):
-                # Load saved credentials if available
-                saved_username, saved_password = load_credentials()
+            with span("open backend") as current:
+                backend = open_backend(default_gateway, username, password, args.backend, args.scheme,
+                                       args.session_cache, daemon_address, args.fast)
+                current.set(backend=backend.name if backend else None)
+            
+            if backend:
+                save_credentials(username, password)
+                
+                # Always wait for system information to load
+                with span("system information"):
+                    system_data = backend.get_system_information()
                 
-                if saved_username and saved_password:
-                    log("Using saved credentials", "+")
-                    username = saved_username
-                    password = saved_password
+                # Check if webhook is enabled
+                if settings is None:
+                    settings = load_settings()
+                webhook_url = settings.get('discord_webhook')
+
+                if webhook_url:
+                    if not system_data:
+                        log("System information could not be retrieved. Skipping webhook.", "-")
+                    else:
+                        with span("webhook"):
+                            send_webhook_data(backend, default_gateway, system_data, settings)
+                
+                if args.export or args.watch or (reconciling and args.prune):
+                    # Rules that are not in the file get deleted, they cannot conflict
+                    conflicts = []
                 else:
-                    log("No saved credentials found. Please enter your credentials.", "!")
-                    username = input("Enter your username: ").strip()
-                    password = input_password()
+                    # Reconciling overwrites the rules with the same names; a restore
+                    # only overwrites those with the same name, ports and protocol
+                    key = port_key if args.restore else name_key
+                    replaced = [key(rule) for rule in job_rules] if reconciling else ()
+                    conflicts = find_conflicts_on_modem(backend, job_rules, replaced, key)
                 
-                login_success = perform_login(driver, username, password)
+                if conflicts:
+                    report_problems(conflicts, rules_file or "the rule")
+                elif args.export:
+                    export_nat_snapshot(backend, args.export, default_gateway)
+                elif args.watch:
+                    from watch import run_watch
+                    with span("watch"):
+                        run_watch(backend, default_gateway, lambda: backend.login(username, password))
+                elif reconciling:
+                    from reconcile import reconcile
+                    with span("reconcile", rules=len(rules)):
+                        reconcile(backend, rules, args.prune, args.dry_run, port_key if args.restore else name_key)
+                elif rules is not None:
+                    # Apply the whole batch in this login session
+                    with span("apply rules", rules=len(rules)):
+                        results = apply_rules(backend, rules)
+                    print_rule_report(results)
+                else:
+                    # Add the port forward rule
+                    with span("add rule") as current:
+                        applied = backend.add_port_forward(rule)
+                        current.set(outcome="ok" if applied else "failed")
+                    if applied:
+                        log(f"Port forward '{rule['name']}' applied", "✓")
+                    else:
+                        log(f"Port forward '{rule['name']}' could not be applied", "-")
                 
-                if login_success:
-                    # Always wait for system information to load
-                    system_data = wait_for_system_information(driver)
-                    
-                    # Check if webhook is enabled
-                    settings = load_settings()
-                    webhook_url = settings.get('discord_webhook')
-
-                    if webhook_url:
-                        if system_data:
-                            # Prepare and send webhook if system data is available
-                            send_webhook_data(driver)
-                        else:
-                            log("System information could not be retrieved. Skipping webhook.", "-")
-                    
-                    # Navigate to NAT settings
-                    navigate_to_nat_settings(driver)
-                    
+                if isinstance(backend, SeleniumBackend) and rules is None and not (args.export or args.watch):
                     if saved_username and saved_password and (saved_username != username or saved_password != password):
                         log("Credentials have been updated", "+")
                     else:
-                        log("Browser will remain open for inspection")
-                        time.sleep(60)  # Allow time for inspection
+                        with span("inspection wait"):
+                            wait_for_inspection(backend.driver, args.fast)
                     
                     log("Closing the browser")
-                else:
-                    log("Login failed. Skipping NAT settings.", "-")
                 
-                driver.quit()
+                with span("close"):
+                    backend.close()
+                with span("flush webhooks"):
+                    flush_webhooks()
             else:
-                log("Failed to access the login page", "-")
+                log("Login failed. Skipping NAT settings.", "-")
         else:
             log("Failed to retrieve the default gateway", "-")
     except Exception as e:
         log(f"Unhandled exception: {e}", "-")
 
+def main(argv=None, settings=None):
+    """Run the provider; main.py passes the settings it already loaded."""
+    args = parse_args(argv)
+    if args.trace:
+        tracing.enable()
+    try:
+        with span("run", "run"):
+            if args.fleet:
+                from fleet import run_fleet_from_args
+                run_fleet_from_args(args)
+            else:
+                run_session(args, settings)
+    finally:
+        if args.trace:
+            write_trace_report(args.trace)
+
+def run(settings, gateway=None):
+    """Run the interactive flow in-process with the settings main.py already loaded."""
+    main(["--gateway", gateway] if gateway else [], settings)
+
+# Entry object for main.py, which imports this module and calls run in-process.
+# The fingerprint matches the Zyxel login page, see gateway_probe.py.
+PROVIDER = {
+    "name": "Odido",
+    "aliases": ["Tele2"],
+    "run": run,
+    "fingerprint": {
+        "patterns": [r"id=[\"']?cardpage\b", r"id=[\"']?userpassword\b"],
+        "model": r"id=[\"']?cardpage\b.*?<h3[^>]*>(.*?)</h3>",
+    },
+}
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,162 @@
+import heapq
+import ipaddress
+import json
+import os
+
+PROTOCOL_NAMES = ("TCP", "UDP", "BOTH")
+MIN_PORT = 1
+MAX_PORT = 65535
+
+
+class RuleError(ValueError):
+    """Raised when a rules file or a rule in it is malformed."""
+
+
+def normalize_rule(rule):
+    """Return a rule with defaults filled in and values converted to their types."""
+    if not isinstance(rule, dict):
+        raise RuleError(f"Rule must be a mapping, got {type(rule).__name__}")
+    for field in ("name", "start_port", "ip"):
+        if field not in rule:
+            raise RuleError(f"Rule {rule.get('name', '?')!r} is missing '{field}'")
+
+    protocol = str(rule.get("protocol", "BOTH")).upper()
+    if protocol not in PROTOCOL_NAMES:
+        raise RuleError(f"Rule {rule['name']!r} has unknown protocol {protocol!r}")
+
+    if not str(rule["name"]).strip():
+        raise RuleError("Rule name must not be empty")
+
+    try:
+        start_port = int(rule["start_port"])
+        end_port = rule.get("end_port")
+        # An empty end port (e.g. left blank at the prompt) means a single port
+        end_port = start_port if end_port in (None, "") else int(end_port)
+    except (TypeError, ValueError):
+        raise RuleError(f"Rule {rule['name']!r} has a non-numeric port") from None
+    if not MIN_PORT <= start_port <= end_port <= MAX_PORT:
+        raise RuleError(f"Rule {rule['name']!r} has port range {start_port}-{end_port}, "
+                        f"expected {MIN_PORT}-{MAX_PORT} with the start not above the end")
+
+    try:
+        ip = ipaddress.IPv4Address(str(rule["ip"]).strip())
+    except ipaddress.AddressValueError:
+        raise RuleError(f"Rule {rule['name']!r} has invalid IPv4 address {rule['ip']!r}") from None
+
+    return {
+        "name": str(rule["name"]).strip(),
+        "start_port": start_port,
+        "end_port": end_port,
+        "ip": str(ip),
+        "protocol": protocol,
+        "enabled": bool(rule.get("enabled", True)),
+    }
+
+
+def describe_rule(rule):
+    return f"'{rule['name']}' {rule['start_port']}-{rule['end_port']}/{rule['protocol']}"
+
+
+def name_key(rule):
+    return rule["name"]
+
+
+def port_key(rule):
+    return rule["name"], int(rule["start_port"]), int(rule["end_port"]), rule["protocol"]
+
+
+def find_conflicts(rules, existing=(), replaced=(), key=name_key):
+    """Return a message for every pair of rules that forward the same external port.
+
+    ``rules`` are checked against each other and against ``existing``, the
+    modem's table; conflicts among the existing rules themselves are not
+    reported. Existing rules whose ``key`` is in ``replaced`` are left out
+    because they are about to be overwritten. Per protocol the rules are
+    sorted by start port and swept with a heap of the ranges still open, so
+    a batch of n rules costs O(n log n) plus the number of conflicts.
+    """
+    replaced = set(replaced)
+    entries = [(rule, False) for rule in rules]
+    entries += [(rule, True) for rule in existing if key(rule) not in replaced]
+
+    conflicts = {}
+    for protocol in ("TCP", "UDP"):
+        ranges = sorted((int(rule["start_port"]), int(rule["end_port"]), position)
+                        for position, (rule, _) in enumerate(entries)
+                        if rule["protocol"] in (protocol, "BOTH"))
+        open_ranges = []
+        for start, end, position in ranges:
+            while open_ranges and open_ranges[0][0] < start:
+                heapq.heappop(open_ranges)
+            rule, on_modem = entries[position]
+            for _, other_position in open_ranges:
+                other, other_on_modem = entries[other_position]
+                if on_modem and other_on_modem:
+                    continue
+                pair = tuple(sorted((position, other_position)))
+                if pair in conflicts:
+                    # A BOTH rule overlaps on TCP and UDP; report it once
+                    continue
+                if other_on_modem or on_modem:
+                    new, current = (rule, other) if other_on_modem else (other, rule)
+                    if all(new[field] == current.get(field) for field in ("name", "start_port", "end_port", "ip")):
+                        conflicts[pair] = f"{describe_rule(new)} is already on the modem"
+                    else:
+                        conflicts[pair] = f"{describe_rule(new)} overlaps {describe_rule(current)} on the modem"
+                else:
+                    first, second = (rule, other) if position < other_position else (other, rule)
+                    conflicts[pair] = f"{describe_rule(first)} overlaps {describe_rule(second)}"
+            heapq.heappush(open_ranges, (end, position))
+    return [conflicts[pair] for pair in sorted(conflicts)]
+
+
+def check_rules(rules, network=None, unique_names=True):
+    """Return the problems of a batch that can be found without the modem.
+
+    Every address must be a host on ``network`` (the LAN, when known), names
+    must be unique, since reconciling matches rules by name, and no two rules
+    may forward the same port. A restored snapshot is matched by name and
+    ports instead, so it passes ``unique_names=False``.
+    """
+    problems = []
+    if network is not None:
+        for rule in rules:
+            ip = ipaddress.IPv4Address(rule["ip"])
+            if ip not in network:
+                problems.append(f"{describe_rule(rule)} points at {ip}, which is outside the LAN {network}")
+            elif network.prefixlen < 31 and ip in (network.network_address, network.broadcast_address):
+                problems.append(f"{describe_rule(rule)} points at {ip}, which is not a host address on {network}")
+    seen = set()
+    for rule in rules if unique_names else ():
+        if rule["name"] in seen:
+            problems.append(f"Rule name '{rule['name']}' is used more than once")
+        seen.add(rule["name"])
+    return problems + find_conflicts(rules)
+
+
+def read_data_file(path):
+    """Read a JSON or YAML file, chosen by its extension."""
+    with open(path, "r") as file:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise RuleError("Reading YAML files requires PyYAML (pip install pyyaml)") from None
+            try:
+                return yaml.safe_load(file)
+            except yaml.YAMLError as e:
+                raise RuleError(f"Invalid YAML: {e}") from None
+        return json.load(file)
+
+
+def load_rules(path):
+    """Load a list of port forward rules from a JSON or YAML file.
+
+    The file holds either a list of rules or a mapping with a ``rules`` list.
+    """
+    data = read_data_file(path)
+    if isinstance(data, dict):
+        data = data.get("rules")
+    if not isinstance(data, list):
+        raise RuleError(f"{path} does not contain a list of rules")
+    return [normalize_rule(rule) for rule in data]
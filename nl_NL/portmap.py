@@ -0,0 +1,414 @@
+"""Port mappings through UPnP IGD, PCP or NAT-PMP instead of the web UI.
+
+Most Zyxel units run an Internet Gateway Device service and many routers
+answer PCP or NAT-PMP on UDP 5351. Either one creates a mapping in one
+request, without credentials or a browser. ``discover_port_mapper`` looks
+for an IGD with SSDP (unicast to the gateway, then multicast) and then tries
+PCP, falling back to NAT-PMP when the gateway only speaks version 0.
+
+These mappings are not the same as rules in the NAT page: IGD mappings live
+in the modem's UPnP table and PCP/NAT-PMP mappings expire unless renewed.
+``PortMapBackend.start_renewal`` keeps leases alive while the process runs.
+"""
+import http.client
+import ipaddress
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from tracing import span
+
+SSDP_MULTICAST = ("239.255.255.250", 1900)
+SSDP_PORT = 1900
+NATPMP_PORT = 5351
+
+IGD_SERVICES = (
+    "urn:schemas-upnp-org:service:WANIPConnection:2",
+    "urn:schemas-upnp-org:service:WANIPConnection:1",
+    "urn:schemas-upnp-org:service:WANPPPConnection:1",
+)
+
+# Longest port range turned into individual mappings; larger ranges go to the web UI
+MAX_RANGE = 32
+# Lease requested from PCP/NAT-PMP, renewed at half-time by start_renewal
+DEFAULT_LIFETIME = 7200
+
+PROTOCOL_NUMBERS = {"TCP": 6, "UDP": 17}
+NATPMP_OPCODES = {"UDP": 1, "TCP": 2}
+PCP_UNSUPPORTED_VERSION = 1
+PCP_MAP = 1
+
+
+class PortMapError(Exception):
+    """Raised when a gateway refuses or does not answer a port mapping request."""
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find_text(element, name):
+    for child in element.iter():
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip()
+    return None
+
+
+def ssdp_search(hosts, timeout=1.0, port=SSDP_PORT):
+    """Send an IGD M-SEARCH to each host (and the multicast group) and return the first LOCATION.
+
+    Answers to the multicast search can come from any IGD on the LAN, so a
+    response only counts when it was sent by one of ``hosts`` or its
+    LOCATION points at one of them.
+    """
+    message = ("M-SEARCH * HTTP/1.1\r\n"
+               f"HOST: {SSDP_MULTICAST[0]}:{SSDP_MULTICAST[1]}\r\n"
+               'MAN: "ssdp:discover"\r\n'
+               "MX: 1\r\n"
+               "ST: urn:schemas-upnp-org:device:InternetGatewayDevice:1\r\n\r\n").encode()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        for address in [(host, port) for host in hosts] + [SSDP_MULTICAST]:
+            try:
+                sock.sendto(message, address)
+            except OSError:
+                # No multicast route, or the host is unreachable
+                continue
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            sock.settimeout(max(0.01, deadline - time.monotonic()))
+            try:
+                data, sender = sock.recvfrom(4096)
+            except OSError:
+                return None
+            for line in data.decode("latin-1").split("\r\n"):
+                key, _, value = line.partition(":")
+                if key.strip().lower() == "location":
+                    location = value.strip()
+                    if sender[0] in hosts or urlsplit(location).hostname in hosts:
+                        return location
+                    break
+    return None
+
+
+class UpnpIgdClient:
+    """SOAP client for the WANIPConnection service of an Internet Gateway Device."""
+
+    name = "upnp"
+
+    def __init__(self, control_url, service_type, timeout=3.0):
+        self.control_url = control_url
+        self.service_type = service_type
+        self.timeout = timeout
+
+    @classmethod
+    def from_location(cls, location, timeout=3.0):
+        """Read the device description at ``location`` and find its WAN connection service."""
+        description = ElementTree.fromstring(_http_request("GET", location, timeout=timeout)[1])
+        base = _find_text(description, "URLBase") or location
+        for service in description.iter():
+            if _local_name(service.tag) != "service":
+                continue
+            service_type = _find_text(service, "serviceType")
+            if service_type in IGD_SERVICES:
+                return cls(urljoin(base, _find_text(service, "controlURL")), service_type, timeout)
+        raise PortMapError(f"{location} has no WAN connection service")
+
+    def call(self, action, **arguments):
+        """Invoke a SOAP action and return the response arguments as a dict."""
+        body = "".join(f"<{key}>{escape(str(value))}</{key}>" for key, value in arguments.items())
+        envelope = ('<?xml version="1.0"?>'
+                    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                    's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+                    f'<u:{action} xmlns:u="{self.service_type}">{body}</u:{action}>'
+                    '</s:Body></s:Envelope>')
+        headers = {"Content-Type": 'text/xml; charset="utf-8"',
+                   "SOAPAction": f'"{self.service_type}#{action}"'}
+        with span(f"upnp {action}", "call"):
+            status, data = _http_request("POST", self.control_url, envelope.encode(), headers, self.timeout)
+        try:
+            root = ElementTree.fromstring(data)
+        except ElementTree.ParseError as e:
+            # Routers answer errors with plain HTML as often as with a SOAP fault
+            if status != 200:
+                raise PortMapError(f"{action} failed: HTTP {status}") from None
+            raise PortMapError(f"{action} returned invalid XML: {e}") from None
+        if status != 200:
+            code = _find_text(root, "errorCode") or status
+            raise PortMapError(f"{action} failed: {code} {_find_text(root, 'errorDescription') or ''}".strip())
+        for element in root.iter():
+            if _local_name(element.tag) == f"{action}Response":
+                return {_local_name(child.tag): (child.text or "") for child in element}
+        return {}
+
+    def add_mapping(self, protocol, external_port, internal_client, internal_port, description, lease=0):
+        self.call("AddPortMapping", NewRemoteHost="", NewExternalPort=external_port, NewProtocol=protocol,
+                  NewInternalPort=internal_port, NewInternalClient=internal_client, NewEnabled=1,
+                  NewPortMappingDescription=description, NewLeaseDuration=lease)
+        return lease
+
+    def delete_mapping(self, protocol, external_port):
+        self.call("DeletePortMapping", NewRemoteHost="", NewExternalPort=external_port, NewProtocol=protocol)
+
+    def list_mappings(self, limit=256):
+        """Return every mapping in the IGD's table."""
+        mappings = []
+        for index in range(limit):
+            try:
+                entry = self.call("GetGenericPortMappingEntry", NewPortMappingIndex=index)
+            except PortMapError:
+                # 713 SpecifiedArrayIndexInvalid marks the end of the table
+                break
+            mappings.append({
+                "protocol": entry.get("NewProtocol", "").upper(),
+                "external_port": int(entry.get("NewExternalPort") or 0),
+                "internal_port": int(entry.get("NewInternalPort") or 0),
+                "internal_client": entry.get("NewInternalClient", ""),
+                "enabled": entry.get("NewEnabled", "1") in ("1", "true"),
+                "description": entry.get("NewPortMappingDescription", ""),
+                "lease": int(entry.get("NewLeaseDuration") or 0),
+            })
+        return mappings
+
+
+def _http_request(method, url, body=None, headers=None, timeout=3.0):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        connection.request(method, parts.path + (f"?{parts.query}" if parts.query else ""), body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    except (OSError, http.client.HTTPException) as e:
+        raise PortMapError(f"{method} {url} failed: {e}") from e
+    finally:
+        connection.close()
+
+
+class NatPmpClient:
+    """PCP (RFC 6887) client that falls back to NAT-PMP (RFC 6886) for version 0 gateways.
+
+    Both protocols can only map ports to the host that sends the request.
+    """
+
+    def __init__(self, gateway, port=NATPMP_PORT, timeout=0.25, attempts=3):
+        self.address = (gateway, port)
+        self.timeout = timeout
+        self.attempts = attempts
+        self.version = 2
+        # PCP identifies a mapping by its nonce, renewals and deletes must reuse it
+        self.nonces = {}
+
+    @property
+    def name(self):
+        return "pcp" if self.version == 2 else "natpmp"
+
+    def _exchange(self, request, accept):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(self.address)
+            client_ip = sock.getsockname()[0]
+            # Retransmit with a doubling timeout as both RFCs ask
+            timeout = self.timeout
+            for _ in range(self.attempts):
+                sock.send(request(client_ip))
+                sock.settimeout(timeout)
+                try:
+                    while True:
+                        data = sock.recv(1100)
+                        if accept(data):
+                            return data
+                except socket.timeout:
+                    timeout *= 2
+                except OSError as e:
+                    raise PortMapError(f"{self.address[0]} does not answer PCP/NAT-PMP: {e}") from e
+        raise PortMapError(f"{self.address[0]} does not answer PCP/NAT-PMP")
+
+    def _pcp_map(self, protocol, internal_port, external_port, lifetime):
+        key = (protocol, internal_port)
+        nonce = self.nonces.setdefault(key, os.urandom(12))
+
+        def request(client_ip):
+            client = ipaddress.IPv6Address(f"::ffff:{client_ip}").packed
+            header = struct.pack("!BBHI16s", 2, PCP_MAP, 0, lifetime, client)
+            payload = struct.pack("!12sB3xHH16s", nonce, PROTOCOL_NUMBERS[protocol], internal_port,
+                                  external_port, bytes(16))
+            return header + payload
+
+        with span("pcp MAP", "call"):
+            data = self._exchange(request, lambda data: len(data) >= 4 and data[0] in (0, 2))
+        if data[0] == 0 or data[3] == PCP_UNSUPPORTED_VERSION:
+            # A NAT-PMP gateway answers a version 2 request with "unsupported version"
+            self.version = 0
+            return None
+        if data[3] != 0:
+            raise PortMapError(f"PCP MAP failed with result code {data[3]}")
+        granted = struct.unpack("!I", data[4:8])[0]
+        mapped_port = struct.unpack("!H", data[42:44])[0]
+        if granted == 0:
+            self.nonces.pop(key, None)
+        return mapped_port, granted
+
+    def _natpmp_map(self, protocol, internal_port, external_port, lifetime):
+        opcode = NATPMP_OPCODES[protocol]
+
+        def request(client_ip):
+            return struct.pack("!BBHHHI", 0, opcode, 0, internal_port, external_port, lifetime)
+
+        with span("natpmp map", "call"):
+            data = self._exchange(request, lambda data: len(data) >= 16 and data[0] == 0 and data[1] == 128 + opcode)
+        result = struct.unpack("!H", data[2:4])[0]
+        if result != 0:
+            raise PortMapError(f"NAT-PMP mapping failed with result code {result}")
+        _, mapped_port, granted = struct.unpack("!HHI", data[8:16])
+        return mapped_port, granted
+
+    def map(self, protocol, internal_port, external_port, lifetime=DEFAULT_LIFETIME):
+        """Create or renew a mapping; returns (external port, granted lifetime). Lifetime 0 deletes."""
+        if self.version == 2:
+            result = self._pcp_map(protocol, internal_port, external_port, lifetime)
+            if result is not None:
+                return result
+        return self._natpmp_map(protocol, internal_port, external_port, lifetime)
+
+    def add_mapping(self, protocol, external_port, internal_client, internal_port, description, lease=0):
+        mapped_port, granted = self.map(protocol, internal_port, external_port, lease or DEFAULT_LIFETIME)
+        if mapped_port != external_port:
+            # The gateway picked another port; undo it rather than report the wrong one
+            self.map(protocol, internal_port, mapped_port, 0)
+            raise PortMapError(f"external port {external_port}/{protocol} is taken, the gateway offered {mapped_port}")
+        return granted
+
+    def delete_mapping(self, protocol, external_port, internal_port=None):
+        self.map(protocol, internal_port or external_port, 0 if self.version == 0 else external_port, 0)
+
+
+class PortMapBackend:
+    """Backend with the add/list/delete part of the web UI backends, on top of IGD or PCP/NAT-PMP."""
+
+    name = "portmap"
+
+    def __init__(self, client, local_ip, lease=0):
+        self.client = client
+        self.local_ip = local_ip
+        self.lease = lease
+        # Mappings made by this process: (protocol, port) -> (rule, granted lifetime, renew at)
+        self.leases = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.renewer = None
+
+    def mappings_for(self, rule):
+        """Expand a rule into (protocol, port) pairs, or raise PortMapError when it cannot be mapped."""
+        if not rule.get("enabled", True):
+            raise PortMapError("disabled rules can only be created in the web UI")
+        start, end = int(rule["start_port"]), int(rule["end_port"])
+        if end - start + 1 > MAX_RANGE:
+            raise PortMapError(f"port range {start}-{end} is too large for individual mappings")
+        if isinstance(self.client, NatPmpClient) and rule["ip"] != self.local_ip:
+            raise PortMapError(f"{self.client.name} can only map ports to this machine ({self.local_ip})")
+        protocols = ["TCP", "UDP"] if rule["protocol"].upper() == "BOTH" else [rule["protocol"].upper()]
+        return [(protocol, port) for protocol in protocols for port in range(start, end + 1)]
+
+    def add_port_forward(self, rule):
+        added = []
+        try:
+            for protocol, port in self.mappings_for(rule):
+                granted = self.client.add_mapping(protocol, port, rule["ip"], port, rule["name"], self.lease)
+                added.append((protocol, port))
+                with self.lock:
+                    renew_at = time.monotonic() + granted / 2 if granted else None
+                    self.leases[(protocol, port)] = (rule, granted, renew_at)
+        except PortMapError:
+            # Leave nothing half-mapped behind
+            for protocol, port in added:
+                self._delete(protocol, port)
+            raise
+        return True
+
+    def list_port_forwards(self):
+        """Mappings as rules; from the IGD table, or the leases of this process for PCP/NAT-PMP."""
+        if isinstance(self.client, UpnpIgdClient):
+            mappings = self.client.list_mappings()
+        else:
+            with self.lock:
+                mappings = [{"protocol": protocol, "external_port": port, "internal_client": rule["ip"],
+                             "enabled": True, "description": rule["name"]}
+                            for (protocol, port), (rule, _, _) in self.leases.items()]
+        # One mapping per port and protocol; fold them back into rules with ranges
+        ports = {}
+        for mapping in mappings:
+            key = (mapping["description"], mapping["internal_client"], mapping["external_port"])
+            protocol = ports.get(key)
+            ports[key] = mapping["protocol"] if protocol in (None, mapping["protocol"]) else "BOTH"
+        rules = []
+        for (name, ip, port), protocol in sorted(ports.items()):
+            previous = rules[-1] if rules else None
+            if (previous and (previous["name"], previous["ip"], previous["protocol"]) == (name, ip, protocol)
+                    and previous["end_port"] == port - 1):
+                previous["end_port"] = port
+            else:
+                rules.append({"name": name, "start_port": port, "end_port": port, "ip": ip,
+                              "protocol": protocol, "enabled": True})
+        return rules
+
+    def delete_port_forward(self, rule):
+        for protocol, port in self.mappings_for({**rule, "enabled": True}):
+            self._delete(protocol, port)
+        return True
+
+    def _delete(self, protocol, port):
+        self.client.delete_mapping(protocol, port)
+        with self.lock:
+            self.leases.pop((protocol, port), None)
+
+    def renew_due(self):
+        """Renew the leases that are past half their lifetime; return how many were renewed."""
+        now = time.monotonic()
+        with self.lock:
+            due = [(key, rule) for key, (rule, _, renew_at) in self.leases.items() if renew_at and renew_at <= now]
+        for (protocol, port), rule in due:
+            granted = self.client.add_mapping(protocol, port, rule["ip"], port, rule["name"], self.lease)
+            with self.lock:
+                self.leases[(protocol, port)] = (rule, granted, time.monotonic() + granted / 2 if granted else None)
+        return len(due)
+
+    def start_renewal(self, interval=30):
+        """Renew leases in a background thread until close()."""
+        def run():
+            while not self.stopping.wait(interval):
+                try:
+                    self.renew_due()
+                except PortMapError:
+                    pass
+        self.renewer = threading.Thread(target=run, name="portmap-renewal", daemon=True)
+        self.renewer.start()
+
+    def close(self):
+        # Mappings stay in place; leased ones simply expire when nobody renews them
+        self.stopping.set()
+
+
+def discover_port_mapper(gateway, local_ip=None, timeout=1.0, ssdp_port=SSDP_PORT, natpmp_port=NATPMP_PORT,
+                         allow_natpmp=True, lease=0):
+    """Return a PortMapBackend for the gateway's IGD, or its PCP/NAT-PMP service, or None."""
+    host = gateway.rsplit(":", 1)[0] if gateway.count(":") == 1 else gateway
+    with span("portmap discovery"):
+        location = ssdp_search([host], timeout, ssdp_port)
+        if location:
+            try:
+                return PortMapBackend(UpnpIgdClient.from_location(location), local_ip, lease)
+            except (PortMapError, ElementTree.ParseError):
+                pass
+        if allow_natpmp:
+            client = NatPmpClient(host, natpmp_port)
+            try:
+                # A zero-lifetime request for an unused port only checks that the service answers
+                client.map("TCP", 9, 0, 0)
+                return PortMapBackend(client, local_ip, lease)
+            except PortMapError:
+                pass
+    return None
@@ -0,0 +1,111 @@
+"""Bring the modem's port forward table in line with a declared desired state.
+
+Rules are matched by name, or with ``key=port_key`` by name, ports and
+protocol, which is how a snapshot restore tells apart several rules that
+share a name. The plan lists every rule as add, update,
+delete, unchanged or unmanaged, and only add, update and delete touch the
+modem, so re-running a job that is already in place writes nothing.
+"""
+from console import log
+from port_rules import name_key, port_key
+
+# Fields compared to decide whether an existing rule needs an update
+COMPARED_FIELDS = ("start_port", "end_port", "ip", "protocol", "enabled")
+
+ACTION_SYMBOLS = {"add": "+", "update": "!", "delete": "-", "unchanged": "✓", "unmanaged": "!"}
+
+
+def rule_differences(current, desired):
+    """Return the compared fields whose values differ."""
+    return [field for field in COMPARED_FIELDS if current.get(field) != desired.get(field)]
+
+
+def plan_changes(current_rules, desired_rules, prune=False, key=name_key):
+    """Diff the modem's rules against the desired rules.
+
+    Returns a list of ``(action, desired, current)`` tuples. Extra copies of
+    a managed rule (left behind by earlier runs that always added) are
+    deleted. Rules that are not declared at all are only deleted with
+    ``prune``, otherwise they are reported as unmanaged.
+    """
+    by_key = {}
+    for rule in current_rules:
+        by_key.setdefault(key(rule), []).append(rule)
+
+    plan = []
+    for desired in desired_rules:
+        matches = by_key.pop(key(desired), [])
+        if not matches:
+            plan.append(("add", desired, None))
+            continue
+        # Keep the copy that already matches, if any, and drop the duplicates
+        matches.sort(key=lambda rule: len(rule_differences(rule, desired)))
+        kept, duplicates = matches[0], matches[1:]
+        if rule_differences(kept, desired):
+            plan.append(("update", {**desired, "index": kept["index"]}, kept))
+        else:
+            plan.append(("unchanged", desired, kept))
+        plan.extend(("delete", None, duplicate) for duplicate in duplicates)
+
+    for leftovers in by_key.values():
+        for rule in leftovers:
+            plan.append(("delete" if prune else "unmanaged", None, rule))
+    return plan
+
+
+def describe(rule):
+    return f"{rule['name']} {rule['start_port']}-{rule['end_port']}/{rule['protocol']} -> {rule['ip']}"
+
+
+def print_plan(plan):
+    """Print the plan, one line per rule, with the changed fields for updates."""
+    for action, desired, current in plan:
+        rule = desired or current
+        line = f"{action:<10} {describe(rule)}"
+        if action == "update":
+            changes = ", ".join(f"{field}: {current.get(field)} -> {desired.get(field)}"
+                                for field in rule_differences(current, desired))
+            line += f" ({changes})"
+        log(line, ACTION_SYMBOLS[action])
+    counts = {action: sum(1 for step in plan if step[0] == action) for action in ACTION_SYMBOLS}
+    log(", ".join(f"{count} {action}" for action, count in counts.items()), "+")
+
+
+def apply_plan(backend, plan):
+    """Apply the add, update and delete steps; return (action, rule, ok, error) per change."""
+    results = []
+    # Updates address rules by index, so they go before deletes, which may
+    # renumber the table. Deletes run from the highest index down so the
+    # remaining indexes stay valid, and adds go last.
+    updates = [step for step in plan if step[0] == "update"]
+    deletes = sorted((step for step in plan if step[0] == "delete"),
+                     key=lambda step: step[2]["index"], reverse=True)
+    adds = [step for step in plan if step[0] == "add"]
+    for action, desired, current in updates + deletes + adds:
+        rule = desired or current
+        try:
+            if action == "add":
+                ok = backend.add_port_forward(desired)
+            elif action == "update":
+                ok = backend.update_port_forward(desired)
+            else:
+                ok = backend.delete_port_forward(current)
+            error = None if ok else "not applied"
+        except Exception as e:
+            ok, error = False, str(e)
+        log(f"{action} {rule['name']}: {'done' if ok else error}", "+" if ok else "-")
+        results.append((action, rule, ok, error))
+    return results
+
+
+def reconcile(backend, desired_rules, prune=False, dry_run=False, key=name_key):
+    """Read the modem's table, print the plan and apply it unless this is a dry run."""
+    plan = plan_changes(backend.list_port_forwards(), desired_rules, prune, key)
+    print_plan(plan)
+    if dry_run:
+        log("Dry run, no changes made", "!")
+        return plan, []
+    if not any(step[0] in ("add", "update", "delete") for step in plan):
+        log("Modem already matches the desired state", "✓")
+        return plan, []
+    return plan, apply_plan(backend, plan)
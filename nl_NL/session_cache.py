@@ -0,0 +1,46 @@
+import threading
+import time
+
+from settings_store import state_path, read_json, write_json
+
+SESSION_CACHE_FILE = state_path("sessions.json")
+
+# Sessions older than this are not worth probing, the modem will have dropped them
+MAX_SESSION_AGE = 30 * 60
+
+# Fleet jobs update the cache from several threads
+cache_lock = threading.Lock()
+
+
+def _read_cache():
+    return read_json(SESSION_CACHE_FILE, {})
+
+
+def _write_cache(cache):
+    # write_json creates the file 0600, it holds live session tokens
+    write_json(SESSION_CACHE_FILE, cache)
+
+
+def load_session(gateway, backend):
+    """Return the saved session state for a gateway and backend, or None."""
+    with cache_lock:
+        entry = _read_cache().get(gateway, {}).get(backend)
+    if not entry or time.time() - entry.get("saved_at", 0) > MAX_SESSION_AGE:
+        return None
+    return entry["state"]
+
+
+def save_session(gateway, backend, state):
+    """Store the session state (cookies and tokens) for a gateway and backend."""
+    with cache_lock:
+        cache = _read_cache()
+        cache.setdefault(gateway, {})[backend] = {"saved_at": time.time(), "state": state}
+        _write_cache(cache)
+
+
+def forget_session(gateway, backend):
+    """Drop a saved session, e.g. after the modem rejected it."""
+    with cache_lock:
+        cache = _read_cache()
+        if cache.get(gateway, {}).pop(backend, None) is not None:
+            _write_cache(cache)
@@ -0,0 +1,192 @@
+"""Timeouts for browser waits, learned from how long each step usually takes.
+
+Every wait names its step ("login page", "system information", ...). Until a
+step has enough recorded durations for the current modem model it gets its
+default timeout, the fixed values the script used to hard-code. After that
+the timeout is a multiple of the step's p99, never above the default, so a
+stalled step fails after seconds instead of the full half minute. Durations
+are kept per model in ``~/.ispf/waits.json``; those of a modem on a loopback
+address (the mock, benchmarks) are not recorded.
+"""
+import ipaddress
+import math
+import threading
+import time
+
+from settings_store import state_path, read_json, write_json
+
+WAIT_HISTORY_FILE = state_path("waits.json")
+
+DEFAULT_TIMEOUTS = {
+    "login page": 30,
+    "login form": 30,
+    "login redirect": 30,
+    "session check": 5,
+    "dashboard": 30,
+    "system information": 60,
+    "loading overlay": 30,
+    "device list": 30,
+    "nat menu": 10,
+    "rule form": 10,
+    "element": 30,
+}
+FALLBACK_TIMEOUT = 30
+
+# A step needs this many recorded durations before its timeout is learned
+MIN_SAMPLES = 5
+# Samples kept per model and step
+MAX_SAMPLES = 100
+TIMEOUT_MULTIPLIER = 3
+MIN_TIMEOUT = 3.0
+MIN_POLL = 0.05
+MAX_POLL = 0.5
+
+
+class StepStalled(Exception):
+    """Raised when a wait runs past its timeout or its failure condition is met."""
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * fraction)) - 1]
+
+
+class WaitPolicy:
+    """Per-step timeouts and poll intervals, with the modem model tracked per thread."""
+
+    def __init__(self, history_file=WAIT_HISTORY_FILE):
+        self.history_file = history_file
+        self.history = None
+        self.recorded = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def set_model(self, model):
+        """Use the history of ``model`` for the waits on this thread."""
+        self.local.model = model or "unknown"
+
+    def set_deadline(self, deadline):
+        """Cut every wait on this thread off at ``deadline``, a time.monotonic() value (None: no limit)."""
+        self.local.deadline = deadline
+
+    def capped(self, step, timeout):
+        """The timeout, shortened to what is left before the thread's deadline."""
+        deadline = getattr(self.local, "deadline", None)
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise StepStalled(f"{step} was not started, the deadline has passed")
+        return min(timeout, remaining)
+
+    def set_host(self, host):
+        """Record the waits on this thread only when the modem at ``host`` is not on a loopback address."""
+        self.local.recording = not is_loopback(host)
+
+    @property
+    def model(self):
+        return getattr(self.local, "model", "unknown")
+
+    def _load(self):
+        if self.history is None:
+            self.history = read_json(self.history_file, {})
+        return self.history
+
+    def samples(self, step):
+        with self.lock:
+            return list(self._load().get(self.model, {}).get(step, []))
+
+    def timeout(self, step):
+        """The learned timeout of a step in seconds, or its default while there is too little history."""
+        default = DEFAULT_TIMEOUTS.get(step, FALLBACK_TIMEOUT)
+        samples = self.samples(step)
+        if len(samples) < MIN_SAMPLES:
+            return default
+        return min(default, max(MIN_TIMEOUT, percentile(samples, 0.99) * TIMEOUT_MULTIPLIER))
+
+    def poll_frequency(self, step):
+        """Poll about ten times during a typical wait, within MIN_POLL and MAX_POLL."""
+        samples = self.samples(step)
+        if not samples:
+            return 0.1
+        return min(MAX_POLL, max(MIN_POLL, percentile(samples, 0.5) / 10))
+
+    def record(self, step, seconds):
+        if not getattr(self.local, "recording", True):
+            return
+        with self.lock:
+            steps = self._load().setdefault(self.model, {})
+            steps[step] = (steps.get(step, []) + [round(seconds, 3)])[-MAX_SAMPLES:]
+            self.recorded = True
+
+    def stalled(self, step, timeout, reason=None):
+        samples = self.samples(step)
+        usual = f", it usually takes {percentile(samples, 0.5):.1f}s" if samples else ""
+        return StepStalled(f"{step} {reason or f'did not finish within {timeout:.1f}s'}{usual}")
+
+    def wait(self, driver, step, condition, fail_when=None, timeout=None):
+        """Wait until ``condition(driver)`` is truthy and return its value.
+
+        ``fail_when(driver)`` is checked on every poll; when it returns a
+        reason the wait stops right away with StepStalled instead of running
+        into the timeout.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        timeout = self.capped(step, timeout or self.timeout(step))
+
+        def check(driver):
+            if fail_when is not None:
+                reason = fail_when(driver)
+                if reason:
+                    raise self.stalled(step, timeout, reason)
+            return condition(driver)
+
+        started = time.monotonic()
+        try:
+            result = WebDriverWait(driver, timeout, self.poll_frequency(step)).until(check)
+        except TimeoutException:
+            raise self.stalled(step, timeout) from None
+        self.record(step, time.monotonic() - started)
+        return result
+
+    def run_async_script(self, driver, step, script, *args):
+        """Run an async script with the step's timeout and record how long it took."""
+        from selenium.common.exceptions import TimeoutException
+
+        timeout = self.capped(step, self.timeout(step))
+        driver.set_script_timeout(timeout)
+        started = time.monotonic()
+        try:
+            result = driver.execute_async_script(script, *args)
+        except TimeoutException:
+            raise self.stalled(step, timeout) from None
+        self.record(step, time.monotonic() - started)
+        return result
+
+    def save(self):
+        """Merge this run's durations into the history file."""
+        with self.lock:
+            if not self.recorded:
+                return
+            stored = read_json(self.history_file, {})
+            # Another run may have saved in the meantime; our in-memory lists already
+            # hold what was on disk when we loaded, plus this run's samples
+            for model, steps in self.history.items():
+                stored.setdefault(model, {}).update(steps)
+            write_json(self.history_file, stored, indent=None)
+            self.recorded = False
+
+
+# Shared by every browser on this process; the model is tracked per thread
+wait_policy = WaitPolicy()
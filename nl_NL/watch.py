@@ -0,0 +1,231 @@
+"""Keep port forwards pointed at their hosts when DHCP hands out a new address.
+
+``odido.py --watch`` logs in once and keeps running. Every rule on the
+modem is bound to the MAC address that held its IP when the watch started
+(or when the rule first showed up). The bindings are kept per gateway in
+``~/.ispf/watch.json``, so a restart still knows which host a rule belongs
+to after that host moved.
+
+Two sources are watched:
+
+- The local neighbour table, every second. Reading it costs nothing on the
+  modem. It only sees hosts this machine talks to, and it can hold stale
+  entries, so a watched MAC turning up at a new address only triggers an
+  early modem poll.
+- The modem's connected-device list. It is the authority on which address
+  a MAC holds. It is polled every MIN_INTERVAL seconds after a change and
+  for OFFLINE_GRACE seconds after a watched host goes offline, when a lease
+  is probably being renewed. While nothing happens, the interval grows by
+  BACKOFF up to MAX_INTERVAL.
+
+The NAT table is only read at the start, when a watched host moved, and
+every REBIND_INTERVAL to pick up new rules. Only the rules of the host that
+moved are rewritten.
+"""
+import threading
+import time
+
+import netinfo
+from device_list import normalize_status
+from console import log
+from settings_store import state_path, read_json, write_json
+from tracing import span
+
+WATCH_FILE = state_path("watch.json")
+
+NEIGHBOR_INTERVAL = 1.0
+MIN_INTERVAL = 5.0
+MAX_INTERVAL = 120.0
+BACKOFF = 1.5
+OFFLINE_GRACE = 300.0
+REBIND_INTERVAL = 600.0
+
+
+def rule_key(rule):
+    # The address is left out on purpose, it is what changes
+    return f"{rule['name']}:{rule['start_port']}-{rule['end_port']}/{rule['protocol']}"
+
+
+def load_bindings(gateway, path=WATCH_FILE):
+    """Return the stored {rule key: {"mac", "ip"}} bindings of a gateway."""
+    return read_json(path, {}).get(gateway, {})
+
+
+def save_bindings(gateway, bindings, path=WATCH_FILE):
+    stored = read_json(path, {})
+    stored[gateway] = bindings
+    write_json(path, stored)
+
+
+class ForwardWatcher:
+    """Re-targets port forwards on one modem when a bound host changes address."""
+
+    def __init__(self, backend, gateway, relogin=None, bindings_file=WATCH_FILE,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, neighbor_interval=NEIGHBOR_INTERVAL):
+        self.backend = backend
+        self.gateway = gateway
+        # Called when the modem stops accepting the session, should log in again
+        self.relogin = relogin
+        self.bindings_file = bindings_file
+        self.bindings = load_bindings(gateway, bindings_file)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.neighbor_interval = neighbor_interval
+        self.interval = min_interval
+        self.stopping = threading.Event()
+        self.rewrites = 0
+        # MAC -> time.monotonic() when a watched host was first seen offline
+        self.offline_since = {}
+        self.last_hint = None
+
+    def watched_macs(self):
+        return {binding["mac"]: binding["ip"] for binding in self.bindings.values()}
+
+    def modem_addresses(self):
+        """Return {mac: ip} of the hosts the modem lists as active."""
+        with span("watch device list"):
+            devices = self.backend.get_connected_devices()
+        return {str(device["mac"]).lower(): device["ip"] for device in devices
+                if device.get("mac") and device.get("ip") and normalize_status(device.get("status")) != "inactive"}
+
+    def bind(self, rules, active):
+        """Bind rules that have no binding yet to the MAC now holding their address."""
+        by_ip = {ip: mac for mac, ip in active.items()}
+        for mac, ips in netinfo.get_neighbors().items():
+            if len(ips) == 1:
+                by_ip.setdefault(ips[0], mac)
+        keys = set()
+        added = 0
+        for rule in rules:
+            key = rule_key(rule)
+            keys.add(key)
+            if key not in self.bindings and rule["ip"] in by_ip:
+                self.bindings[key] = {"mac": by_ip[rule["ip"]], "ip": rule["ip"]}
+                added += 1
+        # Rules deleted from the modem are not watched any longer
+        removed = [key for key in self.bindings if key not in keys]
+        for key in removed:
+            del self.bindings[key]
+        if added or removed:
+            save_bindings(self.gateway, self.bindings, self.bindings_file)
+        unbound = len(rules) - sum(1 for rule in rules if rule_key(rule) in self.bindings)
+        return added, unbound
+
+    def retarget(self, moved):
+        """Rewrite the rules bound to the MACs in ``moved`` ({mac: new ip}); return how many were changed."""
+        changed = 0
+        with span("watch retarget", hosts=len(moved)):
+            for rule in self.backend.list_port_forwards():
+                binding = self.bindings.get(rule_key(rule))
+                if binding is None or binding["mac"] not in moved:
+                    continue
+                new_ip = moved[binding["mac"]]
+                if rule["ip"] != new_ip:
+                    if not self.backend.update_port_forward({**rule, "ip": new_ip}):
+                        log(f"Could not point '{rule['name']}' at {new_ip}", "-")
+                        continue
+                    log(f"Port forward '{rule['name']}' moved from {rule['ip']} to {new_ip} "
+                        f"({binding['mac']})", "+")
+                    changed += 1
+                binding["ip"] = new_ip
+        save_bindings(self.gateway, self.bindings, self.bindings_file)
+        self.rewrites += changed
+        return changed
+
+    def neighbor_hint(self):
+        """Whether the local neighbour table newly shows a watched host at another address."""
+        neighbors = netinfo.get_neighbors()
+        hint = tuple(sorted((mac, tuple(neighbors[mac])) for mac, ip in self.watched_macs().items()
+                            if neighbors.get(mac) and ip not in neighbors[mac]))
+        # The same stale entry must not make every tick poll the modem
+        if hint and hint != self.last_hint:
+            self.last_hint = hint
+            return True
+        return False
+
+    def poll(self):
+        """Check the modem's device list once and re-target what moved; returns the next interval."""
+        active = self.modem_addresses()
+        watched = self.watched_macs()
+        moved = {mac: active[mac] for mac, ip in watched.items() if mac in active and active[mac] != ip}
+        now = time.monotonic()
+        for mac in [mac for mac in self.offline_since if mac not in watched]:
+            del self.offline_since[mac]
+        for mac in watched:
+            if mac in active:
+                self.offline_since.pop(mac, None)
+            else:
+                self.offline_since.setdefault(mac, now)
+        # A host that stays away for long is simply off, not renewing its lease
+        renewing = any(now - since < OFFLINE_GRACE for since in self.offline_since.values())
+        if moved:
+            self.retarget(moved)
+        if moved or renewing:
+            # Something is in flux, look again soon
+            return self.min_interval
+        return min(self.max_interval, self.interval * BACKOFF)
+
+    def recover(self, error):
+        """Log in again after a failed poll; returns whether the backend is usable."""
+        log(f"Watch poll failed: {error}", "-")
+        try:
+            if self.backend.is_logged_in():
+                return True
+            if self.relogin is not None and self.relogin():
+                log("Logged in again", "+")
+                return True
+        except Exception as e:
+            log(f"Logging in again failed: {e}", "-")
+        return False
+
+    def start(self):
+        """Bind the current rules; returns the number of watched rules."""
+        with span("watch bind"):
+            active = self.modem_addresses()
+            rules = self.backend.list_port_forwards()
+            added, unbound = self.bind(rules, active)
+        # Hosts that moved while the watch was not running
+        moved = {mac: active[mac] for mac, ip in self.watched_macs().items() if mac in active and active[mac] != ip}
+        if moved:
+            self.retarget(moved)
+        if unbound:
+            log(f"Not watching {unbound} rule{'s' if unbound != 1 else ''} whose address no known host holds", "!")
+        return len(self.bindings)
+
+    def run(self):
+        """Watch until stop() is called."""
+        watched = self.start()
+        log(f"Watching {watched} port forward{'s' if watched != 1 else ''} on {self.gateway} "
+            f"(Ctrl+C to stop)", "+")
+        next_poll = time.monotonic() + self.interval
+        next_rebind = time.monotonic() + REBIND_INTERVAL
+        while not self.stopping.wait(self.neighbor_interval):
+            now = time.monotonic()
+            if now < next_poll and self.neighbor_hint():
+                next_poll = now
+            if now < next_poll:
+                continue
+            try:
+                with span("watch poll", interval=round(self.interval, 1)):
+                    if now >= next_rebind:
+                        active = self.modem_addresses()
+                        self.bind(self.backend.list_port_forwards(), active)
+                        next_rebind = now + REBIND_INTERVAL
+                    self.interval = self.poll()
+            except Exception as e:
+                self.interval = self.min_interval if self.recover(e) else self.max_interval
+            next_poll = time.monotonic() + self.interval
+
+    def stop(self):
+        self.stopping.set()
+
+
+def run_watch(backend, gateway, relogin=None):
+    """Entry point for ``odido.py --watch``; returns the number of rules re-targeted."""
+    watcher = ForwardWatcher(backend, gateway, relogin)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    log(f"Stopped watching, {watcher.rewrites} rule{'s' if watcher.rewrites != 1 else ''} re-targeted", "+")
+    return watcher.rewrites
@@ -0,0 +1,210 @@
+"""Deliver webhook notifications in the background.
+
+Notifications are written to a spool directory before they are queued, so a
+crash or an early exit leaves them on disk and the next run sends them. A
+single worker thread posts them over one pooled requests session, waits out
+429 responses for as long as Discord's ``retry_after`` asks and backs off
+exponentially on other failures. ``flush`` waits for the queue to drain up to
+a deadline; whatever is left stays spooled.
+"""
+import atexit
+import base64
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+
+from console import log
+from settings_store import state_path, read_json, write_json
+
+SPOOL_DIR = state_path("webhooks")
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+REQUEST_TIMEOUT = 10
+FLUSH_TIMEOUT = 10
+
+
+class WebhookQueue:
+    """Spooled, retrying webhook sender with one worker thread."""
+
+    def __init__(self, spool_dir=SPOOL_DIR, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, timeout=REQUEST_TIMEOUT):
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.idle = threading.Condition()
+        self.stopping = threading.Event()
+        self.worker = None
+        self.session = None
+
+    def start(self):
+        """Start the worker and queue the notifications an earlier run left behind."""
+        if self.worker is not None:
+            return self
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".json"):
+                self._put(os.path.join(self.spool_dir, name))
+        self.worker = threading.Thread(target=self._run, name="webhook-queue", daemon=True)
+        self.worker.start()
+        return self
+
+    def enqueue(self, url, payload, attachment_path=None, attachment_name=None):
+        """Spool a notification and queue it; returns immediately."""
+        entry = {"url": url, "payload": payload, "attempts": 0}
+        if attachment_path:
+            # The file may be overwritten before the worker gets to it
+            with open(attachment_path, "rb") as file:
+                entry["attachment"] = {
+                    "name": attachment_name or os.path.basename(attachment_path),
+                    "data": base64.b64encode(file.read()).decode(),
+                }
+        path = os.path.join(self.spool_dir, f"{time.time_ns()}-{secrets.token_hex(4)}.json")
+        self._write_entry(path, entry)
+        self._put(path)
+        return path
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Wait until the queue is empty or ``timeout`` passes; return the number still pending."""
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.idle.wait(remaining)
+            return self.pending
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """Flush, then stop the worker. Unsent notifications stay in the spool."""
+        left = self.flush(timeout)
+        if left:
+            log(f"{left} webhook notification(s) not sent yet, they will be retried on the next run", "!")
+        self.stopping.set()
+        if self.session is not None:
+            self.session.close()
+
+    def _put(self, path):
+        with self.idle:
+            self.pending += 1
+        self.queue.put(path)
+
+    def _done(self):
+        with self.idle:
+            self.pending -= 1
+            self.idle.notify_all()
+
+    def _write_entry(self, path, entry):
+        # write_json keeps the file private to the user, the URL embeds the webhook token
+        write_json(path, entry, indent=None)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                path = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._deliver(path)
+            except Exception as e:
+                log(f"Error sending webhook data: {e}", "-")
+            finally:
+                self._done()
+
+    def _deliver(self, path):
+        entry = read_json(path)
+        if entry is None:
+            # Unreadable spool entries would fail forever
+            self._discard(path)
+            return
+
+        while entry["attempts"] < self.max_attempts and not self.stopping.is_set():
+            entry["attempts"] += 1
+            try:
+                response = self._post(entry)
+            except Exception as e:
+                delay, reason = self._backoff(entry["attempts"]), str(e)
+            else:
+                if 200 <= response.status_code < 300:
+                    log(f"Webhook sent successfully. Status code: {response.status_code}", "+")
+                    self._discard(path)
+                    return
+                if response.status_code == 429:
+                    delay, reason = retry_after(response, self._backoff(entry["attempts"])), "rate limited"
+                elif response.status_code >= 500:
+                    delay, reason = self._backoff(entry["attempts"]), f"status code {response.status_code}"
+                else:
+                    # Other client errors will not go away by retrying
+                    log(f"Failed to send webhook. Status code: {response.status_code}, response:\n{response.text}", "-")
+                    self._discard(path)
+                    return
+            self._write_entry(path, entry)
+            if entry["attempts"] < self.max_attempts:
+                log(f"Webhook not sent ({reason}), retrying in {delay:.1f}s", "!")
+                self.stopping.wait(delay)
+
+        if entry["attempts"] >= self.max_attempts:
+            log(f"Giving up on webhook after {entry['attempts']} attempts", "-")
+            self._discard(path)
+
+    def _post(self, entry):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        attachment = entry.get("attachment")
+        if attachment:
+            files = {"file": (attachment["name"], base64.b64decode(attachment["data"]), "image/png")}
+            data = {"payload_json": json.dumps(entry["payload"])}
+            return self.session.post(entry["url"], data=data, files=files, timeout=self.timeout)
+        return self.session.post(entry["url"], json=entry["payload"], timeout=self.timeout)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps fleet runs from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def retry_after(response, default):
+    """Seconds to wait after a 429, from Discord's JSON body or the Retry-After header."""
+    try:
+        return float(response.json()["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return default
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Return the process-wide queue, started on first use and flushed at exit."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WebhookQueue().start()
+            atexit.register(_queue.close)
+        return _queue
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """Flush the process-wide queue if anything was queued in this process."""
+    if _queue is not None:
+        _queue.flush(timeout)
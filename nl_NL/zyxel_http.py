@@ -0,0 +1,198 @@
+import base64
+import requests
+import urllib3
+
+from tracing import span
+
+# The modem serves a self-signed certificate, the browser path ignores it as well
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+PROTOCOLS = {"TCP": "TCP", "UDP": "UDP", "BOTH": "ALL"}
+
+
+class ZyxelError(Exception):
+    """Raised when the modem rejects or fails an HTTP request."""
+
+
+def format_uptime(seconds):
+    """Format an uptime in seconds the way the web UI shows it."""
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{days} dagen {hours} uur {minutes} minuten {seconds} seconden"
+
+
+def rule_to_dal(rule):
+    """Convert a port forward rule to the modem's NAT object."""
+    return {
+        "Enable": bool(rule.get("enabled", True)),
+        "Protocol": PROTOCOLS[rule["protocol"].upper()],
+        "Description": rule["name"],
+        "Interface": rule.get("interface", ""),
+        "ExternalPortStart": int(rule["start_port"]),
+        "ExternalPortEnd": int(rule["end_port"]),
+        "InternalPortStart": int(rule["start_port"]),
+        "InternalPortEnd": int(rule["end_port"]),
+        "InternalClient": rule["ip"],
+    }
+
+
+def rule_from_dal(obj):
+    """Convert a NAT object from the modem to a port forward rule."""
+    protocol = {value: key for key, value in PROTOCOLS.items()}.get(obj.get("Protocol"), obj.get("Protocol"))
+    return {
+        "index": obj.get("Index"),
+        "name": obj.get("Description", ""),
+        "start_port": int(obj.get("ExternalPortStart", 0)),
+        "end_port": int(obj.get("ExternalPortEnd", 0)),
+        "ip": obj.get("InternalClient", ""),
+        "protocol": protocol,
+        "enabled": bool(obj.get("Enable", False)),
+    }
+
+
+def device_from_dal(obj):
+    """Convert a LAN host object from the modem to a device record."""
+    return {
+        "name": obj.get("HostName", ""),
+        "ip": obj.get("IPAddress", ""),
+        "mac": obj.get("PhysAddress", ""),
+        "interface": obj.get("X_ZYXEL_ConnectionType", ""),
+        "status": "active" if obj.get("Active") else "inactive",
+    }
+
+
+class ZyxelHttpClient:
+    """Talk to the Zyxel web UI endpoints directly, without a browser.
+
+    Uses the same JSON/CGI calls the UI makes: ``/UserLogin`` to log in,
+    ``cgi-bin/loginAccountLevel`` to check the session and the
+    ``cgi-bin/DAL`` objects for system information and NAT rules.
+    """
+
+    name = "http"
+
+    def __init__(self, gateway, scheme="https", timeout=10, session=None):
+        self.base_url = f"{scheme}://{gateway}"
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.verify = False
+        self.session_key = None
+        # Leave the session open on close so it can be reused by a later run
+        self.keep_session = False
+
+    def _request(self, method, path, check=True, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if self.session_key:
+            headers["CSRFToken"] = self.session_key
+        oid = kwargs.get("params", {}).get("oid")
+        with span(f"http {method} {path}" + (f"?oid={oid}" if oid else ""), "call") as current:
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", headers=headers, timeout=self.timeout, **kwargs
+                )
+            except requests.RequestException as e:
+                raise ZyxelError(f"{method} {path} failed: {e}") from e
+            current.set(status=response.status_code)
+        if response.status_code != 200:
+            raise ZyxelError(f"{method} {path} returned status {response.status_code}")
+        try:
+            body = response.json()
+        except ValueError as e:
+            raise ZyxelError(f"{method} {path} returned invalid JSON") from e
+        if check and body.get("result") != "ZCFG_SUCCESS":
+            raise ZyxelError(f"{method} {path} failed: {body.get('result')}")
+        return body
+
+    def _dal(self, method, oid, **kwargs):
+        params = kwargs.pop("params", {})
+        params["oid"] = oid
+        return self._request(method, "/cgi-bin/DAL", params=params, **kwargs)
+
+    def login(self, username, password):
+        """Log in and keep the session key for later requests.
+
+        Returns False when the modem rejects the credentials and raises
+        ZyxelError when the login endpoint itself is unusable.
+        """
+        payload = {
+            "Input_Account": username,
+            "Input_Passwd": base64.b64encode(password.encode()).decode(),
+            "currLang": "nl",
+            "RememberPassword": 0,
+            "SHA512_password": False,
+        }
+        body = self._request("POST", "/UserLogin", check=False, json=payload)
+        if body.get("result") != "ZCFG_SUCCESS":
+            return False
+        self.session_key = body.get("sessionkey")
+        return True
+
+    def is_logged_in(self):
+        """Check whether the current session is still accepted by the modem."""
+        try:
+            self._request("GET", "/cgi-bin/loginAccountLevel")
+            return True
+        except ZyxelError:
+            return False
+
+    def export_session(self):
+        """Return the cookies and session key so the session can be reused later."""
+        return {
+            "cookies": requests.utils.dict_from_cookiejar(self.session.cookies),
+            "session_key": self.session_key,
+        }
+
+    def restore_session(self, state):
+        """Reuse a session saved with export_session, without logging in."""
+        self.session.cookies.update(state.get("cookies", {}))
+        self.session_key = state.get("session_key")
+
+    def logout(self):
+        try:
+            self._request("POST", "/cgi-bin/UserLogout")
+        except ZyxelError:
+            pass
+        self.session_key = None
+
+    def get_system_information(self):
+        """Return the same fields the dashboard shows in ``#card_sys``."""
+        obj = self._dal("GET", "cardpage_status")["Object"][0]
+        return {
+            "model_name": obj.get("ModelName", ""),
+            "firmware_version": obj.get("SoftwareVersion", ""),
+            "uptime": format_uptime(obj.get("UpTime", 0)),
+            "mac_address": obj.get("MACAddress", ""),
+            "ethernet_wan": obj.get("WanStatus", ""),
+        }
+
+    def get_connected_devices(self):
+        """Return the hosts the modem lists under Connected Devices."""
+        objects = self._dal("GET", "lanhosts").get("Object", [])
+        hosts = objects[0].get("lanhosts", []) if objects else []
+        return [device_from_dal(obj) for obj in hosts]
+
+    def list_port_forwards(self):
+        return [rule_from_dal(obj) for obj in self._dal("GET", "nat").get("Object", [])]
+
+    def add_port_forward(self, rule):
+        self._dal("POST", "nat", json=rule_to_dal(rule))
+        return True
+
+    def update_port_forward(self, rule):
+        """Overwrite the modem's rule with the same index."""
+        obj = rule_to_dal(rule)
+        obj["Index"] = rule["index"]
+        self._dal("PUT", "nat", json=obj)
+        return True
+
+    def delete_port_forward(self, rule):
+        self._dal("DELETE", "nat", params={"Index": rule["index"]})
+        return True
+
+    def close(self):
+        # Without a session key there is nothing to log out of
+        if self.session_key and not self.keep_session:
+            self.logout()
+        self.session.close()
@@ -0,0 +1,414 @@
+"""Local stand-in for the Zyxel modem, so both backends can run offline.
+
+Run it with ``python nl_NL/zyxel_mock.py --port 8080`` and point odido.py at it
+with ``--gateway 127.0.0.1:8080 --scheme http``. Besides the DAL endpoints it
+serves the login page, the dashboard and the NAT page with the element IDs the
+browser backend uses. ``--delay``, ``--failure-rate`` and ``--drop-rate`` slow
+down or break requests, ``--spinner-delay`` sets how long the dashboard shows
+its loading state, and ``--seed`` makes the injected failures repeatable.
+"""
+import argparse
+import base64
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockModem:
+    """State of the fake modem: accounts, sessions and the NAT table."""
+
+    def __init__(self, username="admin", password="admin", delay=0.0, failure_rate=0.0,
+                 drop_rate=0.0, spinner_delay=0.5, seed=None):
+        self.username = username
+        self.password = password
+        # Added to every response, in seconds
+        self.delay = delay
+        # Fraction of requests answered with a 500, and dropped without any answer
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        # How long the dashboard shows its placeholder uptime and LoadingBox
+        self.spinner_delay = spinner_delay
+        self.random = random.Random(seed)
+        self.sessions = set()
+        self.rules = []
+        self.next_index = 1
+        self.hosts = [
+            {"HostName": "laptop", "IPAddress": "192.168.1.20", "PhysAddress": "A4:83:E7:12:34:56",
+             "X_ZYXEL_ConnectionType": "802.11", "Active": True},
+            {"HostName": "nas", "IPAddress": "192.168.1.10", "PhysAddress": "00:11:32:AB:CD:EF",
+             "X_ZYXEL_ConnectionType": "Ethernet", "Active": True},
+            {"HostName": "phone", "IPAddress": "192.168.1.31", "PhysAddress": "F0:99:B6:01:02:03",
+             "X_ZYXEL_ConnectionType": "802.11", "Active": False},
+        ]
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def injected_fault(self):
+        """Return "drop", "fail" or None for the next request."""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.drop_rate:
+            return "drop"
+        if roll < self.drop_rate + self.failure_rate:
+            return "fail"
+        return None
+
+    def system_information(self):
+        return {
+            # Not the real model name, so its timings never mix with a real modem's
+            "ModelName": "EX5601-T0 (mock)",
+            "SoftwareVersion": "V5.70(ACDZ.0)C0",
+            "UpTime": int(time.time() - self.started),
+            "MACAddress": "AA:BB:CC:DD:EE:FF",
+            "WanStatus": "Up",
+        }
+
+
+PAGE_SCRIPT = """
+const session = (document.cookie.match(/(?:^|; )Session=([^;]*)/) || [])[1];
+const api = (method, oid, body, query = '') => fetch(`/cgi-bin/DAL?oid=${oid}${query}`, {
+    method, headers: {'CSRFToken': session, 'Content-Type': 'application/json'},
+    body: body && JSON.stringify(body)
+}).then(response => response.json());
+const show = (id, shown) => document.getElementById(id).style.display = shown ? 'block' : 'none';
+"""
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>__MODEL__</title></head><body>
+<div id="cardpage"><h3>__MODEL__</h3></div>
+<form id="loginForm">
+  <input id="username" type="text" autocomplete="username">
+  <input id="userpassword" type="password" autocomplete="current-password">
+  <button id="loginBtn" type="submit">Inloggen</button>
+  <div id="loginError" style="display:none">Invalid Username or Password</div>
+</form>
+<script>
+document.getElementById('loginForm').addEventListener('submit', async event => {
+    event.preventDefault();
+    const response = await fetch('/UserLogin', {method: 'POST', headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({Input_Account: document.getElementById('username').value,
+                              Input_Passwd: btoa(document.getElementById('userpassword').value)})});
+    const body = await response.json();
+    if (body.result === 'ZCFG_SUCCESS') {
+        document.cookie = 'Session=' + body.sessionkey + '; path=/';
+        location.href = '/';
+    } else {
+        document.getElementById('loginError').style.display = 'block';
+    }
+});
+</script>
+</body></html>
+"""
+
+MENU = """
+<div id="h_menu_list">Menu</div>
+<ul id="menu" style="display:none">
+  <li><a href="#network">Netwerkinstelling</a>
+    <ul id="network" style="display:none"><li><a href="/NAT">NAT</a></li></ul>
+  </li>
+</ul>
+<script>
+document.getElementById('h_menu_list').onclick = () => show('menu', true);
+document.querySelector("a[href='#network']").onclick = event => { event.preventDefault(); show('network', true); };
+</script>
+"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><title>Dashboard</title></head><body>
+<div id="LoadingBox" style="position:fixed;top:0;left:0;width:100%;height:100%;background:#fff">Laden...</div>
+<script>__PAGE_SCRIPT__</script>
+__MENU__
+<div id="card_sys">
+  <div id="card_sysinfo_modelname"></div>
+  <div id="card_sysinfo_fwversion"></div>
+  <div id="card_sysinfo_systime">0 dagen 0 uur 0 minuten 0 seconden</div>
+  <div id="card_sysinfo_macaddr"></div>
+  <div id="card_sysinfo_wan"></div>
+</div>
+<div id="card_cnt">Verbonden apparaten</div>
+<div id="devicePanel" style="display:none">
+  <ul class="nav"><li class="nav-item"><a id="tab_List_Tab" href="#tab_List">Lijst</a></li></ul>
+  <div id="tab_List" style="display:none">
+    <table><thead><tr><th>Naam</th><th>IP-adres</th><th>MAC-adres</th><th>Verbinding</th><th>Status</th></tr></thead>
+    <tbody></tbody></table>
+  </div>
+</div>
+<script>
+const uptime = seconds => {
+    const days = Math.floor(seconds / 86400), hours = Math.floor(seconds % 86400 / 3600);
+    return `${days} dagen ${hours} uur ${Math.floor(seconds % 3600 / 60)} minuten ${seconds % 60} seconden`;
+};
+setTimeout(async () => {
+    const info = (await api('GET', 'cardpage_status')).Object[0];
+    document.getElementById('card_sysinfo_modelname').innerText = info.ModelName;
+    document.getElementById('card_sysinfo_fwversion').innerText = info.SoftwareVersion;
+    document.getElementById('card_sysinfo_systime').innerText = uptime(info.UpTime);
+    document.getElementById('card_sysinfo_macaddr').innerText = info.MACAddress;
+    document.getElementById('card_sysinfo_wan').innerText = info.WanStatus;
+    show('LoadingBox', false);
+}, __SPINNER_MS__);
+document.getElementById('card_cnt').onclick = async () => {
+    show('LoadingBox', true);
+    const hosts = (await api('GET', 'lanhosts')).Object[0].lanhosts;
+    document.querySelector('#tab_List tbody').innerHTML = hosts.map(host =>
+        `<tr><td>${host.HostName}</td><td>${host.IPAddress}</td><td>${host.PhysAddress}</td>` +
+        `<td>${host.X_ZYXEL_ConnectionType}</td><td>${host.Active ? 'Actief' : 'Inactief'}</td></tr>`).join('');
+    show('devicePanel', true);
+    show('LoadingBox', false);
+};
+document.getElementById('tab_List_Tab').onclick = event => { event.preventDefault(); show('tab_List', true); };
+</script>
+</body></html>
+"""
+
+NAT_PAGE = """<!DOCTYPE html>
+<html><head><title>NAT</title></head><body>
+<script>__PAGE_SCRIPT__</script>
+__MENU__
+<div id="portFwdAdd">Nieuwe regel toevoegen</div>
+<table id="portFwdTable">
+  <thead><tr><th>Status</th><th>Naam</th><th>WAN-interface</th><th>Startpoort</th><th>Eindpoort</th>
+  <th>Server-IP</th><th>Protocol</th><th></th></tr></thead>
+  <tbody></tbody>
+</table>
+<div id="dialog"></div>
+<script>
+let rules = [];
+const field = id => document.getElementById(id);
+const load = async () => {
+    rules = (await api('GET', 'nat')).Object;
+    document.querySelector('#portFwdTable tbody').innerHTML = rules.map(rule =>
+        `<tr data-index="${rule.Index}"><td><input type="checkbox" disabled ${rule.Enable ? 'checked' : ''}></td>` +
+        `<td>${rule.Description}</td><td>${rule.Interface || 'WAN'}</td><td>${rule.ExternalPortStart}</td>` +
+        `<td>${rule.ExternalPortEnd}</td><td>${rule.InternalClient}</td><td>${rule.Protocol}</td>` +
+        `<td><span id="portFwdEdit${rule.Index}">Bewerken</span> <span id="portFwdDelete${rule.Index}">Verwijderen</span></td></tr>`
+    ).join('');
+};
+const openForm = rule => {
+    field('dialog').innerHTML = `<div id="portFwdForm">
+      <label id="port_fwd_active"><input type="checkbox"> Actief</label>
+      <input id="srvName"><input id="eStart"><input id="eEnd">
+      <input id="a_srvAddr_1"><input id="a_srvAddr_2"><input id="a_srvAddr_3"><input id="a_srvAddr_4">
+      <select id="port_fwd_protocol"><option value="TCP">TCP</option><option value="UDP">UDP</option>
+      <option value="ALL">TCP/UDP</option></select>
+      <button id="ok" type="button">OK</button>
+      <button id="Network_NAT_PortForward_ApplyBtn" type="button">Toepassen</button></div>`;
+    if (rule) {
+        document.querySelector('#port_fwd_active input').checked = rule.Enable;
+        field('srvName').value = rule.Description;
+        field('eStart').value = rule.ExternalPortStart;
+        field('eEnd').value = rule.ExternalPortEnd;
+        rule.InternalClient.split('.').forEach((part, i) => field(`a_srvAddr_${i + 1}`).value = part);
+        field('port_fwd_protocol').value = rule.Protocol;
+    }
+    field('Network_NAT_PortForward_ApplyBtn').onclick = async () => {
+        const ip = [1, 2, 3, 4].map(i => field(`a_srvAddr_${i}`).value).join('.');
+        const body = {
+            Enable: document.querySelector('#port_fwd_active input').checked,
+            Protocol: field('port_fwd_protocol').value, Description: field('srvName').value, Interface: '',
+            ExternalPortStart: Number(field('eStart').value), ExternalPortEnd: Number(field('eEnd').value),
+            InternalPortStart: Number(field('eStart').value), InternalPortEnd: Number(field('eEnd').value),
+            InternalClient: ip
+        };
+        if (rule) body.Index = rule.Index;
+        await api(rule ? 'PUT' : 'POST', 'nat', body);
+        field('dialog').innerHTML = '';
+        await load();
+    };
+};
+field('portFwdAdd').onclick = () => openForm(null);
+document.querySelector('#portFwdTable tbody').onclick = event => {
+    const index = Number(event.target.closest('tr').dataset.index);
+    const rule = rules.find(rule => rule.Index === index);
+    if (event.target.id.startsWith('portFwdEdit')) openForm(rule);
+    if (event.target.id.startsWith('portFwdDelete')) {
+        field('dialog').innerHTML = '<div id="confirm">Regel verwijderen? <button id="ok" type="button">OK</button></div>';
+        field('ok').onclick = async () => {
+            await api('DELETE', 'nat', null, `&Index=${index}`);
+            field('dialog').innerHTML = '';
+            await load();
+        };
+    }
+};
+load();
+</script>
+</body></html>
+"""
+
+
+def render_page(template, modem):
+    page = template.replace("__MENU__", MENU).replace("__PAGE_SCRIPT__", PAGE_SCRIPT)
+    return (page.replace("__MODEL__", modem.system_information()["ModelName"])
+                .replace("__SPINNER_MS__", str(int(modem.spinner_delay * 1000))))
+
+
+class MockModemHandler(BaseHTTPRequestHandler):
+    server_version = "Zyxel-Mock"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def modem(self):
+        return self.server.modem
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_page(self, template):
+        data = render_page(template, self.modem).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _session_key(self):
+        # The HTTP backend sends the key as a header, the pages keep it in a cookie
+        key = self.headers.get("CSRFToken")
+        if not key:
+            cookies = dict(part.strip().split("=", 1) for part in (self.headers.get("Cookie") or "").split(";") if "=" in part)
+            key = cookies.get("Session")
+        return key
+
+    def _authorized(self):
+        return self._session_key() in self.modem.sessions
+
+    def _route(self, method):
+        if self.modem.delay:
+            time.sleep(self.modem.delay)
+        fault = self.modem.injected_fault()
+        if fault == "drop":
+            # Close without an answer, like a modem that resets the connection
+            self.close_connection = True
+            return
+        if fault == "fail":
+            return self._send_json({"result": "Injected Failure"}, status=500)
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if method == "GET" and url.path == "/login":
+            return self._send_page(LOGIN_PAGE)
+        if method == "GET" and url.path in ("/", "/NAT"):
+            if not self._authorized():
+                return self._redirect("/login")
+            return self._send_page(DASHBOARD_PAGE if url.path == "/" else NAT_PAGE)
+        if url.path == "/UserLogin" and method == "POST":
+            return self._login()
+        if not self._authorized():
+            return self._send_json({"result": "Invalid Session"}, status=401)
+        if url.path == "/cgi-bin/loginAccountLevel":
+            return self._send_json({"result": "ZCFG_SUCCESS", "loginLevel": "medium"})
+        if url.path == "/cgi-bin/UserLogout":
+            self.modem.sessions.discard(self._session_key())
+            return self._send_json({"result": "ZCFG_SUCCESS"})
+        if url.path == "/cgi-bin/DAL":
+            return self._dal(method, query)
+        self._send_json({"result": "Not Found"}, status=404)
+
+    def _login(self):
+        body = self._read_json()
+        password = base64.b64decode(body.get("Input_Passwd", "")).decode()
+        if body.get("Input_Account") != self.modem.username or password != self.modem.password:
+            return self._send_json({"result": "Invalid Username or Password"})
+        session_key = secrets.token_hex(16)
+        self.modem.sessions.add(session_key)
+        self._send_json({"result": "ZCFG_SUCCESS", "sessionkey": session_key})
+
+    def _dal(self, method, query):
+        oid = query.get("oid")
+        modem = self.modem
+        with modem.lock:
+            if oid == "cardpage_status" and method == "GET":
+                return self._send_json({"result": "ZCFG_SUCCESS", "Object": [modem.system_information()]})
+            if oid == "lanhosts" and method == "GET":
+                return self._send_json({"result": "ZCFG_SUCCESS", "Object": [{"lanhosts": modem.hosts}]})
+            if oid == "nat" and method == "GET":
+                return self._send_json({"result": "ZCFG_SUCCESS", "Object": modem.rules})
+            if oid == "nat" and method == "POST":
+                rule = self._read_json()
+                rule["Index"] = modem.next_index
+                modem.next_index += 1
+                modem.rules.append(rule)
+                return self._send_json({"result": "ZCFG_SUCCESS"})
+            if oid == "nat" and method == "PUT":
+                update = self._read_json()
+                for rule in modem.rules:
+                    if rule["Index"] == update.get("Index"):
+                        rule.update(update)
+                        return self._send_json({"result": "ZCFG_SUCCESS"})
+                return self._send_json({"result": "Object Not Found"})
+            if oid == "nat" and method == "DELETE":
+                index = int(query.get("Index", 0))
+                modem.rules = [rule for rule in modem.rules if rule["Index"] != index]
+                return self._send_json({"result": "ZCFG_SUCCESS"})
+        self._send_json({"result": "Not Found"}, status=404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def start_mock_server(host="127.0.0.1", port=0, modem=None):
+    """Start the mock modem in a background thread and return the server."""
+    server = ThreadingHTTPServer((host, port), MockModemHandler)
+    server.modem = modem or MockModem()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock Zyxel modem")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of requests closed without an answer")
+    parser.add_argument("--spinner-delay", type=float, default=0.5,
+                        help="Seconds the dashboard shows its loading state")
+    parser.add_argument("--seed", type=int, help="Seed for the injected failures")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockModemHandler)
+    server.modem = MockModem(args.username, args.password, args.delay, args.failure_rate,
+                             args.drop_rate, args.spinner_delay, args.seed)
+    print(f"Mock modem listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Terminal rendering helpers for the menus.
+
+Gradients are computed once per (text, colors, terminal width) and cached,
+and a screen is emitted in a single write, so redrawing a menu over a slow
+SSH link costs one round of output instead of one write per character.
+"""
+import os
+import shutil
+import sys
+from functools import lru_cache
+
+RESET = "\033[0m"
+# Move the cursor home, then clear the screen and the scrollback
+CLEAR_SCREEN = "\033[H\033[2J\033[3J"
+
+
+@lru_cache(maxsize=None)
+def parse_hex(color):
+    """Convert '#RRGGBB' to an (r, g, b) tuple."""
+    return tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+
+
+def interpolate_color(start_color, end_color, factor):
+    """Interpolate between two colors with a factor."""
+    start_rgb = parse_hex(start_color)
+    end_rgb = parse_hex(end_color)
+    r, g, b = (int(start_rgb[i] + (end_rgb[i] - start_rgb[i]) * factor) for i in range(3))
+    return f"\033[38;2;{r};{g};{b}m"
+
+
+@lru_cache(maxsize=64)
+def gradient_codes(start_color, end_color, steps):
+    """Return the color escape code for every column of a gradient ``steps`` wide."""
+    return tuple(interpolate_color(start_color, end_color, j / steps) for j in range(steps))
+
+
+def _colorize(line, codes):
+    parts = []
+    previous = None
+    for char, code in zip(line, codes):
+        # Neighbouring columns often share a color, only emit it when it changes
+        if code != previous:
+            parts.append(code)
+            previous = code
+        parts.append(char)
+    parts.append(RESET)
+    return "".join(parts)
+
+
+@lru_cache(maxsize=32)
+def render_gradient(text, start_color, end_color, width):
+    """Render multi-line text with a horizontal gradient, clipped to ``width`` columns."""
+    lines = text.strip().split("\n")
+    max_length = max(len(line) for line in lines)
+    codes = gradient_codes(start_color, end_color, max_length)
+    return "\n".join(_colorize(line[:width], codes) for line in lines) + "\n"
+
+
+@lru_cache(maxsize=32)
+def colorize_text(text, start_color, end_color):
+    """Colorize text with a gradient from start_color to end_color."""
+    steps = max(len(text) - 1, 1)
+    codes = tuple(interpolate_color(start_color, end_color, i / steps) for i in range(len(text)))
+    return _colorize(text, codes)
+
+
+def terminal_width():
+    return shutil.get_terminal_size().columns
+
+
+def enable_ansi():
+    """Turn on escape code handling in the Windows console; a no-op elsewhere."""
+    if os.name != "nt":
+        return True
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            return False
+        # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+        return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))
+    except Exception:
+        return False
+
+
+ANSI_ENABLED = enable_ansi()
+
+
+def clear_screen():
+    """Queue a screen clear; it goes out together with the next write."""
+    if ANSI_ENABLED:
+        sys.stdout.write(CLEAR_SCREEN)
+    else:
+        os.system("cls" if os.name == "nt" else "clear")
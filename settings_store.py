@@ -0,0 +1,135 @@
+"""The one place settings.json is read and written.
+
+main.py and the provider scripts share this module. The file always lives
+next to main.py, whatever the working directory. Reads are served from
+memory until the file's mtime or size changes, so repeated ``load_settings``
+calls in one run (or from many fleet threads) parse it once. ``save_settings``
+only writes when the content actually changed, and writes to a temporary
+file that is renamed over settings.json so readers never see half a file.
+
+It also owns ``~/.ispf``, where the scripts keep their caches and history.
+``state_path`` names a file there, ``read_json`` reads one back (a missing or
+damaged file gives the default) and ``write_json`` replaces one atomically.
+"""
+import json
+import os
+import tempfile
+import threading
+
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".ispf")
+
+# Accepted types per key; unknown keys are kept as they are
+SETTINGS_SCHEMA = {
+    "default_country": (str, type(None)),
+    "default_provider": (str, type(None)),
+    "discord_webhook": (str, type(None)),
+    "isolate_providers": (bool,),
+    "auto_detect": (bool,),
+    "device_list_screenshot": (bool,),
+    "chromedriver_path": (str, type(None)),
+}
+
+_lock = threading.Lock()
+_cache = {"stamp": None, "settings": {}}
+
+
+class SettingsError(ValueError):
+    """Raised when settings do not match the schema."""
+
+
+def validate_settings(settings):
+    """Return a list of problems, one per key whose value has the wrong type."""
+    if not isinstance(settings, dict):
+        return ["settings must be a JSON object"]
+    problems = []
+    for key, types in SETTINGS_SCHEMA.items():
+        if key in settings and not isinstance(settings[key], types):
+            expected = " or ".join("null" if kind is type(None) else kind.__name__ for kind in types)
+            problems.append(f"{key} must be {expected}, not {type(settings[key]).__name__}")
+    return problems
+
+
+def state_path(*parts):
+    """Return the path of a cache or history file under ~/.ispf."""
+    return os.path.join(STATE_DIR, *parts)
+
+
+def read_json(path, default=None):
+    """Return the parsed file, or ``default`` when it is missing or not valid JSON."""
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data, indent=4):
+    """Write ``data`` to a private temporary file and rename it over ``path``."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".ispf-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, indent=indent)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read(path):
+    with open(path, "r") as file:
+        try:
+            settings = json.load(file)
+        except json.JSONDecodeError:
+            print("Error loading settings. Using defaults.")
+            return {}
+    # Older versions stored the provider together with its alias, as a list
+    if isinstance(settings, dict) and isinstance(settings.get("default_provider"), list):
+        settings["default_provider"] = settings["default_provider"][0] if settings["default_provider"] else None
+    problems = validate_settings(settings)
+    if problems:
+        if not isinstance(settings, dict):
+            settings = {}
+        # Drop the bad values instead of failing later somewhere deep in a provider
+        for problem in problems:
+            print(f"Ignoring invalid setting: {problem}")
+        settings = {key: value for key, value in settings.items()
+                    if key not in SETTINGS_SCHEMA or isinstance(value, SETTINGS_SCHEMA[key])}
+    return settings
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Return a copy of the settings, re-reading the file only when it changed on disk."""
+    with _lock:
+        stamp = _stamp(path)
+        if stamp is None:
+            _cache.update(stamp=None, settings={})
+        elif stamp != _cache["stamp"]:
+            _cache.update(stamp=stamp, settings=_read(path))
+        return dict(_cache["settings"])
+
+
+def save_settings(settings, path=SETTINGS_FILE):
+    """Write the settings if they differ from what is on disk; return whether a write happened."""
+    problems = validate_settings(settings)
+    if problems:
+        raise SettingsError("; ".join(problems))
+    with _lock:
+        stamp = _stamp(path)
+        if stamp is not None and stamp != _cache["stamp"]:
+            _cache.update(stamp=stamp, settings=_read(path))
+        if stamp is not None and settings == _cache["settings"]:
+            return False
+        write_json(path, settings)
+        _cache.update(stamp=_stamp(path), settings=dict(settings))
+        return True
@@ -0,0 +1,179 @@
+"""Named, nested timing spans for provider runs.
+
+Wrap a step with ``with span("login"):`` or decorate it with
+``@traced("login")``. Spans opened inside another span on the same thread
+become its children, so a run reads as run -> step -> call. Nothing is
+recorded until ``enable()`` is called; while disabled ``span`` hands back one
+shared no-op object, so instrumented code costs a flag check.
+
+``export_chrome_trace`` writes the spans in the Trace Event format that
+chrome://tracing and Perfetto open, and ``summary_lines`` aggregates them by
+name for a table at the end of a run.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_spans = []
+_spans_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+class Span:
+    """One timed region; ``set`` attaches details such as the outcome."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+        self.end = 0.0
+        self.depth = 0
+        self.thread = threading.get_ident()
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end = time.perf_counter()
+        _local.stack.pop()
+        if exc_type is not None:
+            self.args["outcome"] = f"error: {exc_type.__name__}"
+        else:
+            self.args.setdefault("outcome", "ok")
+        with _spans_lock:
+            _spans.append(self)
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def enable():
+    """Start recording spans."""
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _spans_lock:
+        _spans.clear()
+
+
+def span(name, category="step", **args):
+    """Return a context manager that times the block as a span."""
+    if not _enabled:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+
+def traced(name=None, category="step"):
+    """Decorator form of ``span``. A ``False`` return value is recorded as a failed outcome."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(span_name, category, {}) as current:
+                result = function(*args, **kwargs)
+                if result is False:
+                    current.set(outcome="failed")
+                return result
+        return wrapper
+    return decorator
+
+
+def recorded_spans():
+    with _spans_lock:
+        return sorted(_spans, key=lambda recorded: recorded.start)
+
+
+def export_chrome_trace(path):
+    """Write the recorded spans as Chrome trace JSON (complete "X" events, microseconds)."""
+    pid = os.getpid()
+    events = [{
+        "name": recorded.name,
+        "cat": recorded.category,
+        "ph": "X",
+        "ts": round((recorded.start - _origin) * 1e6, 1),
+        "dur": round(recorded.duration * 1e6, 1),
+        "pid": pid,
+        "tid": recorded.thread,
+        "args": {key: str(value) for key, value in recorded.args.items()},
+    } for recorded in recorded_spans()]
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+    return len(events)
+
+
+def summary_lines():
+    """Aggregate the spans by name: calls, total, mean and max time and failures, slowest first."""
+    totals = {}
+    for recorded in recorded_spans():
+        entry = totals.setdefault(recorded.name, {"category": recorded.category, "calls": 0,
+                                                  "total": 0.0, "max": 0.0, "failed": 0})
+        entry["calls"] += 1
+        entry["total"] += recorded.duration
+        entry["max"] = max(entry["max"], recorded.duration)
+        if recorded.args.get("outcome") != "ok":
+            entry["failed"] += 1
+
+    lines = [f"{'Span':<40} {'Kind':<5} {'Calls':>5} {'Total':>9} {'Mean':>9} {'Max':>9} {'Failed':>6}"]
+    for name, entry in sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True):
+        lines.append(f"{name[:40]:<40} {entry['category'][:5]:<5} {entry['calls']:>5} "
+                     f"{entry['total'] * 1000:>7.0f}ms {entry['total'] / entry['calls'] * 1000:>7.0f}ms "
+                     f"{entry['max'] * 1000:>7.0f}ms {entry['failed']:>6}")
+    return lines
+
+
+def trace_driver(driver):
+    """Record every WebDriver command of ``driver`` as a call span.
+
+    All WebDriver methods (get, find_element, execute_script, ...) go through
+    ``driver.execute``, so wrapping that one method covers them.
+    """
+    if not _enabled or getattr(driver, "_traced", False):
+        return driver
+    execute = driver.execute
+
+    def traced_execute(command, params=None):
+        with Span(f"webdriver {command}", "call", {}):
+            return execute(command, params)
+
+    driver.execute = traced_execute
+    driver._traced = True
+    return driver